@@ -0,0 +1,189 @@
+"""
+Admission control for the recommendation pipeline
+
+The CrewAI crew and the RAG lookup are blocking calls (HTTP round-trips to
+Ollama). This module runs them on a dedicated worker pool so the event loop
+stays free for other requests, and bounds both how many run at once and how
+many may wait for a slot. Work runs in a copy of the caller's context, so
+per-request timing spans follow it onto the worker thread.
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+
+_DONE = object()
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted (queue full or wait timed out)"""
+
+    def __init__(self, reason: str, retry_after: int = 5):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency + bounded admission queue for blocking work"""
+
+    def __init__(self, max_concurrent: int = 2, max_queued: int = 8,
+                 queue_timeout: Optional[float] = 30.0):
+        """
+        Initialize admission controller
+
+        Args:
+            max_concurrent: Maximum number of pipeline runs executing at once
+            max_queued: Maximum number of requests waiting for a free slot
+            queue_timeout: Seconds a request may wait for a slot (None = forever)
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent,
+            thread_name_prefix="recommend"
+        )
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._active = 0
+        self._waiting = 0
+        self._rejected = 0
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking callable on the worker pool once a slot is free
+
+        The slot is held until the worker thread finishes. If the caller is
+        cancelled (e.g. client disconnect) the call keeps running and the
+        slot is freed once the thread returns.
+
+        Args:
+            func: Blocking callable to execute
+            *args, **kwargs: Arguments passed to func
+
+        Returns:
+            Whatever func returns
+
+        Raises:
+            Overloaded: If the admission queue is full or the wait timed out
+        """
+        await self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            worker = loop.run_in_executor(
+                self._executor, functools.partial(context.run, func, *args, **kwargs)
+            )
+        except BaseException:
+            self._release()
+            raise
+        worker.add_done_callback(lambda _: self._release())
+        # Cancelling the caller must not cancel the future: the thread would run on without its slot
+        return await asyncio.shield(worker)
+
+    async def stream(self, func: Callable[..., Iterator[Any]], *args: Any) -> AsyncIterator[Any]:
+        """
+        Run a blocking generator on the worker pool and yield its items
+
+        The slot is held until the worker thread finishes. If the consumer
+        stops early (e.g. client disconnect) the generator is abandoned at
+        its next item and the slot is freed once the thread exits.
+
+        Args:
+            func: Callable returning a blocking iterator
+            *args: Arguments passed to func
+
+        Yields:
+            Items produced by the iterator, in order
+
+        Raises:
+            Overloaded: If the admission queue is full or the wait timed out
+        """
+        await self._acquire()
+
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce() -> None:
+            try:
+                for item in func(*args):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, (item, None))
+            except BaseException as e:
+                # Includes Cancelled (rag.cancellation), which is not an Exception
+                loop.call_soon_threadsafe(items.put_nowait, (_DONE, e))
+            else:
+                loop.call_soon_threadsafe(items.put_nowait, (_DONE, None))
+
+        worker = loop.run_in_executor(self._executor, contextvars.copy_context().run, produce)
+        try:
+            while True:
+                item, error = await items.get()
+                if item is _DONE:
+                    if error is not None:
+                        raise error
+                    break
+                yield item
+        finally:
+            stop.set()
+            worker.add_done_callback(lambda _: self._release())
+
+    def check_capacity(self) -> None:
+        """
+        Fail fast if a new request would be rejected right now
+
+        Lets streaming endpoints return a 503 before response headers are sent.
+
+        Raises:
+            Overloaded: If every slot is busy and the queue is full
+        """
+        if self._slots.locked() and self._waiting >= self.max_queued:
+            self._rejected += 1
+            raise Overloaded("Recommendation queue is full")
+
+    async def _acquire(self) -> None:
+        """Take a concurrency slot, waiting in the bounded queue if needed"""
+        if not self._slots.locked():
+            await self._slots.acquire()
+            self._active += 1
+            return
+
+        if self._waiting >= self.max_queued:
+            self._rejected += 1
+            raise Overloaded("Recommendation queue is full")
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise Overloaded("Timed out waiting for a free recommendation slot")
+        finally:
+            self._waiting -= 1
+        self._active += 1
+
+    def _release(self) -> None:
+        """Give a slot back to the pool"""
+        self._active -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Current occupancy of the pool and queue"""
+        return {
+            'active': self._active,
+            'waiting': self._waiting,
+            'rejected': self._rejected,
+            'max_concurrent': self.max_concurrent,
+            'max_queued': self.max_queued,
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker pool (pending work is allowed to finish)"""
+        self._executor.shutdown(wait=False)
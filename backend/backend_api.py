@@ -1,18 +1,130 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+# Import time and time-to-ready are measured from here (see /ready)
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from pydantic import BaseModel
-from crewai import Agent, Task, Crew, Process
+from typing import AsyncIterator, Optional, Tuple
+import asyncio
 import json
+import logging
 import os
+import threading
 import warnings
-from rag.rag_engine import RAGEngine
+from rag.rag_engine import DEFAULT_RETRIEVER, RAGEngine
+from rag.file_lock import FileLock
+from rag.ollama_client import OllamaUnavailable, circuit_open, client_stats, close_clients
+from admission import AdmissionController, Overloaded
+from batch_recommend import DEFAULT_BATCH_CONCURRENCY, DEFAULT_BATCH_SIZE, BatchRecommender
+from pipeline import RecommendationPipeline
+from precompute import PrecomputedAnswers, answer_version, precompute, profile_bucket
+from response_cache import ResponseCache, make_cache_key
+from rag.catalogue import Catalogue
+from rag.cancellation import Cancelled
+from rag.query_cache import normalize_profile
+from rag.telemetry import REGISTRY, configure_logging, request_scope, span, stop_logging
+from runs import IdempotencyConflict, RunRegistry
+from validator import AnswerValidator, RejectedAnswer
 
 warnings.filterwarnings('ignore')
 
-# Configure Ollama
-os.environ["OPENAI_API_BASE"] = "http://localhost:11434/v1"
-os.environ["OPENAI_MODEL_NAME"] = "llama3.2"
-os.environ["OPENAI_API_KEY"] = "ollama"
+# Leveled logging (LOG_LEVEL env), written by a background thread
+configure_logging()
+logger = logging.getLogger("backend_api")
+
+# Configure Ollama (local server unless already set in the environment)
+os.environ.setdefault("OPENAI_API_BASE", "http://localhost:11434/v1")
+os.environ.setdefault("OPENAI_MODEL_NAME", "llama3.2")
+os.environ.setdefault("OPENAI_API_KEY", "ollama")
+
+# Concurrency limits for the blocking LLM/RAG pipeline
+MAX_CONCURRENT_RECOMMENDATIONS = int(os.getenv("MAX_CONCURRENT_RECOMMENDATIONS", "2"))
+MAX_QUEUED_RECOMMENDATIONS = int(os.getenv("MAX_QUEUED_RECOMMENDATIONS", "8"))
+RECOMMENDATION_QUEUE_TIMEOUT = float(os.getenv("RECOMMENDATION_QUEUE_TIMEOUT", "30"))
+
+# Default paths are relative to this file, not the working directory
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.getenv("DATA_PATH", os.path.join(BACKEND_DIR, "data", "indian_health_insurance_data.json"))
+RAG_STORE_DIR = os.getenv("RAG_STORE_DIR", os.path.join(BACKEND_DIR, "rag"))
+
+# /recommend/batch: profiles per request (413 above), batches running at once
+# (503 above); BATCH_SIZE and BATCH_CONCURRENCY are read by batch_recommend
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+MAX_CONCURRENT_BATCHES = int(os.getenv("MAX_CONCURRENT_BATCHES", "1"))
+
+# Full-response cache: "off", "memory" or "sqlite" (memory + disk tier)
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "off").lower()
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(BACKEND_DIR, "cache", "responses.sqlite3"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+
+# Deterministic generation (temperature 0, fixed seed); implied by the response cache
+LLM_SEED = int(os.getenv("LLM_SEED", "42"))
+LLM_DETERMINISTIC = os.getenv("LLM_DETERMINISTIC", "0") == "1" or RESPONSE_CACHE != "off"
+
+# "crew" (three sequential agents), "single" (one generation), "parallel" (one call
+# per plan section, concurrently), "template" (rendered from plan records, no LLM)
+# or "template_llm" (rendered, with an LLM-written "Why This Plan")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "crew").lower()
+
+# What to do with an answer the catalogue check flags: "log" (return it with
+# the issues), "block" (502), "repair" (replace it with the template answer)
+# or "regenerate" (one more LLM run, then repair if that fails too)
+VALIDATION_ACTION = os.getenv("VALIDATION_ACTION", "log").lower()
+
+# Deadlines in seconds (0 = none): per LLM call, and for a whole pipeline run.
+# A run that misses one answers from the plan records instead (see pipeline.py)
+LLM_STAGE_DEADLINE = float(os.getenv("LLM_STAGE_DEADLINE", "0"))
+RECOMMEND_DEADLINE = float(os.getenv("RECOMMEND_DEADLINE", "0"))
+
+# Requests with an Idempotency-Key header attach to the run already started
+# under that key, or replay its answer for IDEMPOTENCY_TTL seconds after it
+# finished. A run is cancelled when its last client disconnects: at once
+# without a key, after IDEMPOTENCY_GRACE seconds with one (so a retry can attach)
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "300"))
+IDEMPOTENCY_GRACE = float(os.getenv("IDEMPOTENCY_GRACE", "10"))
+# Seconds between client-disconnect checks while /recommend waits for its run
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Precomputed answers for chip-only form profiles (see precompute.py): "off",
+# "serve" (answer from the table `python precompute.py` wrote) or "refresh"
+# (also fill it in the background on the index writer whenever the catalogue,
+# prompts or models change)
+PRECOMPUTED_ANSWERS = os.getenv("PRECOMPUTED_ANSWERS", "off").lower()
+PRECOMPUTED_PATH = os.getenv("PRECOMPUTED_PATH", os.path.join(BACKEND_DIR, "cache", "precomputed.sqlite3"))
+# Seconds between checks for a new answer version / answers written by another process
+PRECOMPUTE_POLL_INTERVAL = float(os.getenv("PRECOMPUTE_POLL_INTERVAL", "10"))
+
+# Add a Server-Timing header (and a "timings" field on streamed "done" events)
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0") == "1"
+
+# Seconds between checks of the data file for changes (0 = off); a change
+# triggers the same incremental index sync as POST /admin/reindex
+DATA_WATCH_INTERVAL = float(os.getenv("DATA_WATCH_INTERVAL", "0"))
+
+# When set, /admin/* requests must send it in the X-Admin-Token header
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Retry-After (seconds) for requests that arrive before warm-up has finished
+WARM_UP_RETRY_AFTER = 5
+
+# Worker processes for `python backend_api.py` (each has its own admission
+# limits and memory caches; index snapshots and SQLite caches are shared)
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Index writes (sync, watcher, /admin/reindex) happen in one process per store:
+#   auto   - the first worker to take <store>/writer.lock becomes the writer
+#   reader - never write; follow snapshots written elsewhere (e.g. setup_embeddings.py --sync)
+INDEX_ROLE = os.getenv("INDEX_ROLE", "auto").lower()
+# Seconds between checks for a new index snapshot / queued reindex request (0 = off)
+INDEX_POLL_INTERVAL = float(os.getenv("INDEX_POLL_INTERVAL", "2"))
+WRITER_LOCK_PATH = os.path.join(RAG_STORE_DIR, "writer.lock")
+# A reader's /admin/reindex leaves this for the writer to pick up
+REINDEX_REQUEST_PATH = os.path.join(RAG_STORE_DIR, "reindex.requested")
 
 app = FastAPI(title="Health Insurance Recommendation API")
 
@@ -25,52 +137,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize RAG Engine
-print("🚀 Initializing RAG Engine...")
-rag_engine = RAGEngine()
-print("✅ RAG Engine ready!")
-
-# Load valid insurer names for validation
-with open('data/indian_health_insurance_data.json', 'r') as f:
-    insurance_data = json.load(f)
-
-VALID_INSURERS = {
-    "Star Health and Allied Insurance Co. Ltd.",
-    "HDFC ERGO General Insurance Company Ltd.",
-    "ICICI Lombard General Insurance Co. Ltd.",
-    "Niva Bupa Health Insurance Co. Ltd.",
-    "Care Health Insurance Ltd.",
-    "Aditya Birla Health Insurance Co. Ltd."
+# The RAG engine, pipeline and plan catalogue are loaded by warm_up() on a
+# background thread after startup, so importing this module stays fast
+rag_engine: Optional[RAGEngine] = None
+pipeline: Optional[RecommendationPipeline] = None
+catalogue: Optional[Catalogue] = None
+validator: Optional[AnswerValidator] = None
+# Answers depend on the data file contents; cached answers are keyed on this
+DATA_VERSION: Optional[str] = None
+
+# Held for the life of the process by the elected index writer
+writer_lock = FileLock(WRITER_LOCK_PATH)
+
+# Readiness as reported by /ready; checks are "pending", "ok", "not used" or an error
+startup_state = {
+    'ready': False,
+    'import_seconds': None,
+    'ready_seconds': None,
+    'attempts': 0,
+    'checks': {'index': 'pending', 'embedding_model': 'pending', 'llm': 'pending'}
 }
 
-print(f"✅ Loaded {len(VALID_INSURERS)} valid insurers:")
-for insurer in VALID_INSURERS:
-    print(f"   - {insurer}")
-
-# Create CrewAI agents
-user_profiler = Agent(
-    role='Health Insurance Needs Analyst',
-    goal='Understand user health insurance requirements',
-    backstory='Expert at analyzing customer needs for health insurance',
-    verbose=False,
-    allow_delegation=False
+admission = AdmissionController(
+    max_concurrent=MAX_CONCURRENT_RECOMMENDATIONS,
+    max_queued=MAX_QUEUED_RECOMMENDATIONS,
+    queue_timeout=RECOMMENDATION_QUEUE_TIMEOUT
 )
 
-recommendation_agent = Agent(
-    role='Insurance Plan Matcher',
-    goal='Match users with best insurance plans from the provided data',
-    backstory='Specialist in comparing insurance plans and finding perfect matches. ONLY uses the exact data provided, never makes up information.',
-    verbose=False,
-    allow_delegation=False
-)
+response_cache = None
+if RESPONSE_CACHE != "off":
+    response_cache = ResponseCache(
+        maxsize=RESPONSE_CACHE_SIZE,
+        ttl=RESPONSE_CACHE_TTL,
+        db_path=RESPONSE_CACHE_PATH if RESPONSE_CACHE == "sqlite" else None
+    )
+    logger.info(f"✅ Response cache enabled ({RESPONSE_CACHE})")
 
-comparison_agent = Agent(
-    role='Plan Comparison Specialist',
-    goal='Create clear comparison tables using exact data from recommendations',
-    backstory='Expert at creating accurate comparison tables. Copies data exactly as provided, never invents information.',
-    verbose=False,
-    allow_delegation=False
-)
+runs = RunRegistry(ttl=IDEMPOTENCY_TTL, grace=IDEMPOTENCY_GRACE)
+
+precomputed = PrecomputedAnswers(PRECOMPUTED_PATH) if PRECOMPUTED_ANSWERS != "off" else None
+# Set on shutdown; a background precompute run stops after its current answer
+_precompute_stop = threading.Event()
+
+PRECOMPUTED_LOOKUPS = REGISTRY.counter(
+    "precomputed_lookups_total", "Precomputed answer lookups by outcome (hit, miss, unbucketed)", ("outcome",))
+ANSWER_VALIDATION = REGISTRY.counter(
+    "answer_validation_total", "Checked answers by outcome (ok, flagged, blocked, repaired, regenerated)", ("outcome",))
+
+# Scrape-time gauges for the admission queue
+REGISTRY.gauge("recommend_pipeline_active", "Pipeline runs executing", lambda: admission.stats()['active'])
+REGISTRY.gauge("recommend_pipeline_waiting", "Requests waiting for a pipeline slot", lambda: admission.stats()['waiting'])
+REGISTRY.gauge("recommend_pipeline_rejected", "Requests rejected since startup (503)", lambda: admission.stats()['rejected'])
+REGISTRY.gauge("backend_ready", "1 once the index and models are warm", lambda: float(startup_state['ready']))
+REGISTRY.gauge("backend_import_seconds", "Time to import the API module", lambda: startup_state['import_seconds'] or 0)
+REGISTRY.gauge("backend_time_to_ready_seconds", "Time from module import until ready", lambda: startup_state['ready_seconds'] or 0)
+REGISTRY.gauge("precomputed_answers", "Precomputed answers being served", lambda: len(precomputed) if precomputed else 0)
+REGISTRY.gauge("ollama_circuit_open", "1 while calls to Ollama fail fast", circuit_open)
 
 # Request/Response models
 class RecommendationRequest(BaseModel):
@@ -86,162 +208,607 @@ class RecommendationResponse(BaseModel):
 # Endpoints
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "ollama": "connected"}
+    """Liveness: the process is up (see /ready for whether it can serve)"""
+    return {
+        "status": "healthy",
+        "ready": startup_state['ready'],
+        "ollama": startup_state['checks']['embedding_model'],
+        "worker": {"pid": os.getpid(), "index_writer": writer_lock.held},
+        "ollama_client": client_stats(),
+        "pipeline": admission.stats(),
+        "rag_cache": rag_engine.cache_stats() if rag_engine else None,
+        "response_cache": response_cache.stats() if response_cache else None,
+        "runs": runs.stats(),
+        "precomputed": precomputed.stats() if precomputed else None
+    }
+
+@app.get("/ready")
+async def readiness(response: Response):
+    """Readiness: 200 once the index is loaded and the models answer, 503 until then"""
+    if not startup_state['ready']:
+        response.status_code = 503
+    return {**startup_state, 'checks': dict(startup_state['checks'])}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text format: request/stage latency histograms, token counters, queue gauges"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/recommend", response_model=RecommendationResponse)
-async def get_recommendations(request: RecommendationRequest):
+async def get_recommendations(request: RecommendationRequest, response: Response, http_request: Request,
+                              idempotency_key: Optional[str] = Header(default=None)):
+    require_ready()
+    with request_scope("recommend") as timings:
+        try:
+            answer = precomputed_answer(request)
+            if answer is not None:
+                timings.status = 'precomputed'
+                response.headers["X-Precomputed"] = "1"
+                return RecommendationResponse(recommendations=answer)
+
+            if idempotency_key:
+                key = ('recommend', idempotency_key)
+            elif response_cache is not None:
+                # Identical concurrent requests share one crew run
+                key = ('cache', response_cache_key(request))
+            else:
+                key = None
+            run, attached = runs.start(key, normalize_profile(_user_profile(request)), lambda: answer_events(request))
+            if attached:
+                response.headers["Idempotent-Replayed"] = "true"
+
+            result_text = await wait_for_answer(run, http_request)
+            if result_text is None:
+                timings.status = 'cancelled'
+                raise HTTPException(status_code=499, detail="Client closed request")
+            if TIMING_HEADER:
+                response.headers["Server-Timing"] = timings.server_timing()
+            return RecommendationResponse(recommendations=result_text)
+        except HTTPException:
+            raise
+        except IdempotencyConflict as e:
+            timings.status = 'conflict'
+            raise HTTPException(status_code=422, detail=str(e))
+        except Cancelled as e:
+            # Another client's run under the same key, cancelled after they left
+            timings.status = 'cancelled'
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except RejectedAnswer as e:
+            timings.status = 'rejected'
+            raise HTTPException(status_code=502, detail={'error': str(e), 'issues': e.report['issues']})
+        except Overloaded as e:
+            timings.status = 'overloaded'
+            raise HTTPException(
+                status_code=503,
+                detail=e.reason,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except OllamaUnavailable as e:
+            timings.status = 'unavailable'
+            logger.error(f"❌ Ollama unavailable: {str(e)}")
+            raise HTTPException(
+                status_code=503,
+                detail="Model server unavailable",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except Exception as e:
+            timings.status = 'error'
+            logger.exception(f"❌ Error: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/recommend/stream")
+async def stream_recommendations(request: RecommendationRequest, idempotency_key: Optional[str] = Header(default=None)):
+    """Server-Sent Events: tokens, profile summary, plan sections, comparison table"""
+    require_ready()
+    answer = precomputed_answer(request)
+    if answer is not None:
+        # The whole answer in one "done" event; nothing to stream
+        with request_scope("recommend_stream") as timings:
+            timings.status = 'precomputed'
+            event = _sse('done', {'recommendations': answer, 'precomputed': True})
+        return StreamingResponse(
+            iter([event]),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Precomputed": "1"}
+        )
+
     try:
-        # Create user profile task
-        profile_task = Task(
-            description=f"""Analyze this user profile:
-            - Age: {request.age} years old
-            - Pre-existing Conditions: {request.ped}
-            - Annual Budget: ₹{request.budget}
-            - Specific Needs: {request.needs}
-            - Preferences: {request.preferences}
-            
-            **CRITICAL: Do NOT make up any information. Only use the data provided.**
-            
-            Summarize their top 3 requirements in 1-2 lines.""",
-            agent=user_profiler,
-            expected_output="Brief user requirements summary"
+        run, attached = runs.start(
+            ('stream', idempotency_key) if idempotency_key else None,
+            normalize_profile(_user_profile(request)),
+            lambda: stream_events(request),
+            admit=admission.check_capacity
         )
-        
-        # Use RAG to get relevant plans
-        user_profile = {
-            'age': request.age,
-            'ped': request.ped,
-            'budget': request.budget,
-            'needs': request.needs,
-            'preferences': request.preferences
-        }
-        
-        # Get ONLY top 3 most relevant plans
-        relevant_context = rag_engine.get_relevant_context(user_profile, top_k=3)
-        
-        # Log what RAG is sending
-        print("\n" + "="*80)
-        print("RAG CONTEXT BEING SENT TO LLM:")
-        print("="*80)
-        print(relevant_context[:500] + "...")
-        print("="*80 + "\n")
-        
-        recommend_task = Task(
-            description=f"""⚠️ STRICT RULES - YOU MUST FOLLOW EXACTLY:
-
-{relevant_context}
-
-**THE 3 PLANS ABOVE ARE THE ONLY PLANS THAT EXIST. DO NOT USE ANY OTHER PLAN NAMES!**
-
-FORBIDDEN COMPANIES (DO NOT MENTION):
-- Future Generali
-- Bajaj Allianz  
-- Reliance
-- Tata AIG
-- Max Life
-- Any company NOT in the data above
-
-REQUIRED ACTIONS:
-1. **USE ONLY THE 3 PLANS ABOVE** - No other plan names exist!
-2. **COPY PLAN NAMES EXACTLY** - Character-by-character from data above
-3. **COPY INSURER NAMES EXACTLY** - From the data above only
-4. **COPY ALL VALUES EXACTLY** - Sum insured, CSR, room rent from data above
-5. **IF NOT IN DATA ABOVE, DON'T SAY IT**
-
-For each of THE 3 PLANS PROVIDED ABOVE, write:
-
-## [EXACT PLAN NAME FROM DATA ABOVE]
-**Insurer:** [EXACT INSURER NAME FROM DATA ABOVE]
-**Premium:** ₹10,000 - ₹25,000 per year (typical range)
-**Sum Insured:** [COPY EXACT TEXT FROM DATA ABOVE]
-
-**Why This Plan:**
-- [Match to user needs]
-- [Coverage highlights]
-- [Value proposition]
-
-**Key Features:**
-- Room rent: [EXACT from data above]
-- Maternity: [EXACT from data above or "Not specified"]
-- CSR: [EXACT from data above]
-- NCB: [EXACT from data above]""",
-            agent=recommendation_agent,
-            expected_output="Top 3 plans using ONLY the provided data",
-            context=[profile_task]
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    async def events():
+        with request_scope("recommend_stream") as timings:
+            try:
+                # A retry that attached replays the events sent so far, then follows live
+                async for event, payload in run.follow():
+                    if event == 'done' and TIMING_HEADER:
+                        payload = {**payload, 'timings': timings.as_list()}
+                    yield _sse(event, payload)
+            except Overloaded as e:
+                timings.status = 'overloaded'
+                yield _sse('error', {'detail': e.reason, 'retry_after': e.retry_after})
+            except OllamaUnavailable as e:
+                timings.status = 'unavailable'
+                logger.error(f"❌ Ollama unavailable: {str(e)}")
+                yield _sse('error', {'detail': "Model server unavailable", 'retry_after': e.retry_after})
+            except RejectedAnswer as e:
+                timings.status = 'rejected'
+                yield _sse('error', {'detail': str(e), 'issues': e.report['issues']})
+            except Cancelled as e:
+                timings.status = 'cancelled'
+                yield _sse('error', {'detail': str(e), 'retry_after': 1})
+            except Exception as e:
+                timings.status = 'error'
+                logger.exception(f"❌ Error: {str(e)}")
+                yield _sse('error', {'detail': str(e)})
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if attached:
+        headers["Idempotent-Replayed"] = "true"
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@app.post("/admin/reindex")
+async def reindex(response: Response, x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Sync the vector index with the data file; only new/changed plans are re-embedded
+
+    On a worker that is not the index writer the sync is queued for the
+    writer (202); every worker switches to the new snapshot once it lands.
+    """
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    require_ready()
+    if not writer_lock.held:
+        with open(REINDEX_REQUEST_PATH, 'w') as f:
+            f.write(str(os.getpid()))
+        response.status_code = 202
+        return {'queued': True, 'writer_pid': writer_lock.owner()}
+    try:
+        return await asyncio.to_thread(sync_catalogue)
+    except Exception as e:
+        logger.exception(f"❌ Reindex failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+_running_batches = 0
+
+@app.post("/recommend/batch")
+async def batch_recommendations(request: Request, concurrency: Optional[int] = None):
+    """
+    Bulk scoring: JSONL profiles in, JSONL results out (application/x-ndjson)
+
+    Retrieval is batched per chunk, duplicate profiles run once and results
+    stream back in input order as they finish; a bad line or failed item
+    becomes {"index", "id", "error"} without stopping the batch. Runs on its
+    own bounded thread pool, not the /recommend admission queue;
+    ?concurrency= lowers (never raises) its size below BATCH_CONCURRENCY.
+    """
+    global _running_batches
+    require_ready()
+    if _running_batches >= MAX_CONCURRENT_BATCHES:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many batches running",
+            headers={"Retry-After": str(WARM_UP_RETRY_AFTER)}
         )
-        
-        compare_task = Task(
-            description="""Create comparison table using ONLY the 3 plans from recommendations above.
-
-⛔ FORBIDDEN:
-- Adding companies not in recommendations
-- Making up plan names
-- Empty columns
-
-REQUIRED:
-- Use EXACT plan names as column headers
-- Copy all values from recommendations
-- All 3 columns must have data
-
-| Feature | [Plan 1 EXACT NAME] | [Plan 2 EXACT NAME] | [Plan 3 EXACT NAME] |
-|---------|---------------------|---------------------|---------------------|
-| Insurer | [EXACT name] | [EXACT name] | [EXACT name] |
-| Annual Premium | ₹XX,000 - ₹XX,000 | ₹XX,000 - ₹XX,000 | ₹XX,000 - ₹XX,000 |
-| Sum Insured | [EXACT from data] | [EXACT from data] | [EXACT from data] |
-| Room Rent Limit | [EXACT from data] | [EXACT from data] | [EXACT from data] |
-| Maternity | [EXACT from data] | [EXACT from data] | [EXACT from data] |
-| NCB | [EXACT from data] | [EXACT from data] | [EXACT from data] |
-| CSR | [EXACT from data] | [EXACT from data] | [EXACT from data] |
-
-Then add:
-## Our Recommendation
-We recommend **[Plan Name]** because [reasons based on user needs].""",
-            agent=comparison_agent,
-            expected_output="Comparison table with exact data",
-            context=[profile_task, recommend_task]
+    # Take the slot before the first await, so concurrent requests see it
+    _running_batches += 1
+    released = False
+
+    def release() -> None:
+        global _running_batches
+        nonlocal released
+        if not released:
+            released = True
+            _running_batches -= 1
+
+    try:
+        lines = (await request.body()).decode('utf-8').splitlines()
+        items = sum(1 for line in lines if line.strip())
+        if items > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} profiles per batch")
+
+        batch = BatchRecommender(
+            pipeline,
+            batch_size=DEFAULT_BATCH_SIZE,
+            concurrency=min(concurrency or DEFAULT_BATCH_CONCURRENCY, DEFAULT_BATCH_CONCURRENCY),
+            cache=response_cache,
+            cache_key=lambda profile: response_cache_key(RecommendationRequest(**profile)),
+            validate=checked_answer
         )
-        
-        # Create crew and execute
-        crew = Crew(
-            agents=[user_profiler, recommendation_agent, comparison_agent],
-            tasks=[profile_task, recommend_task, compare_task],
-            process=Process.sequential,
-            verbose=False
+    except BaseException:
+        release()
+        raise
+
+    async def results():
+        run = batch.run(lines)
+        with request_scope("recommend_batch") as timings:
+            try:
+                async for result in iterate_in_threadpool(run):
+                    yield json.dumps(result) + "\n"
+            except Exception as e:
+                timings.status = 'error'
+                logger.exception(f"❌ Batch failed: {str(e)}")
+                yield json.dumps({'error': str(e)}) + "\n"
+            finally:
+                # Client gone or done: queued runs are cancelled
+                await asyncio.to_thread(run.close)
+                release()
+        logger.info(f"✅ Batch of {items} profiles finished")
+
+    try:
+        return StreamingResponse(results(), media_type="application/x-ndjson")
+    except BaseException:
+        release()
+        raise
+
+_warm_up_task: Optional[asyncio.Task] = None
+_data_watcher: Optional[asyncio.Task] = None
+_index_follower: Optional[asyncio.Task] = None
+_precompute_follower: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global _warm_up_task, _data_watcher, _index_follower, _precompute_follower
+    if INDEX_ROLE != "reader" and writer_lock.acquire(blocking=False):
+        logger.info(f"✍️  Worker {os.getpid()} is the index writer")
+    else:
+        logger.info(f"📖 Worker {os.getpid()} is an index reader (writer: {writer_lock.owner() or 'external'})")
+
+    # The server accepts connections (and answers /health, /ready) while this runs
+    _warm_up_task = asyncio.create_task(warm_up_until_ready())
+    if DATA_WATCH_INTERVAL > 0 and writer_lock.held:
+        _data_watcher = asyncio.create_task(watch_data_file())
+        logger.info(f"👀 Watching {DATA_PATH} every {DATA_WATCH_INTERVAL:g}s")
+    if INDEX_POLL_INTERVAL > 0:
+        _index_follower = asyncio.create_task(follow_index())
+    if precomputed is not None and PRECOMPUTE_POLL_INTERVAL > 0:
+        _precompute_follower = asyncio.create_task(follow_precomputed())
+
+@app.on_event("shutdown")
+def shutdown_pipeline():
+    for task in (_warm_up_task, _data_watcher, _index_follower, _precompute_follower):
+        if task is not None:
+            task.cancel()
+    _precompute_stop.set()
+    admission.shutdown()
+    close_clients()
+    writer_lock.release()
+    stop_logging()
+
+def warm_up() -> bool:
+    """
+    Build the RAG engine and pipeline, then check the index and warm both models
+
+    Blocking. Objects built by an earlier attempt are kept, so it can be
+    retried until Ollama is up and the index exists.
+
+    Returns:
+        True when every check passed
+    """
+    global rag_engine, pipeline
+    checks = startup_state['checks']
+
+    if rag_engine is None:
+        logger.info("🚀 Initializing RAG Engine...")
+        engine = RAGEngine(data_path=DATA_PATH, store_dir=RAG_STORE_DIR)
+        load_catalogue(engine.catalogue)
+        rag_engine = engine
+
+    if pipeline is None:
+        # Crews are pre-built once (crew mode); one per concurrent pipeline run
+        pipeline = RecommendationPipeline(
+            rag_engine,
+            pool_size=MAX_CONCURRENT_RECOMMENDATIONS,
+            deterministic=LLM_DETERMINISTIC,
+            seed=LLM_SEED,
+            mode=PIPELINE_MODE,
+            stage_deadline=LLM_STAGE_DEADLINE or None,
+            run_deadline=RECOMMEND_DEADLINE or None
         )
-        
-        result = crew.kickoff()
-        result_text = str(result)
-        
-        # Validate response for hallucinations
-        print("\n" + "="*80)
-        print("VALIDATING AI RESPONSE...")
-        print("="*80)
-        
-        # Check for forbidden companies
-        forbidden_companies = ["future generali", "bajaj allianz", "reliance", "tata aig", "max life", "icici direct"]
-        result_lower = result_text.lower()
-        
-        hallucinations_found = []
-        for forbidden in forbidden_companies:
-            if forbidden in result_lower:
-                hallucinations_found.append(f"❌ Found '{forbidden}'")
-        
-        if hallucinations_found:
-            print("\n🚨 HALLUCINATIONS DETECTED:")
-            for h in hallucinations_found:
-                print(f"  {h}")
-            print("\n⚠️ WARNING: Response contains hallucinated companies not in database!")
-            print("="*80 + "\n")
-        else:
-            print("✅ No hallucinations detected")
-            print("="*80 + "\n")
-        
-        return RecommendationResponse(recommendations=result_text)
-        
+
+    retriever = rag_engine.retriever
+    if retriever.is_ready() or retriever.reload():
+        checks['index'] = 'ok'
+    else:
+        checks['index'] = 'missing: run rag/setup_embeddings.py'
+
+    # Loads the embedding model into Ollama's memory
+    try:
+        rag_engine.generate_embedding("warm-up")
+        checks['embedding_model'] = 'ok'
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        checks['embedding_model'] = f"error: {e}"
+
+    if pipeline.uses_llm:
+        try:
+            pipeline.warm_up()
+            checks['llm'] = 'ok'
+        except Exception as e:
+            checks['llm'] = f"error: {e}"
+    else:
+        checks['llm'] = 'not used'
+
+    return all(status in ('ok', 'not used') for status in checks.values())
+
+async def warm_up_until_ready():
+    """Run warm_up() off the event loop, retrying with backoff, then mark the service ready"""
+    delay = 1.0
+    while True:
+        startup_state['attempts'] += 1
+        try:
+            if await asyncio.to_thread(warm_up):
+                break
+        except Exception as e:
+            logger.exception(f"❌ Warm-up failed: {str(e)}")
+        logger.warning(f"⏳ Not ready ({startup_state['checks']}), retrying in {delay:g}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30.0)
+
+    startup_state['ready_seconds'] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+    startup_state['ready'] = True
+    logger.info(f"✅ Ready in {startup_state['ready_seconds']:.2f}s "
+                f"(import {startup_state['import_seconds']:.2f}s)")
+
+def require_ready() -> None:
+    """503 until warm-up has finished (load balancers should gate on /ready)"""
+    if not startup_state['ready']:
+        raise HTTPException(
+            status_code=503,
+            detail="Service is warming up",
+            headers={"Retry-After": str(WARM_UP_RETRY_AFTER)}
+        )
+
+def load_catalogue(current: Catalogue) -> None:
+    """Switch rendering and the cache-key version to a compiled catalogue"""
+    global DATA_VERSION, catalogue, validator
+    catalogue = current
+    validator = AnswerValidator(current)
+    DATA_VERSION = current.version
+    if pipeline is not None:
+        pipeline.reload_catalogue()
+    if precomputed is not None:
+        # Answers of the old catalogue; follow_precomputed() loads the new version
+        precomputed.clear()
+
+def sync_catalogue() -> dict:
+    """Apply data file changes: incremental index sync, then refresh rendering and cache keys"""
+    # Opened first: an edit landing mid-sync shows up as a new version next time
+    current = rag_engine.catalogue
+    stats = rag_engine.sync_vector_database()
+    load_catalogue(current)
+    return {**stats, 'data_version': current.version}
+
+def follow_catalogue() -> None:
+    """Reader side of a sync: switch to the writer's new index snapshot and data file"""
+    current = rag_engine.catalogue
+    rag_engine.reload_index()
+    load_catalogue(current)
+    logger.info(f"🔁 Switched to index snapshot {getattr(rag_engine.retriever, 'snapshot', None)}")
+
+async def follow_index():
+    """
+    Keep this worker on the current index: the writer runs queued reindex
+    requests, every worker reloads when another process publishes a snapshot
+    """
+    while True:
+        await asyncio.sleep(INDEX_POLL_INTERVAL)
+        if not startup_state['ready']:
+            continue
+        try:
+            if writer_lock.held and os.path.exists(REINDEX_REQUEST_PATH):
+                os.remove(REINDEX_REQUEST_PATH)
+                stats = await asyncio.to_thread(sync_catalogue)
+                logger.info(f"✅ Queued reindex done: {stats}")
+            elif rag_engine.retriever.is_stale():
+                await asyncio.to_thread(follow_catalogue)
+        except Exception as e:
+            logger.error(f"❌ Index refresh failed: {str(e)}")
+
+async def watch_data_file():
+    """Poll the data file (mtime/size, then the catalogue's content hash) and sync when it changes"""
+    last_seen = None
+    while True:
+        await asyncio.sleep(DATA_WATCH_INTERVAL)
+        if not startup_state['ready']:
+            continue
+        try:
+            stat = os.stat(DATA_PATH)
+            if (stat.st_mtime_ns, stat.st_size) == last_seen:
+                continue
+            last_seen = (stat.st_mtime_ns, stat.st_size)
+            current = await asyncio.to_thread(lambda: rag_engine.catalogue)
+            if current.version != DATA_VERSION:
+                logger.info("📂 Data file changed, syncing vector index...")
+                stats = await asyncio.to_thread(sync_catalogue)
+                logger.info(f"✅ Data sync done: {stats}")
+        except Exception as e:
+            # e.g. a half-written file; retry on the next tick
+            last_seen = None
+            logger.error(f"❌ Data sync failed: {str(e)}")
+
+def current_answer_version() -> str:
+    """Version of the answers this worker produces now (see precompute.answer_version)"""
+    return answer_version(pipeline.answer_versions(DATA_VERSION))
+
+def refresh_precomputed(version: str) -> dict:
+    """Answer the buckets missing for a version, then drop older versions; stops early if the version moves on"""
+    stats = precompute(
+        pipeline,
+        precomputed,
+        version,
+        validate=checked_answer,
+        should_stop=lambda: _precompute_stop.is_set() or current_answer_version() != version
+    )
+    if not stats['stopped'] and stats['missing']:
+        stats['pruned'] = precomputed.prune(version)
+    return stats
+
+async def follow_precomputed():
+    """
+    Serve the precomputed answers of the current version: reload when the
+    version changes or another process adds answers; in "refresh" mode the
+    index writer also fills in the missing buckets
+    """
+    refreshed = None
+    while True:
+        await asyncio.sleep(PRECOMPUTE_POLL_INTERVAL)
+        if not startup_state['ready']:
+            continue
+        try:
+            version = current_answer_version()
+            if await asyncio.to_thread(precomputed.load, version):
+                logger.info(f"📦 Serving {len(precomputed)} precomputed answers (version {version})")
+            # Each version is filled in once; flagged or failed buckets stay live
+            if PRECOMPUTED_ANSWERS == "refresh" and writer_lock.held and refreshed != version:
+                logger.info(f"🔄 Precomputing answers for version {version}...")
+                stats = await asyncio.to_thread(refresh_precomputed, version)
+                if not stats['stopped']:
+                    refreshed = version
+                logger.info(f"✅ Precompute done: {stats}")
+        except Exception as e:
+            logger.error(f"❌ Precompute refresh failed: {str(e)}")
+
+def precomputed_answer(request: RecommendationRequest) -> Optional[str]:
+    """Precomputed answer for a chip-only profile of the current version, or None"""
+    if precomputed is None:
+        return None
+    bucket = profile_bucket(_user_profile(request))
+    answer = precomputed.get(bucket) if bucket is not None else None
+    PRECOMPUTED_LOOKUPS.inc(outcome='unbucketed' if bucket is None else 'hit' if answer is not None else 'miss')
+    return answer
+
+def _user_profile(request: RecommendationRequest) -> dict:
+    return {
+        'age': request.age,
+        'ped': request.ped,
+        'budget': request.budget,
+        'needs': request.needs,
+        'preferences': request.preferences
+    }
+
+def response_cache_key(request: RecommendationRequest) -> str:
+    return make_cache_key(normalize_profile(_user_profile(request)), **pipeline.answer_versions(DATA_VERSION))
+
+async def answer_events(request: RecommendationRequest) -> AsyncIterator[Tuple[str, dict]]:
+    """Run behind /recommend: one "done" event with the checked answer"""
+    # Crew + RAG calls block on Ollama, so run them off the event loop
+    if response_cache is None:
+        result_text = await admission.run(run_recommendation_pipeline, request)
+    else:
+        result_text = await response_cache.get_or_compute(
+            response_cache_key(request),
+            lambda: admission.run(run_recommendation_pipeline, request)
+        )
+    yield 'done', {'recommendations': result_text}
+
+async def stream_events(request: RecommendationRequest) -> AsyncIterator[Tuple[str, dict]]:
+    """Run behind /recommend/stream: the pipeline's events, with the answer checked on "done" """
+    profile = _user_profile(request)
+    async for event, payload in admission.stream(pipeline.stream, profile):
+        if event == 'done':
+            text, report = await asyncio.to_thread(checked_answer, profile, payload['recommendations'])
+            if text != payload['recommendations'] or payload.get('fallback'):
+                # The streamed tokens were flagged or cut off by a deadline; the client swaps in this answer
+                payload['recommendations'] = text
+                payload['replaced'] = True
+            payload['validation'] = report
+        yield event, payload
+
+async def wait_for_answer(run, http_request: Request) -> Optional[str]:
+    """
+    The run's answer, or None if the client disconnected first (the run is
+    then detached, and cancelled once no client is left)
+    """
+    async def answer() -> str:
+        async for _, payload in run.follow():
+            pass
+        return payload['recommendations']
+
+    follower = asyncio.ensure_future(answer())
+    try:
+        while True:
+            done, _ = await asyncio.wait({follower}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return follower.result()
+            if await http_request.is_disconnected():
+                return None
+    finally:
+        follower.cancel()
+
+def run_recommendation_pipeline(request: RecommendationRequest) -> str:
+    """Blocking RAG + CrewAI pipeline; executed on the admission worker pool"""
+    # Get ONLY top 3 most relevant plans and run the pooled crew
+    profile = _user_profile(request)
+    result_text = pipeline.run(profile, top_k=3)
+    return checked_answer(profile, result_text)[0]
+
+def validate_response(profile: dict, result_text: str) -> dict:
+    """Check every plan/insurer name and quoted number against the retrieved plans; logs any issues"""
+    with span("validation"):
+        # Served from the engine's search cache: the pipeline just ran this retrieval
+        report = validator.check(result_text, pipeline.plan_ids(profile, 3), profile)
+
+    if report['issues']:
+        logger.warning("🚨 HALLUCINATIONS DETECTED: " + "; ".join(issue['detail'] for issue in report['issues']))
+    else:
+        logger.debug(f"✅ Answer validated ({report['numbers_checked']} numbers, {report['seconds'] * 1000:.2f} ms)")
+    return report
+
+def checked_answer(profile: dict, result_text: str) -> tuple:
+    """
+    Validate an answer and apply VALIDATION_ACTION to a flagged one
+
+    Returns:
+        (answer to return, validation report with the action taken)
+
+    Raises:
+        RejectedAnswer: flagged and VALIDATION_ACTION is "block"
+    """
+    report = validate_response(profile, result_text)
+    if report['ok'] or VALIDATION_ACTION == "log":
+        ANSWER_VALIDATION.inc(outcome='ok' if report['ok'] else 'flagged')
+        return result_text, report
+    if VALIDATION_ACTION == "block":
+        ANSWER_VALIDATION.inc(outcome='blocked')
+        raise RejectedAnswer(report)
+
+    # A deterministic run would produce the same answer again
+    if VALIDATION_ACTION == "regenerate" and pipeline.uses_llm and not pipeline.deterministic:
+        retry_text = pipeline.run(profile, top_k=3)
+        retry = validate_response(profile, retry_text)
+        if retry['ok']:
+            ANSWER_VALIDATION.inc(outcome='regenerated')
+            return retry_text, {**retry, 'action': 'regenerated', 'rejected': report['issues']}
+
+    ANSWER_VALIDATION.inc(outcome='repaired')
+    repaired_text = pipeline.render_answer(profile, top_k=3)
+    return repaired_text, {**validate_response(profile, repaired_text), 'action': 'repaired', 'rejected': report['issues']}
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+startup_state['import_seconds'] = round(time.perf_counter() - _IMPORT_STARTED, 3)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WORKERS > 1:
+        # Workers share the index through mmap'd snapshots; ChromaDB's
+        # persistent client must not be opened by several processes
+        if DEFAULT_RETRIEVER != "numpy":
+            raise SystemExit("❌ WORKERS > 1 needs RAG_RETRIEVER=numpy")
+        uvicorn.run("backend_api:app", host="0.0.0.0", port=8000, workers=WORKERS, app_dir=BACKEND_DIR)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
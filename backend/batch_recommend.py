@@ -0,0 +1,259 @@
+"""
+Bulk recommendations over a JSONL stream of profiles
+
+Scores many profiles far faster than calling /recommend once per profile:
+profiles are read in chunks, identical profiles (after normalisation) run
+once, each chunk's retrieval is done in one batch (one embedding call for
+the query cache misses, one vectorised index query), and the generation
+stage runs on a bounded thread pool while the next chunk is retrieved.
+Every LLM call runs at bulk priority (rag.scheduler), so a batch only uses
+the model slots interactive requests leave free.
+Results are emitted in input order, one JSON object per line; a bad line
+or a failed item becomes an error object and does not stop the batch.
+
+Input lines:  {"id": "opt-1", "age": "32", "ped": "None", "budget": "15000",
+               "needs": "Maternity", "preferences": "No room rent limit"}
+Output lines: {"index": 0, "id": "opt-1", "recommendations": "...", "validation": {"ok": true, ...}}
+              {"index": 1, "id": null, "error": "..."}
+
+Usage:
+    python batch_recommend.py profiles.jsonl > results.jsonl
+    cat profiles.jsonl | python batch_recommend.py --concurrency 8 --output results.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from rag.query_cache import PROFILE_FIELDS, normalize_profile
+from rag.scheduler import BULK, llm_priority
+from rag.telemetry import REGISTRY, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Profiles retrieved together (one embedding call + one index query per chunk)
+DEFAULT_BATCH_SIZE = int(os.getenv("BATCH_SIZE", "64"))
+# Generation runs in flight at once
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+BATCH_ITEMS = REGISTRY.counter(
+    "recommend_batch_items_total", "Batch items by outcome (ok, duplicate, cached, error)", ("outcome",))
+
+
+class BatchRecommender:
+    """Runs a RecommendationPipeline over many profiles with batched retrieval"""
+
+    def __init__(self, pipeline, batch_size: int = DEFAULT_BATCH_SIZE,
+                 concurrency: int = DEFAULT_BATCH_CONCURRENCY, top_k: int = 3,
+                 cache=None, cache_key: Optional[Callable[[Dict[str, str]], str]] = None,
+                 validate: Optional[Callable[[Dict[str, str], str], Tuple[str, Dict[str, Any]]]] = None):
+        """
+        Initialize batch runner
+
+        Args:
+            pipeline: RecommendationPipeline used for every item
+            batch_size: Profiles read and retrieved per chunk
+            concurrency: Pipeline runs executing at once
+            top_k: Number of plans per profile
+            cache: Optional response cache with get(key)/put(key, value)
+            cache_key: Cache key for a profile (required with cache)
+            validate: Optional check of (profile, answer) returning the answer to keep
+                and its validation report; may raise to fail the item
+        """
+        if cache is not None and cache_key is None:
+            raise ValueError("cache_key is required when a cache is given")
+
+        self.pipeline = pipeline
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.top_k = top_k
+        self.cache = cache
+        self.cache_key = cache_key
+        self.validate = validate
+
+    def run(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        Score every profile in a JSONL stream
+
+        Lazy: input is consumed chunk by chunk, and closing the iterator
+        cancels the runs that have not started yet.
+
+        Args:
+            lines: JSON objects, one per line (blank lines are skipped)
+
+        Returns:
+            Result or error objects, in input order
+        """
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch")
+        pending: Deque[Tuple[Dict[str, Any], Future]] = deque()
+        try:
+            for chunk in _chunks(_parse(lines), self.batch_size):
+                pending.extend(self._submit(chunk, executor))
+                # Keep about one chunk queued behind the running ones
+                while len(pending) > self.batch_size + self.concurrency:
+                    yield self._result(*pending.popleft())
+            while pending:
+                yield self._result(*pending.popleft())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, chunk: List[Dict[str, Any]], executor: ThreadPoolExecutor) -> List[Tuple[Dict[str, Any], Future]]:
+        """Retrieve a chunk in one batch, then queue one run per distinct profile"""
+        items = [item for item in chunk if 'error' not in item]
+        if items:
+            try:
+                # Fills the engine's search cache, so each run's retrieval is a hit
+                with llm_priority(BULK):
+                    self.pipeline.rag_engine.relevant_plans_batch([item['profile'] for item in items], top_k=self.top_k)
+            except Exception as e:
+                # Each run retries retrieval on its own and reports its error
+                logger.warning(f"⚠️ Batch retrieval failed, falling back per item: {str(e)}")
+
+        runs: Dict[Tuple[str, ...], Future] = {}
+        submitted = []
+        for item in chunk:
+            if 'error' in item:
+                future: Future = Future()
+                future.set_exception(ValueError(item.pop('error')))
+            else:
+                key = normalize_profile(item['profile'])
+                future = runs.get(key)
+                if future is None:
+                    future = runs[key] = executor.submit(self._recommend, item['profile'])
+                else:
+                    # Counted once, as a duplicate, when its result is written
+                    item['duplicate'] = True
+            submitted.append((item, future))
+        return submitted
+
+    def _recommend(self, profile: Dict[str, str]) -> Tuple[Dict[str, Any], bool]:
+        """One pipeline run (or cache hit) for a profile, and whether it came from the cache"""
+        key = self.cache_key(profile) if self.cache is not None else None
+        text = self.cache.get(key) if key is not None else None
+        if text is not None:
+            return {'recommendations': text}, True
+
+        result = {}
+        with llm_priority(BULK):
+            text = self.pipeline.run(profile, top_k=self.top_k)
+            if self.validate is not None:
+                # May regenerate, which is bulk work too
+                text, result['validation'] = self.validate(profile, text)
+        if key is not None:
+            self.cache.put(key, text)
+        return {'recommendations': text, **result}, False
+
+    def _result(self, item: Dict[str, Any], future: Future) -> Dict[str, Any]:
+        """Output object for one input line (each line is counted under exactly one outcome)"""
+        head = {'index': item['index'], 'id': item.get('id')}
+        try:
+            output, cached = future.result()
+        except Exception as e:
+            BATCH_ITEMS.inc(outcome='error')
+            return {**head, 'error': str(e)}
+        if item.get('duplicate'):
+            BATCH_ITEMS.inc(outcome='duplicate')
+        else:
+            BATCH_ITEMS.inc(outcome='cached' if cached else 'ok')
+        return {**head, **output}
+
+
+def _parse(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Numbered profiles from JSONL; malformed lines carry an 'error' instead"""
+    index = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+
+        item: Dict[str, Any] = {'index': index}
+        index += 1
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+            item['id'] = record.get('id')
+            missing = [field for field in PROFILE_FIELDS if field not in record]
+            if missing:
+                raise ValueError(f"missing field(s): {', '.join(missing)}")
+            item['profile'] = {field: str(record[field]) for field in PROFILE_FIELDS}
+        except ValueError as e:
+            item['error'] = f"invalid line: {e}"
+        yield item
+
+
+def _chunks(items: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendations for a JSONL file of profiles")
+    parser.add_argument('input', nargs='?', help="JSONL profiles (default: stdin)")
+    parser.add_argument('--output', help="Write JSONL results here (default: stdout)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_BATCH_CONCURRENCY,
+                        help="Pipeline runs in flight at once")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Profiles retrieved per chunk")
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--mode', default=os.getenv("PIPELINE_MODE", "crew").lower(),
+                        help="Pipeline mode (default: PIPELINE_MODE)")
+    parser.add_argument('--deterministic', action='store_true', help="Temperature 0 + fixed seed")
+    args = parser.parse_args()
+
+    configure_logging(asynchronous=False)
+    os.environ.setdefault("OPENAI_API_BASE", "http://localhost:11434/v1")
+    os.environ.setdefault("OPENAI_MODEL_NAME", "llama3.2")
+    os.environ.setdefault("OPENAI_API_KEY", "ollama")
+
+    from pipeline import RecommendationPipeline
+    from rag.rag_engine import RAGEngine
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    rag_engine = RAGEngine(
+        data_path=os.getenv("DATA_PATH", os.path.join(backend_dir, "data", "indian_health_insurance_data.json")),
+        store_dir=os.getenv("RAG_STORE_DIR", os.path.join(backend_dir, "rag"))
+    )
+    if not rag_engine.retriever.is_ready() and not rag_engine.retriever.reload():
+        raise SystemExit("❌ Vector database not found. Run rag/setup_embeddings.py first.")
+
+    pipeline = RecommendationPipeline(
+        rag_engine,
+        pool_size=args.concurrency,
+        deterministic=args.deterministic,
+        seed=int(os.getenv("LLM_SEED", "42")),
+        mode=args.mode
+    )
+    batch = BatchRecommender(pipeline, batch_size=args.batch_size, concurrency=args.concurrency, top_k=args.top_k)
+
+    source = open(args.input, 'r') if args.input else sys.stdin
+    sink = open(args.output, 'w') if args.output else sys.stdout
+    done = failed = 0
+    try:
+        for result in batch.run(source):
+            sink.write(json.dumps(result) + "\n")
+            sink.flush()
+            done += 1
+            failed += 'error' in result
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    logger.info(f"✅ {done} profiles scored ({failed} errors)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compare pipeline modes end to end
+
+Runs the same profiles through each pipeline mode against the local Ollama
+server and reports wall-clock latency, LLM calls and prompt/completion
+tokens. Needs Ollama running with llama3.2 and nomic-embed-text, and the
+vector database set up (rag/setup_embeddings.py).
+
+Usage:
+    python benchmark_pipeline.py
+    python benchmark_pipeline.py --modes single parallel template --runs 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+os.environ.setdefault("OPENAI_API_BASE", "http://localhost:11434/v1")
+os.environ.setdefault("OPENAI_MODEL_NAME", "llama3.2")
+os.environ.setdefault("OPENAI_API_KEY", "ollama")
+
+from pipeline import PIPELINE_MODES, RecommendationPipeline
+from rag.rag_engine import RAGEngine
+
+
+SAMPLE_PROFILES = [
+    {'age': '32', 'ped': 'None', 'budget': '15000-20000',
+     'needs': 'Maternity cover for planned pregnancy', 'preferences': 'No room rent limit'},
+    {'age': '55', 'ped': 'Diabetes, hypertension', 'budget': '25000',
+     'needs': 'Short PED waiting period', 'preferences': 'High claim settlement ratio'},
+    {'age': '28', 'ped': 'None', 'budget': '10000',
+     'needs': 'OPD consultations', 'preferences': 'Low premium'},
+]
+
+
+def time_mode(mode: str, rag_engine: RAGEngine, profiles: List[Dict[str, str]],
+              runs: int, top_k: int, deterministic: bool) -> Dict[str, Any]:
+    pipeline = RecommendationPipeline(rag_engine, pool_size=1, deterministic=deterministic, mode=mode)
+
+    latencies = []
+    totals = {'llm_calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+    for _ in range(runs):
+        for profile in profiles:
+            start = time.perf_counter()
+            _, usage = pipeline.run_with_usage(profile, top_k=top_k)
+            latencies.append(time.perf_counter() - start)
+            for key in totals:
+                totals[key] += usage.get(key, 0)
+
+    count = len(latencies)
+    return {
+        'mode': mode,
+        'requests': count,
+        'mean_s': statistics.mean(latencies),
+        'p50_s': statistics.median(latencies),
+        'max_s': max(latencies),
+        'llm_calls': totals['llm_calls'] / count,
+        'prompt_tokens': totals['prompt_tokens'] / count,
+        'completion_tokens': totals['completion_tokens'] / count
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pipeline modes (latency + tokens)")
+    parser.add_argument('--modes', nargs='+', default=list(PIPELINE_MODES), choices=PIPELINE_MODES)
+    parser.add_argument('--runs', type=int, default=1, help="Passes over the sample profiles per mode")
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--deterministic', action='store_true', help="Temperature 0 + fixed seed")
+    parser.add_argument('--output', help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    rag_engine = RAGEngine()
+
+    results = []
+    for mode in args.modes:
+        print(f"⏱️  Running {mode}...")
+        results.append(time_mode(mode, rag_engine, SAMPLE_PROFILES, args.runs, args.top_k, args.deterministic))
+
+    print(f"\n📊 {len(SAMPLE_PROFILES) * args.runs} requests per mode, top-{args.top_k}\n")
+    print(f"{'Mode':<14} {'Mean (s)':>9} {'p50 (s)':>9} {'Max (s)':>9} {'Calls':>7} "
+          f"{'Prompt tok':>11} {'Output tok':>11}")
+    for r in results:
+        print(f"{r['mode']:<14} {r['mean_s']:>9.2f} {r['p50_s']:>9.2f} {r['max_s']:>9.2f} "
+              f"{r['llm_calls']:>7.1f} {r['prompt_tokens']:>11.0f} {r['completion_tokens']:>11.0f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Local stand-in for the Ollama HTTP API
+
+Serves the endpoints the backend uses, with configurable latency, so the
+pipeline can be benchmarked without a GPU or real models:
+
+- POST /api/embed              (ollama.embed - batch embeddings)
+- POST /api/embeddings         (legacy single embedding)
+- POST /api/chat               (ollama Client.chat, streaming NDJSON or not)
+- POST /v1/chat/completions    (OpenAI-compatible, used by CrewAI)
+- GET  /api/tags, GET /        (health checks)
+
+Embeddings are deterministic pseudo-random unit vectors derived from the
+text, so the same text always embeds the same way. Chat replies are canned
+Markdown of a fixed number of tokens, streamed at a fixed rate. At most
+`parallel` chat generations run at once, like OLLAMA_NUM_PARALLEL.
+
+Usage:
+    python -m benchmarks.fake_ollama --port 11435 --chat-first-token-ms 300 --token-ms 20
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class FakeOllamaConfig:
+    """Latency and output shape of the fake server"""
+
+    def __init__(self, dim: int = 768, embed_ms: float = 15.0, embed_per_text_ms: float = 2.0,
+                 first_token_ms: float = 200.0, token_ms: float = 10.0, reply_tokens: int = 120,
+                 parallel: int = 4):
+        """
+        Args:
+            dim: Embedding dimension (nomic-embed-text: 768)
+            embed_ms: Fixed latency per embed call
+            embed_per_text_ms: Extra latency per text in a batch embed call
+            first_token_ms: Prompt processing time before the first chat token
+            token_ms: Time per generated token
+            reply_tokens: Tokens in each chat reply
+            parallel: Chat generations served concurrently; the rest queue
+        """
+        self.dim = dim
+        self.embed_ms = embed_ms
+        self.embed_per_text_ms = embed_per_text_ms
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.reply_tokens = reply_tokens
+        self.parallel = max(1, parallel)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit vector for a text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+
+def _reply_tokens(messages: List[Dict[str, str]], count: int, json_mode: bool) -> List[str]:
+    """Canned reply: a Markdown plan section repeated to `count` tokens, or '{}' for JSON mode"""
+    if json_mode:
+        return ['{}']
+    words = ("## Sample Plan\n**Insurer:** Sample Insurer\n**Why This Plan:**\n"
+             "- Matches the stated needs\n- Good claim settlement ratio\n").split(' ')
+    return [(words[i % len(words)] + ' ') for i in range(count)]
+
+
+def _prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough token count (~4 characters per token)"""
+    return sum(len(m.get('content') or '') for m in messages) // 4
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeOllama/1.0"
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per response
+    disable_nagle_algorithm = True
+
+    # Set on the subclass created by make_server()
+    config: FakeOllamaConfig
+    slots: threading.Semaphore
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    # --- helpers -------------------------------------------------------------
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # --- routes --------------------------------------------------------------
+
+    def do_GET(self) -> None:
+        if self.path.startswith('/api/tags'):
+            self._send_json({'models': [{'name': 'llama3.2:latest'}, {'name': 'nomic-embed-text:latest'}]})
+        elif self.path == '/':
+            self._send_json('Ollama is running')
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self) -> None:
+        request = self._read_json()
+        try:
+            if self.path == '/api/embed':
+                self._embed(request)
+            elif self.path == '/api/embeddings':
+                time.sleep(self.config.embed_ms / 1000)
+                self._send_json({'embedding': fake_embedding(request.get('prompt', ''), self.config.dim)})
+            elif self.path == '/api/chat':
+                self._chat(request)
+            elif self.path == '/v1/chat/completions':
+                self._openai_chat(request)
+            else:
+                self._send_json({'error': 'not found'}, status=404)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled mid-stream; like Ollama, stop generating
+            self.close_connection = True
+
+    def _embed(self, request: Dict[str, Any]) -> None:
+        texts = request.get('input', [])
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep((self.config.embed_ms + self.config.embed_per_text_ms * len(texts)) / 1000)
+        self._send_json({
+            'model': request.get('model'),
+            'embeddings': [fake_embedding(t, self.config.dim) for t in texts],
+            'prompt_eval_count': sum(len(t) for t in texts) // 4
+        })
+
+    def _generate(self, messages: List[Dict[str, str]], json_mode: bool):
+        """Yield reply tokens at the configured rate, holding a generation slot"""
+        with self.slots:
+            time.sleep(self.config.first_token_ms / 1000)
+            for token in _reply_tokens(messages, self.config.reply_tokens, json_mode):
+                time.sleep(self.config.token_ms / 1000)
+                yield token
+
+    def _chat(self, request: Dict[str, Any]) -> None:
+        messages = request.get('messages', [])
+        model = request.get('model')
+        tokens = self._generate(messages, request.get('format') == 'json')
+        usage = {'prompt_eval_count': _prompt_tokens(messages)}
+
+        if not request.get('stream', True):
+            text = ''.join(tokens)
+            self._send_json({
+                'model': model, 'message': {'role': 'assistant', 'content': text}, 'done': True,
+                'eval_count': self.config.reply_tokens, **usage
+            })
+            return
+
+        self._start_chunked('application/x-ndjson')
+        for token in tokens:
+            line = {'model': model, 'message': {'role': 'assistant', 'content': token}, 'done': False}
+            self._write_chunk((json.dumps(line) + '\n').encode('utf-8'))
+        final = {'model': model, 'message': {'role': 'assistant', 'content': ''}, 'done': True,
+                 'done_reason': 'stop', 'eval_count': self.config.reply_tokens, **usage}
+        self._write_chunk((json.dumps(final) + '\n').encode('utf-8'))
+        self._end_chunked()
+
+    def _openai_chat(self, request: Dict[str, Any]) -> None:
+        messages = request.get('messages', [])
+        model = request.get('model')
+        tokens = self._generate(messages, False)
+        usage = {
+            'prompt_tokens': _prompt_tokens(messages),
+            'completion_tokens': self.config.reply_tokens,
+            'total_tokens': _prompt_tokens(messages) + self.config.reply_tokens
+        }
+        created = int(time.time())
+
+        if not request.get('stream'):
+            self._send_json({
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': ''.join(tokens)}}],
+                'usage': usage
+            })
+            return
+
+        self._start_chunked('text/event-stream')
+        for token in tokens:
+            chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                     'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        final = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}
+        self._write_chunk(f"data: {json.dumps(final)}\n\n".encode('utf-8'))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_chunked()
+
+
+def make_server(config: Optional[FakeOllamaConfig] = None, host: str = '127.0.0.1',
+                port: int = 0) -> ThreadingHTTPServer:
+    """
+    Create (but do not start) a fake Ollama server
+
+    Args:
+        config: Latency/output settings (defaults if None)
+        host: Interface to bind
+        port: Port to bind (0 = any free port; read server.server_address)
+    """
+    config = config or FakeOllamaConfig()
+    handler = type('FakeOllamaHandler', (_Handler,), {
+        'config': config,
+        'slots': threading.BoundedSemaphore(config.parallel)
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(config: Optional[FakeOllamaConfig] = None, host: str = '127.0.0.1',
+                    port: int = 0) -> ThreadingHTTPServer:
+    """Start a fake server on a background thread; returns it (call shutdown() to stop)"""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for offline benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--embed-ms', type=float, default=15.0)
+    parser.add_argument('--embed-per-text-ms', type=float, default=2.0)
+    parser.add_argument('--chat-first-token-ms', type=float, default=200.0)
+    parser.add_argument('--token-ms', type=float, default=10.0)
+    parser.add_argument('--reply-tokens', type=int, default=120)
+    parser.add_argument('--parallel', type=int, default=4)
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        dim=args.dim, embed_ms=args.embed_ms, embed_per_text_ms=args.embed_per_text_ms,
+        first_token_ms=args.chat_first_token_ms, token_ms=args.token_ms,
+        reply_tokens=args.reply_tokens, parallel=args.parallel
+    )
+    server = make_server(config, args.host, args.port)
+    print(f"🦙 Fake Ollama listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
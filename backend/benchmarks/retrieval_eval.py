@@ -0,0 +1,126 @@
+"""
+Retrieval quality and latency per ranking mode on a labelled query set
+
+For every profile in benchmarks/labelled_queries.json, ranks the real
+catalogue with each RAG_RANKING mode and reports recall@k (the share of
+labelled plans found in the top k, capped at k) and the mean retrieval
+time. Profiles are retrieved cold (query caches off) so the embedding
+call is counted in the modes that make one.
+
+Needs the embedding model, i.e. a running Ollama; pass --fake to use the
+fake server instead (vector rankings are then meaningless, but the
+lexical and structured numbers still hold). Before ranking, checks that
+the words in SAME_TOKENS tokenize alike and exits non-zero if they do not.
+
+Usage (from backend/):
+    python -m benchmarks.retrieval_eval
+    python -m benchmarks.retrieval_eval --modes lexical fusion --top-k 3 --fake
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.synthetic import BACKEND_DIR
+
+LABELS_PATH = os.path.join(BACKEND_DIR, "benchmarks", "labelled_queries.json")
+DATA_PATH = os.path.join(BACKEND_DIR, "data", "indian_health_insurance_data.json")
+# Words a profile and a plan use for the same thing; each group must give one BM25 token
+SAME_TOKENS = [
+    ["diabetes", "diabetic"],
+    ["outpatient", "outpatients", "OPD"],
+    ["pregnancy", "delivery", "maternity"],
+    ["PED", "pre-existing"],
+]
+
+
+def recall_at_k(ranked: List[str], relevant: List[str], k: int) -> float:
+    """|top k ∩ relevant| / min(k, |relevant|)"""
+    return len(set(ranked[:k]) & set(relevant)) / min(k, len(relevant))
+
+
+def check_tokens(groups: List[List[str]]) -> List[Dict[str, Any]]:
+    """Groups whose words the lexical tokenizer does not fold to one token"""
+    from rag.lexical import tokenize
+
+    failures = []
+    for words in groups:
+        tokens = {word: tokenize(word) for word in words}
+        if len({tuple(value) for value in tokens.values()}) != 1:
+            failures.append(tokens)
+    return failures
+
+
+def evaluate(engine, queries: List[Dict[str, Any]], top_k: int) -> Dict[str, Any]:
+    """Recall@k and retrieval latency for one engine over the labelled queries"""
+    recalls, latencies, misses = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        plans = engine.retrieve(query['profile'], top_k=top_k)
+        latencies.append(time.perf_counter() - start)
+        ranked = [plan['metadata'].get('plan_id') for plan in plans]
+        recalls.append(recall_at_k(ranked, query['relevant'], top_k))
+        if recalls[-1] < 1.0:
+            misses.append({'id': query['id'], 'ranked': ranked})
+
+    values = np.array(latencies) * 1000
+    return {
+        'mode': engine.ranking,
+        f'recall@{top_k}': round(float(np.mean(recalls)), 3),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'misses': misses
+    }
+
+
+def main():
+    from rag.rag_engine import RANKING_MODES, RAGEngine
+
+    parser = argparse.ArgumentParser(description="Recall@k per ranking mode on labelled profiles")
+    parser.add_argument('--modes', nargs='+', default=list(RANKING_MODES), choices=RANKING_MODES)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--labels', default=LABELS_PATH)
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--fake', action='store_true', help="Embed with the fake Ollama server")
+    parser.add_argument('--verbose', action='store_true', help="List the profiles each mode misses")
+    args = parser.parse_args()
+
+    failures = check_tokens(SAME_TOKENS)
+    if failures:
+        for tokens in failures:
+            print(f"❌ Not folded to one token: {tokens}")
+        sys.exit(1)
+
+    with open(args.labels) as f:
+        queries = json.load(f)['queries']
+
+    if args.fake:
+        from benchmarks.fake_ollama import FakeOllamaConfig, start_in_thread
+        server = start_in_thread(FakeOllamaConfig(embed_ms=0, embed_per_text_ms=0))
+        os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"📊 {len(queries)} labelled profiles, top-{args.top_k}\n")
+    print(f"{'Mode':<12} {f'Recall@{args.top_k}':>10} {'Mean (ms)':>11} {'p50 (ms)':>10}")
+    with tempfile.TemporaryDirectory() as store_dir:
+        for mode in args.modes:
+            engine = RAGEngine(data_path=args.data, store_dir=store_dir, retriever="numpy",
+                               ranking=mode, query_cache_size=0)
+            if not engine.retriever.is_ready():
+                engine.setup_vector_database()
+            # Build the plan table and BM25 index outside the timed loop
+            engine.lexical_index
+            result = evaluate(engine, queries, args.top_k)
+            print(f"{mode:<12} {result[f'recall@{args.top_k}']:>10.3f} {result['mean_ms']:>11.3f} {result['p50_ms']:>10.3f}")
+            if args.verbose:
+                for miss in result['misses']:
+                    print(f"    {miss['id']}: {', '.join(miss['ranked'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""
+Offline load test for the RAG engine and the API
+
+Starts the fake Ollama server (benchmarks/fake_ollama.py), generates
+synthetic catalogues of each requested size, and measures:
+
+- setup_vector_database: cold (empty embedding cache) and warm rebuilds
+- startup: API import time and time-to-ready in a fresh interpreter, per pipeline mode
+- semantic_search: throughput and p50/p99 latency at each concurrency level
+- POST /recommend: the same, in-process through the ASGI app, per pipeline mode
+- POST /recommend/batch: the same profiles as one JSONL request, with the
+  concurrency level as the batch's thread pool size
+
+Every request uses a distinct profile, so the query caches do not hide the
+embedding/search cost. Results are written as JSON; pass an earlier result
+file as --baseline to print the change per scenario.
+
+Usage (from backend/):
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 9 100 1000 --concurrency 1 4 16 --modes template single
+    python -m benchmarks.run --baseline benchmarks/results/<earlier>.json
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.fake_ollama import FakeOllamaConfig, start_in_thread
+from benchmarks.synthetic import BACKEND_DIR, write_catalogue
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+SCENARIOS = ("setup", "startup", "search", "recommend", "batch")
+
+AGES = range(18, 71)
+PEDS = ('None', 'None', 'Diabetes', 'Hypertension', 'Asthma', 'Thyroid', 'Diabetes, hypertension')
+BUDGETS = ('10000', '15000', '15000-20000', '20000-25000', '30000', '50000')
+NEEDS = ('Maternity cover for planned pregnancy', 'Short PED waiting period', 'OPD consultations',
+         'Comprehensive family cover', 'Cashless hospital network', 'Critical illness cover')
+PREFERENCES = ('No room rent limit', 'High claim settlement ratio', 'Low premium', 'Restoration benefit')
+
+
+def sample_profiles(count: int, seed: int = 0) -> List[Dict[str, str]]:
+    """Distinct user profiles (the request index keeps each one unique)"""
+    rng = random.Random(seed)
+    return [{
+        'age': str(rng.choice(AGES)),
+        'ped': rng.choice(PEDS),
+        'budget': rng.choice(BUDGETS),
+        'needs': rng.choice(NEEDS),
+        'preferences': f"{rng.choice(PREFERENCES)} (profile {i})"
+    } for i in range(count)]
+
+
+def summarize(latencies: List[float], wall: float, errors: int = 0) -> Dict[str, Any]:
+    """Throughput and latency percentiles (latencies and wall in seconds)"""
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        'mean_ms': round(float(values.mean()), 2),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p99_ms': round(float(np.percentile(values, 99)), 2),
+        'max_ms': round(float(values.max()), 2)
+    }
+
+
+def run_threaded(call: Callable[[Any], Any], items: List[Any], concurrency: int) -> Dict[str, Any]:
+    """Closed loop: `concurrency` workers call `call(item)` until every item is done"""
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            call(item)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, items))
+    wall = time.perf_counter() - start
+
+    latencies = [r for r in results if r is not None]
+    return summarize(latencies, wall, errors=len(results) - len(latencies))
+
+
+# --- Scenarios ---------------------------------------------------------------
+
+def bench_setup(data_path: str, store_dir: str, retriever: str,
+                ranking: str) -> Tuple[Any, List[Dict[str, Any]]]:
+    """Cold then warm setup_vector_database; returns the engine and both timings"""
+    from rag.rag_engine import RAGEngine
+
+    results = []
+    engine = None
+    for cache in ('cold', 'warm'):
+        engine = RAGEngine(data_path=data_path, store_dir=store_dir, retriever=retriever, ranking=ranking)
+        start = time.perf_counter()
+        engine.setup_vector_database()
+        results.append({'scenario': 'setup_vector_database', 'cache': cache,
+                        'ms': round((time.perf_counter() - start) * 1000, 2)})
+    return engine, results
+
+
+def bench_startup(mode: str, runs: int) -> Dict[str, Any]:
+    """Median cold start over `runs` fresh interpreters (see benchmarks/startup.py)"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-m", "benchmarks.startup"], cwd=BACKEND_DIR,
+                                   env={**os.environ, "PIPELINE_MODE": mode},
+                                   capture_output=True, text=True, check=True)
+        process_s = time.perf_counter() - start
+        state = json.loads(completed.stdout.strip().splitlines()[-1])
+        if not state['ready']:
+            raise RuntimeError(f"Backend did not become ready: {state['checks']}")
+        samples.append((state['import_seconds'], state['ready_seconds'], process_s))
+
+    import_s, ready_s, process_s = (float(np.median(column)) for column in zip(*samples))
+    return {
+        'scenario': 'startup',
+        'mode': mode,
+        'runs': runs,
+        'import_ms': round(import_s * 1000, 2),
+        'ready_ms': round(ready_s * 1000, 2),
+        # Includes interpreter start-up, i.e. what a new worker process costs
+        'ms': round(process_s * 1000, 2)
+    }
+
+
+def bench_search(engine: Any, concurrency_levels: List[int], requests: int, seed: int) -> List[Dict[str, Any]]:
+    results = []
+    for concurrency in concurrency_levels:
+        # Fresh queries per level so nothing is served from the query cache
+        queries = [engine.profile_query(p) for p in sample_profiles(requests, seed=seed + concurrency)]
+        stats = run_threaded(engine.semantic_search, queries, concurrency)
+        results.append({'scenario': 'semantic_search', 'concurrency': concurrency, **stats})
+    return results
+
+
+async def _post_all(client: Any, profiles: List[Dict[str, str]], concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: Dict[str, int] = {}
+    latencies: List[float] = []
+
+    async def one(profile):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/recommend", json=profile)
+            elapsed = time.perf_counter() - start
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        if response.status_code == 200:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(p) for p in profiles))
+    wall = time.perf_counter() - start
+
+    stats = summarize(latencies, wall, errors=len(profiles) - len(latencies))
+    stats['status_codes'] = statuses
+    return stats
+
+
+async def _post_batch(client: Any, profiles: List[Dict[str, str]], concurrency: int) -> Dict[str, Any]:
+    """One /recommend/batch call; each item's latency runs until its result line arrives"""
+    body = "".join(json.dumps(profile) + "\n" for profile in profiles)
+    latencies: List[float] = []
+    errors = 0
+
+    start = time.perf_counter()
+    async with client.stream("POST", "/recommend/batch", params={'concurrency': concurrency},
+                             content=body) as response:
+        status = response.status_code
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            if 'error' in json.loads(line):
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+    wall = time.perf_counter() - start
+
+    stats = summarize(latencies, wall, errors=len(profiles) - len(latencies))
+    stats['status_codes'] = {str(status): 1}
+    return stats
+
+
+async def _bench_app(app: Any, startup_state: Dict[str, Any], mode: str, concurrency_levels: List[int],
+                     requests: int, seed: int, batch: bool = False) -> List[Dict[str, Any]]:
+    import httpx
+
+    results = []
+    # Runs the startup hooks (background warm-up) like a real server would
+    async with app.router.lifespan_context(app):
+        while not startup_state['ready']:
+            await asyncio.sleep(0.01)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                     timeout=None) as client:
+            for concurrency in concurrency_levels:
+                profiles = sample_profiles(requests, seed=seed + 1000 + concurrency)
+                if batch:
+                    stats = await _post_batch(client, profiles, concurrency)
+                else:
+                    stats = await _post_all(client, profiles, concurrency)
+                results.append({'scenario': 'recommend_batch' if batch else 'recommend', 'mode': mode,
+                                'concurrency': concurrency, **stats})
+    return results
+
+
+def bench_recommend(mode: str, concurrency_levels: List[int], requests: int, seed: int,
+                    batch: bool = False) -> List[Dict[str, Any]]:
+    """POST /recommend (or /recommend/batch) through the ASGI app (re-imported so it picks up the current catalogue and mode)"""
+    os.environ["PIPELINE_MODE"] = mode
+    previous = sys.modules.get("backend_api")
+    backend_api = importlib.reload(previous) if previous is not None else importlib.import_module("backend_api")
+    return asyncio.run(_bench_app(backend_api.app, backend_api.startup_state, mode,
+                                  concurrency_levels, requests, seed, batch=batch))
+
+
+# --- Reporting ---------------------------------------------------------------
+
+def _key(result: Dict[str, Any]) -> Tuple:
+    return tuple(result.get(k) for k in ('scenario', 'catalogue_size', 'mode', 'concurrency', 'cache'))
+
+
+def _label(result: Dict[str, Any]) -> str:
+    parts = [result['scenario'], f"n={result['catalogue_size']}"]
+    if result.get('mode'):
+        parts.append(result['mode'])
+    if result.get('concurrency'):
+        parts.append(f"c={result['concurrency']}")
+    if result.get('cache'):
+        parts.append(result['cache'])
+    return ' '.join(parts)
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    print(f"\n{'Scenario':<44} {'Req/s':>9} {'p50 (ms)':>10} {'p99 (ms)':>10} {'Errors':>7}")
+    for r in results:
+        if 'ms' in r:
+            print(f"{_label(r):<44} {'':>9} {r['ms']:>10.1f}")
+        else:
+            print(f"{_label(r):<44} {r['throughput_rps']:>9.1f} {r['p50_ms']:>10.1f} "
+                  f"{r['p99_ms']:>10.1f} {r['errors']:>7}")
+
+
+def print_comparison(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    """Percent change against an earlier result file, per matching scenario"""
+    with open(baseline_path, 'r') as f:
+        baseline = {_key(r): r for r in json.load(f)['results']}
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\n📈 Compared with {baseline_path}")
+    print(f"{'Scenario':<44} {'Req/s':>9} {'p50':>9} {'p99':>9}")
+    for r in results:
+        old = baseline.get(_key(r))
+        if old is None:
+            continue
+        if 'ms' in r:
+            print(f"{_label(r):<44} {'':>9} {change(r['ms'], old['ms']):>9}")
+        else:
+            print(f"{_label(r):<44} {change(r['throughput_rps'], old['throughput_rps']):>9} "
+                  f"{change(r['p50_ms'], old['p50_ms']):>9} {change(r['p99_ms'], old['p99_ms']):>9}")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a fake Ollama server")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[9, 100, 1000], help="Catalogue sizes (plans)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--modes', nargs='+', default=['template', 'single'],
+                        help="Pipeline modes for /recommend")
+    parser.add_argument('--retriever', default=os.getenv("RAG_RETRIEVER", "numpy"), choices=('chroma', 'numpy'))
+    parser.add_argument('--ranking', default=os.getenv("RAG_RANKING", "hybrid"))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--startup-runs', type=int, default=3, help="Fresh interpreters per startup measurement")
+    parser.add_argument('--ollama-url', help="Use this server instead of starting the fake one")
+    parser.add_argument('--embed-ms', type=float, default=15.0, help="Fake server: latency per embed call")
+    parser.add_argument('--embed-per-text-ms', type=float, default=2.0, help="Fake server: extra latency per text")
+    parser.add_argument('--first-token-ms', type=float, default=200.0, help="Fake server: time to first token")
+    parser.add_argument('--token-ms', type=float, default=10.0, help="Fake server: time per token")
+    parser.add_argument('--reply-tokens', type=int, default=120, help="Fake server: tokens per reply")
+    parser.add_argument('--parallel', type=int, default=4, help="Fake server: concurrent generations")
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument('--baseline', help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    fake = FakeOllamaConfig(
+        embed_ms=args.embed_ms, embed_per_text_ms=args.embed_per_text_ms,
+        first_token_ms=args.first_token_ms, token_ms=args.token_ms,
+        reply_tokens=args.reply_tokens, parallel=args.parallel
+    )
+    server = None
+    ollama_url = args.ollama_url
+    if ollama_url is None:
+        server = start_in_thread(fake)
+        ollama_url = f"http://127.0.0.1:{server.server_address[1]}"
+        print(f"🦙 Fake Ollama on {ollama_url}")
+
+    # Must be set before the ollama client (and the backend) are imported
+    os.environ["OLLAMA_HOST"] = ollama_url
+    os.environ["OPENAI_API_BASE"] = f"{ollama_url}/v1"
+    os.environ.setdefault("OPENAI_MODEL_NAME", "llama3.2")
+    os.environ.setdefault("OPENAI_API_KEY", "ollama")
+    os.environ["RAG_RETRIEVER"] = args.retriever
+    os.environ["RAG_RANKING"] = args.ranking
+    # Queue every request instead of rejecting at the default queue limit
+    os.environ.setdefault("MAX_QUEUED_RECOMMENDATIONS", str(max(args.concurrency)))
+    os.environ.setdefault("BATCH_CONCURRENCY", str(max(args.concurrency)))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+
+    from rag.telemetry import configure_logging
+    configure_logging(os.environ["LOG_LEVEL"], asynchronous=False)
+
+    results = []
+    try:
+        for size in args.sizes:
+            with tempfile.TemporaryDirectory(prefix=f"bench_{size}_") as workdir:
+                # The API (and startup subprocesses) read these when (re)imported
+                os.environ["DATA_PATH"] = write_catalogue(os.path.join(workdir, "plans.json"),
+                                                          size, seed=args.seed)
+                os.environ["RAG_STORE_DIR"] = os.path.join(workdir, "store")
+                print(f"⏱️  {size} plans...")
+
+                engine, setup = bench_setup(os.environ["DATA_PATH"], os.environ["RAG_STORE_DIR"],
+                                            args.retriever, args.ranking)
+                scenario_results = setup if 'setup' in args.scenarios else []
+                if 'startup' in args.scenarios:
+                    for mode in args.modes:
+                        scenario_results.append(bench_startup(mode, args.startup_runs))
+                if 'search' in args.scenarios:
+                    scenario_results += bench_search(engine, args.concurrency, args.requests, args.seed)
+                if 'recommend' in args.scenarios:
+                    for mode in args.modes:
+                        scenario_results += bench_recommend(mode, args.concurrency, args.requests, args.seed)
+                if 'batch' in args.scenarios:
+                    for mode in args.modes:
+                        scenario_results += bench_recommend(mode, args.concurrency, args.requests, args.seed,
+                                                            batch=True)
+
+                for result in scenario_results:
+                    result['catalogue_size'] = size
+                results += scenario_results
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {
+            'retriever': args.retriever,
+            'ranking': args.ranking,
+            'requests_per_level': args.requests,
+            'seed': args.seed,
+            'max_concurrent_recommendations': int(os.getenv("MAX_CONCURRENT_RECOMMENDATIONS", "2")),
+            'ollama': 'external' if args.ollama_url else fake.as_dict()
+        },
+        'results': results
+    }
+
+    print_results(results)
+    if args.baseline:
+        print_comparison(results, args.baseline)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{report['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Measure backend cold start
+
+Imports backend_api in this (fresh) interpreter, runs its startup hooks and
+waits until it reports ready. Prints one JSON line: import_seconds and
+ready_seconds (both from the start of the module import) plus the readiness
+checks. Uses whatever Ollama server OLLAMA_HOST / OPENAI_API_BASE point at;
+benchmarks/run.py runs it against the fake server for each catalogue size.
+
+Usage (from backend/):
+    python -m benchmarks.startup
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict
+
+
+async def measure(timeout: float) -> Dict[str, Any]:
+    import backend_api
+
+    app = backend_api.app
+    async with app.router.lifespan_context(app):
+        deadline = time.perf_counter() + timeout
+        while not backend_api.startup_state['ready'] and time.perf_counter() < deadline:
+            await asyncio.sleep(0.005)
+        return {**backend_api.startup_state, 'checks': dict(backend_api.startup_state['checks'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time backend import and time-to-ready")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Give up waiting after this many seconds")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(measure(args.timeout))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Synthetic insurance catalogues of any size
+
+Generates data files with the same structure as
+data/indian_health_insurance_data.json: the real insurers, each with many
+plans. Every plan starts from one of its insurer's real plans and has its
+coverage and waiting-period fields re-drawn from the values seen across the
+real catalogue, so the text, the parsed features and the filter/score paths
+all behave like production data.
+
+Usage:
+    python -m benchmarks.synthetic --plans 1000 --output /tmp/plans_1000.json
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(BACKEND_DIR, "data", "indian_health_insurance_data.json")
+
+# Fields re-drawn from the pool of real values (others stay as in the template plan)
+MIXED_COVERAGE_FIELDS = ('sum_insured_options', 'room_rent_limit', 'co_payment', 'no_claim_bonus',
+                         'restoration_benefit', 'maternity_coverage', 'opd_coverage', 'consumables_coverage')
+PED_WAITING_MONTHS = (12, 24, 36, 48)
+MATERNITY_WAITING_MONTHS = (9, 24, 36, 48)
+SUM_INSURED_STEPS = (200000, 300000, 500000, 1000000)
+VARIANTS = ('Plus', 'Select', 'Prime', 'Advantage', 'Secure', 'Elite', 'Essential', 'Supreme')
+
+
+def _field_pools(plans: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    pools: Dict[str, List[Any]] = {key: [] for key in MIXED_COVERAGE_FIELDS}
+    pools['key_features'] = []
+    for plan in plans:
+        for key in MIXED_COVERAGE_FIELDS:
+            value = plan['coverage_static'].get(key)
+            if value is not None:
+                pools[key].append(value)
+        pools['key_features'].extend(plan.get('key_features', []))
+    return pools
+
+
+def synthetic_catalogue(num_plans: int, seed: int = 0, source: str = DATA_PATH) -> Dict[str, Any]:
+    """
+    Build a catalogue with `num_plans` plans spread over the real insurers
+
+    Args:
+        num_plans: Total plans to generate
+        seed: RNG seed (same seed + size = same catalogue)
+        source: Real data file used as templates
+
+    Returns:
+        Parsed data file ({'metadata', 'insurers'})
+    """
+    with open(source, 'r') as f:
+        data = json.load(f)
+
+    rng = random.Random(seed)
+    templates = [plan for insurer in data['insurers'] for plan in insurer['plans']]
+    pools = _field_pools(templates)
+
+    insurers = []
+    for insurer in data['insurers']:
+        insurer = copy.deepcopy(insurer)
+        insurer['templates'] = insurer['plans']
+        insurer['plans'] = []
+        insurers.append(insurer)
+
+    for i in range(num_plans):
+        insurer = insurers[i % len(insurers)]
+        plan = copy.deepcopy(rng.choice(insurer['templates']))
+        coverage = plan['coverage_static']
+        waiting = plan['waiting_periods']
+
+        plan['plan_id'] = f"{insurer['insurer_id']}_syn_{i:05d}"
+        plan['plan_name'] = f"{plan['plan_name']} {rng.choice(VARIANTS)} {i}"
+        for key in MIXED_COVERAGE_FIELDS:
+            coverage[key] = rng.choice(pools[key])
+        coverage['min_sum_insured'] = rng.choice(SUM_INSURED_STEPS)
+        waiting['ped_waiting_months'] = rng.choice(PED_WAITING_MONTHS)
+        waiting['maternity_waiting_months'] = rng.choice(MATERNITY_WAITING_MONTHS)
+        plan['key_features'] = rng.sample(pools['key_features'], k=min(6, len(pools['key_features'])))
+
+        insurer['plans'].append(plan)
+
+    for insurer in insurers:
+        del insurer['templates']
+
+    metadata = dict(data.get('metadata', {}))
+    metadata.update({'synthetic': True, 'seed': seed, 'num_plans': num_plans})
+    return {'metadata': metadata, 'insurers': insurers}
+
+
+def write_catalogue(path: str, num_plans: int, seed: int = 0) -> str:
+    """Generate a catalogue and write it to `path`; returns the path"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(synthetic_catalogue(num_plans, seed), f, ensure_ascii=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic insurance catalogue")
+    parser.add_argument('--plans', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    write_catalogue(args.output, args.plans, args.seed)
+    print(f"💾 Wrote {args.plans} synthetic plans to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
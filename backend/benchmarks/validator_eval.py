@@ -0,0 +1,56 @@
+"""
+Regression cases for the answer check (validator.py)
+
+For every answer in benchmarks/validator_cases.json, runs
+AnswerValidator.check() against the real catalogue and compares the issue
+kinds it reports with the expected ones. Exits non-zero if any case
+differs, so it can gate changes to the name list or the matcher.
+
+Usage (from backend/):
+    python -m benchmarks.validator_eval
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+from benchmarks.synthetic import BACKEND_DIR
+
+CASES_PATH = os.path.join(BACKEND_DIR, "benchmarks", "validator_cases.json")
+DATA_PATH = os.path.join(BACKEND_DIR, "data", "indian_health_insurance_data.json")
+
+
+def evaluate(validator, cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Cases whose reported issue kinds differ from the expected ones"""
+    failures = []
+    for case in cases:
+        report = validator.check(case['text'], case['plans'])
+        kinds = sorted({issue['kind'] for issue in report['issues']})
+        if kinds != sorted(set(case['expected'])):
+            failures.append({'id': case['id'], 'expected': case['expected'], 'issues': report['issues']})
+    return failures
+
+
+def main():
+    from rag.catalogue import open_catalogue
+    from validator import AnswerValidator
+
+    parser = argparse.ArgumentParser(description="Check the answer validator against labelled answers")
+    parser.add_argument('--cases', default=CASES_PATH)
+    parser.add_argument('--data', default=DATA_PATH)
+    args = parser.parse_args()
+
+    with open(args.cases) as f:
+        cases = json.load(f)['cases']
+
+    failures = evaluate(AnswerValidator(open_catalogue(args.data)), cases)
+    for failure in failures:
+        print(f"❌ {failure['id']}: expected {failure['expected'] or 'no issues'}, got {failure['issues']}")
+    print(f"{'✅' if not failures else '❌'} {len(cases) - len(failures)}/{len(cases)} validator cases pass")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
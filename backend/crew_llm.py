@@ -0,0 +1,96 @@
+"""
+CrewAI LLM backed by the pooled Ollama client
+
+CrewAI's built-in LLM classes open their own HTTP clients. This adapter
+sends every agent call through rag.ollama_client instead, so crew mode
+shares the connection pool, timeouts, retries, circuit breaker, request
+coalescing, run cancellation and priority scheduling with the RAG engine
+and the streaming pipeline. Token usage is
+reported back to CrewAI so `kickoff().token_usage` keeps working.
+
+Imports CrewAI, so only import this module in crew mode.
+"""
+
+from typing import Any, Dict, Optional
+
+from crewai.events.types.llm_events import LLMCallType
+from crewai.llms.base_llm import BaseLLM, llm_call_context
+
+from rag.cancellation import deadline
+from rag.ollama_client import shared_client
+
+
+class PooledOllamaLLM(BaseLLM):
+    """Chat model on the shared Ollama client (no tool calling; the crew uses none)"""
+
+    llm_type: str = "ollama_pooled"
+    provider: str = "ollama"
+    # Ollama server root (None = the router over OLLAMA_HOSTS / OPENAI_API_BASE)
+    host: Optional[str] = None
+    # Seconds allowed per call; DeadlineExceeded ends the crew run (None = no deadline)
+    call_deadline: Optional[float] = None
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None) -> str:
+        with llm_call_context():
+            self._emit_call_started_event(
+                messages=messages,
+                tools=tools,
+                callbacks=callbacks,
+                available_functions=available_functions,
+                from_task=from_task,
+                from_agent=from_agent
+            )
+            formatted = self._format_messages(messages)
+            self._invoke_before_llm_call_hooks(formatted, from_agent)
+
+            try:
+                with deadline(self.call_deadline, "llm_crew"):
+                    response = shared_client(self.host).chat(
+                        model=self.model,
+                        messages=[{'role': m['role'], 'content': m.get('content') or ''} for m in formatted],
+                        options=self._options() or None
+                    )
+            except Exception as e:
+                self._emit_call_failed_event(error=str(e), from_task=from_task, from_agent=from_agent)
+                raise
+
+            usage = {
+                'prompt_tokens': response.get('prompt_eval_count') or 0,
+                'completion_tokens': response.get('eval_count') or 0
+            }
+            self._track_token_usage_internal(usage)
+
+            content = self._apply_stop_words(response['message']['content'])
+            content = self._invoke_after_llm_call_hooks(formatted, content, from_agent)
+            self._emit_call_completed_event(
+                response=content,
+                call_type=LLMCallType.LLM_CALL,
+                from_task=from_task,
+                from_agent=from_agent,
+                messages=formatted,
+                usage=usage,
+                finish_reason=response.get('done_reason')
+            )
+            return content
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return self._supports_stop_words_implementation()
+
+    def _options(self) -> Dict[str, Any]:
+        """Ollama generation options from the CrewAI LLM fields"""
+        options: Dict[str, Any] = {}
+        if self.temperature is not None:
+            options['temperature'] = self.temperature
+        if self.seed is not None:
+            options['seed'] = self.seed
+        if self.top_p is not None:
+            options['top_p'] = self.top_p
+        if self.max_tokens:
+            options['num_predict'] = int(self.max_tokens)
+        if self.stop:
+            options['stop'] = list(self.stop)
+        return options
@@ -0,0 +1,760 @@
+"""
+Reusable recommendation pipeline
+
+Builds the CrewAI agents, tasks and crews once per process. Task prompts are
+templates with `{placeholders}` that CrewAI fills in from `kickoff(inputs=...)`,
+so a request only supplies its profile and RAG context instead of rebuilding
+every Task/Crew object. Crews are not safe to kick off concurrently (kickoff
+interpolates into the shared task objects), so a small pool of independent
+crews is kept and each request checks one out for the duration of its run.
+Runs at a background priority (batch, precompute; see rag.scheduler) may
+hold all crews but one, so an interactive run never waits behind them.
+
+`stream()` runs the same three stages directly against Ollama's streaming
+chat API so tokens can be forwarded to the client as they are generated.
+
+Pipeline modes:
+- crew: profile -> recommendations -> comparison, all generated by the LLM
+- single: profile summary, plan sections and table in one generation
+- parallel: one generation per plan section, run concurrently; the
+  comparison table is rendered from the plan records
+- template: plan sections and comparison rendered from the plan records, no LLM
+- template_llm: as template, with one small LLM call for the "Why This Plan" bullets
+
+Deadlines (optional): every LLM call gets `stage_deadline` seconds and a
+whole run `run_deadline`. A stage that runs out falls back to the records:
+a late parallel section is replaced by its rendered section, a late
+rationale by the rule-based reasons, and anything else by the full
+template answer (the "done" event then carries `fallback`).
+"""
+
+import contextvars
+import hashlib
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from crewai import Crew
+    from crewai.llms.base_llm import BaseLLM
+
+from rag.cancellation import DeadlineExceeded, current_scope, deadline, record_waste
+from rag.ollama_client import shared_client
+from rag.plan_filter import ProfileNeeds
+from rag.scheduler import INTERACTIVE, current_priority
+from rag.telemetry import REGISTRY, Span, lap, span, start_laps
+from renderer import RATIONALE_TEMPLATE, RecommendationRenderer, parse_rationale
+
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_MODES = ("crew", "single", "parallel", "template", "template_llm")
+
+PIPELINE_FALLBACKS = REGISTRY.counter(
+    "recommend_fallbacks_total", "Answers completed from the plan records after an LLM deadline, by what was replaced",
+    ("part",))
+
+
+# Output layouts shared by the crew, single-call and parallel prompts
+PLAN_SECTION_FORMAT = """## [EXACT PLAN NAME FROM DATA ABOVE]
+**Insurer:** [EXACT INSURER NAME FROM DATA ABOVE]
+**Premium:** ₹10,000 - ₹25,000 per year (typical range)
+**Sum Insured:** [COPY EXACT TEXT FROM DATA ABOVE]
+
+**Why This Plan:**
+- [Match to user needs]
+- [Coverage highlights]
+- [Value proposition]
+
+**Key Features:**
+- Room rent: [EXACT from data above]
+- Maternity: [EXACT from data above or "Not specified"]
+- CSR: [EXACT from data above]
+- NCB: [EXACT from data above]"""
+
+COMPARISON_FORMAT = """| Feature | [Plan 1 EXACT NAME] | [Plan 2 EXACT NAME] | [Plan 3 EXACT NAME] |
+|---------|---------------------|---------------------|---------------------|
+| Insurer | [EXACT name] | [EXACT name] | [EXACT name] |
+| Annual Premium | ₹XX,000 - ₹XX,000 | ₹XX,000 - ₹XX,000 | ₹XX,000 - ₹XX,000 |
+| Sum Insured | [EXACT from data] | [EXACT from data] | [EXACT from data] |
+| Room Rent Limit | [EXACT from data] | [EXACT from data] | [EXACT from data] |
+| Maternity | [EXACT from data] | [EXACT from data] | [EXACT from data] |
+| NCB | [EXACT from data] | [EXACT from data] | [EXACT from data] |
+| CSR | [EXACT from data] | [EXACT from data] | [EXACT from data] |
+
+Then add:
+## Our Recommendation
+We recommend **[Plan Name]** because [reasons based on user needs]."""
+
+PROFILE_FORMAT = """- Age: {age} years old
+- Pre-existing Conditions: {ped}
+- Annual Budget: ₹{budget}
+- Specific Needs: {needs}
+- Preferences: {preferences}"""
+
+# Prompt templates - compiled once, interpolated by CrewAI at kickoff
+PROFILE_TEMPLATE = """Analyze this user profile:
+""" + PROFILE_FORMAT + """
+
+**CRITICAL: Do NOT make up any information. Only use the data provided.**
+
+Summarize their top 3 requirements in 1-2 lines."""
+
+RECOMMEND_TEMPLATE = """⚠️ STRICT RULES - YOU MUST FOLLOW EXACTLY:
+
+{relevant_context}
+
+**THE 3 PLANS ABOVE ARE THE ONLY PLANS THAT EXIST. DO NOT USE ANY OTHER PLAN NAMES!**
+
+FORBIDDEN COMPANIES (DO NOT MENTION):
+- Future Generali
+- Bajaj Allianz
+- Reliance
+- Tata AIG
+- Max Life
+- Any company NOT in the data above
+
+REQUIRED ACTIONS:
+1. **USE ONLY THE 3 PLANS ABOVE** - No other plan names exist!
+2. **COPY PLAN NAMES EXACTLY** - Character-by-character from data above
+3. **COPY INSURER NAMES EXACTLY** - From the data above only
+4. **COPY ALL VALUES EXACTLY** - Sum insured, CSR, room rent from data above
+5. **IF NOT IN DATA ABOVE, DON'T SAY IT**
+
+For each of THE 3 PLANS PROVIDED ABOVE, write:
+
+""" + PLAN_SECTION_FORMAT
+
+COMPARE_TEMPLATE = """Create comparison table using ONLY the 3 plans from recommendations above.
+
+⛔ FORBIDDEN:
+- Adding companies not in recommendations
+- Making up plan names
+- Empty columns
+
+REQUIRED:
+- Use EXACT plan names as column headers
+- Copy all values from recommendations
+- All 3 columns must have data
+
+""" + COMPARISON_FORMAT
+
+# single mode: profile summary, plan sections and table in one generation
+SINGLE_TEMPLATE = """User profile:
+""" + PROFILE_FORMAT + """
+
+{relevant_context}
+
+**THE PLANS ABOVE ARE THE ONLY PLANS THAT EXIST. DO NOT USE ANY OTHER PLAN OR COMPANY NAMES!**
+COPY plan names, insurer names and all values EXACTLY from the data above. IF NOT IN DATA ABOVE, DON'T SAY IT.
+
+Write, in this order:
+
+### 👤 Your Profile
+[Top 3 requirements in 1-2 lines]
+
+Then for each plan above:
+
+""" + PLAN_SECTION_FORMAT + """
+
+Then a comparison table of the same plans:
+
+""" + COMPARISON_FORMAT
+
+# parallel mode: one plan section per call, run concurrently
+SECTION_TEMPLATE = """User profile:
+""" + PROFILE_FORMAT + """
+
+PLAN DATA (the only facts you may use):
+{plan_context}
+
+**CRITICAL: Do NOT make up any information. COPY names and values EXACTLY from the plan data.**
+
+Write exactly this for the plan above, filled in:
+
+""" + PLAN_SECTION_FORMAT
+
+
+# Agent definitions shared by the CrewAI crews and the streaming path
+PROFILER_SPEC = {
+    'role': 'Health Insurance Needs Analyst',
+    'goal': 'Understand user health insurance requirements',
+    'backstory': 'Expert at analyzing customer needs for health insurance'
+}
+
+RECOMMENDER_SPEC = {
+    'role': 'Insurance Plan Matcher',
+    'goal': 'Match users with best insurance plans from the provided data',
+    'backstory': 'Specialist in comparing insurance plans and finding perfect matches. ONLY uses the exact data provided, never makes up information.'
+}
+
+COMPARER_SPEC = {
+    'role': 'Plan Comparison Specialist',
+    'goal': 'Create clear comparison tables using exact data from recommendations',
+    'backstory': 'Expert at creating accurate comparison tables. Copies data exactly as provided, never invents information.'
+}
+
+
+# Changes whenever a prompt or persona changes; part of the response cache key
+PROMPT_VERSION = hashlib.sha256(
+    repr((PROFILE_TEMPLATE, RECOMMEND_TEMPLATE, COMPARE_TEMPLATE, SINGLE_TEMPLATE,
+          SECTION_TEMPLATE, RATIONALE_TEMPLATE,
+          PROFILER_SPEC, RECOMMENDER_SPEC, COMPARER_SPEC)).encode('utf-8')
+).hexdigest()[:16]
+
+
+def build_llm(seed: Optional[int] = None, call_deadline: Optional[float] = None) -> "BaseLLM":
+    """
+    Crew LLM for the configured Ollama model, on the pooled Ollama client
+
+    Args:
+        seed: Generate deterministically (temperature 0, this seed); None = model defaults
+        call_deadline: Seconds allowed per LLM call (None = no deadline)
+    """
+    # CrewAI takes seconds to import; only crew mode needs it
+    from crew_llm import PooledOllamaLLM
+
+    options = {'temperature': 0, 'seed': seed} if seed is not None else {}
+    return PooledOllamaLLM(
+        model=os.environ.get("OPENAI_MODEL_NAME", "llama3.2"),
+        call_deadline=call_deadline,
+        **options
+    )
+
+
+# Crew task outputs name their agent by role; spans are named by stage
+ROLE_STAGES = {
+    PROFILER_SPEC['role']: 'llm_profile',
+    RECOMMENDER_SPEC['role']: 'llm_recommendations',
+    COMPARER_SPEC['role']: 'llm_comparison',
+}
+
+
+def _task_done(output: Any) -> None:
+    """Crew task callback: time each agent's task as one span"""
+    lap(ROLE_STAGES.get(getattr(output, 'agent', ''), 'llm_task'))
+
+
+def build_crew(llm: Optional["BaseLLM"] = None) -> "Crew":
+    """
+    Create one independent crew (agents + templated tasks)
+
+    Args:
+        llm: LLM shared by the crew's agents (None = CrewAI default from env)
+    """
+    from crewai import Agent, Task, Crew, Process
+
+    agent_options = {'verbose': False, 'allow_delegation': False}
+
+    def agent(spec: Dict[str, str]) -> "Agent":
+        # One LLM object per agent: CrewAI sums token usage over the agents' LLMs
+        options = dict(agent_options, llm=llm.model_copy(deep=True)) if llm is not None else agent_options
+        return Agent(**spec, **options)
+
+    user_profiler = agent(PROFILER_SPEC)
+    recommendation_agent = agent(RECOMMENDER_SPEC)
+    comparison_agent = agent(COMPARER_SPEC)
+
+    profile_task = Task(
+        description=PROFILE_TEMPLATE,
+        agent=user_profiler,
+        expected_output="Brief user requirements summary"
+    )
+
+    recommend_task = Task(
+        description=RECOMMEND_TEMPLATE,
+        agent=recommendation_agent,
+        expected_output="Top 3 plans using ONLY the provided data",
+        context=[profile_task]
+    )
+
+    compare_task = Task(
+        description=COMPARE_TEMPLATE,
+        agent=comparison_agent,
+        expected_output="Comparison table with exact data",
+        context=[profile_task, recommend_task]
+    )
+
+    return Crew(
+        agents=[user_profiler, recommendation_agent, comparison_agent],
+        tasks=[profile_task, recommend_task, compare_task],
+        process=Process.sequential,
+        verbose=False,
+        task_callback=_task_done
+    )
+
+
+def _system_prompt(spec: Dict[str, str]) -> str:
+    """Agent persona in the same shape CrewAI gives it"""
+    return f"You are {spec['role']}. {spec['backstory']}\nYour personal goal is: {spec['goal']}"
+
+
+def _task_prompt(description: str, expected_output: str, context: List[str]) -> str:
+    """Task prompt with the outputs of earlier stages appended as context"""
+    prompt = f"{description}\n\nThis is the expected criteria for your final answer: {expected_output}"
+    if context:
+        prompt += "\n\nThis is the context you're working with:\n" + "\n\n----------\n\n".join(context)
+    return prompt
+
+
+class RecommendationPipeline:
+    """RAG retrieval + pooled CrewAI crews, built once and reused per request"""
+
+    def __init__(self, rag_engine, pool_size: int = 2, deterministic: bool = False, seed: int = 42,
+                 mode: str = "crew", stage_deadline: Optional[float] = None,
+                 run_deadline: Optional[float] = None):
+        """
+        Initialize pipeline
+
+        Args:
+            rag_engine: RAGEngine used for plan retrieval
+            pool_size: Number of crews to pre-build (one per concurrent run)
+            deterministic: Generate with temperature 0 and a fixed seed
+            seed: Seed used in deterministic mode
+            mode: "crew", "single", "parallel", "template" or "template_llm" (see PIPELINE_MODES)
+            stage_deadline: Seconds allowed per LLM call before falling back to the records (None = none)
+            run_deadline: Seconds allowed for a whole run (None = none)
+        """
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{mode}'. Choose from: {', '.join(PIPELINE_MODES)}")
+
+        self.rag_engine = rag_engine
+        self.pool_size = max(1, pool_size)
+        self.deterministic = deterministic
+        self.seed = seed
+        self.mode = mode
+        self.stage_deadline = stage_deadline
+        self.run_deadline = run_deadline
+
+        # Crews are only needed when the LLM writes the whole answer
+        self._crews: "queue.Queue[Crew]" = queue.Queue()
+        # Background runs (batch, precompute) never take the last free crew
+        self._background_crews = threading.BoundedSemaphore(max(1, self.pool_size - 1))
+        if mode == "crew":
+            for _ in range(self.pool_size):
+                self._crews.put(build_crew(build_llm(seed if deterministic else None, stage_deadline)))
+
+        self.renderer = RecommendationRenderer(rag_engine.catalogue)
+
+        # Streaming path talks to Ollama directly through the pooled client
+        self.llm_model = os.environ.get("OPENAI_MODEL_NAME", "llama3.2")
+        self._llm = shared_client()
+        self._llm_options = {'temperature': 0, 'seed': seed} if deterministic else None
+
+    @contextmanager
+    def checkout(self) -> Iterator["Crew"]:
+        """Borrow a crew for exclusive use; blocks until one is free"""
+        background = current_priority() != INTERACTIVE
+        if background:
+            self._background_crews.acquire()
+        try:
+            crew = self._crews.get()
+            try:
+                yield crew
+            finally:
+                self._crews.put(crew)
+        finally:
+            if background:
+                self._background_crews.release()
+
+    @property
+    def uses_llm(self) -> bool:
+        return self.mode != "template"
+
+    def warm_up(self) -> None:
+        """Load the generation model with a one-token request; raises if Ollama is unreachable"""
+        if self.uses_llm:
+            self._llm.chat(
+                model=self.llm_model,
+                messages=[{'role': 'user', 'content': 'ok'}],
+                options={'num_predict': 1}
+            )
+
+    def reload_catalogue(self) -> None:
+        """Re-read plan records for rendering (after the data file changed)"""
+        self.renderer = RecommendationRenderer(self.rag_engine.catalogue)
+
+    def answer_versions(self, data_version: Optional[str]) -> Dict[str, Any]:
+        """Everything besides the profile that an answer depends on (response cache keys, precomputed answers)"""
+        return {
+            'data_version': data_version,
+            'prompt_version': PROMPT_VERSION,
+            'pipeline_mode': self.mode,
+            'ranking': self.rag_engine.ranking,
+            'llm_model': self.llm_model,
+            'embedding_model': self.rag_engine.embedding_model,
+            'context_tokens': self.rag_engine.context_tokens,
+            'deterministic': self.deterministic,
+            'seed': self.seed
+        }
+
+    def run(self, user_profile: Dict[str, str], top_k: int = 3) -> str:
+        """
+        Retrieve relevant plans and run the crew for one user profile
+
+        Args:
+            user_profile: Dict with age, ped, budget, needs, preferences
+            top_k: Number of plans to retrieve
+
+        Returns:
+            Raw crew output (recommendations + comparison table)
+        """
+        return self.run_with_usage(user_profile, top_k)[0]
+
+    def run_with_usage(self, user_profile: Dict[str, str], top_k: int = 3) -> Tuple[str, Dict[str, int]]:
+        """
+        run(), also returning LLM usage: {'llm_calls', 'prompt_tokens', 'completion_tokens'}
+
+        Non-crew modes share the streaming code path and keep its final answer.
+        """
+        if self.mode != "crew":
+            for event, payload in self.stream(user_profile, top_k):
+                if event == 'done':
+                    return payload['recommendations'], payload['usage']
+
+        inputs = self._build_inputs(user_profile, top_k)
+
+        try:
+            with deadline(self.run_deadline, "run"), self.checkout() as crew, span("crew") as timing:
+                start_laps()
+                result = crew.kickoff(inputs=inputs)
+
+                # CrewAI only reports token usage for the whole run
+                metrics = getattr(result, 'token_usage', None)
+                usage = {
+                    'llm_calls': getattr(metrics, 'successful_requests', 0),
+                    'prompt_tokens': getattr(metrics, 'prompt_tokens', 0),
+                    'completion_tokens': getattr(metrics, 'completion_tokens', 0)
+                }
+                timing.add_tokens(usage['prompt_tokens'], usage['completion_tokens'])
+        except DeadlineExceeded as e:
+            return self._fallback_answer(user_profile, top_k, e), _new_usage()
+        return str(result), usage
+
+    def stream(self, user_profile: Dict[str, str], top_k: int = 3) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Run the three stages sequentially, yielding events as tokens arrive
+
+        Args:
+            user_profile: Dict with age, ped, budget, needs, preferences
+            top_k: Number of plans to retrieve
+
+        Yields:
+            (event, payload) tuples:
+            - ("stage", {"stage"}) when a stage starts
+            - ("token", {"stage", "text"}) for every generated chunk
+            - ("profile", {"text"}) once the profile summary is complete
+            - ("section", {"index", "text"}) for each finished plan section
+            - ("comparison", {"text"}) once the comparison table is complete
+            - ("done", {"recommendations", "usage"}) with the assembled Markdown
+
+            Template and parallel modes emit each finished block as a single token event.
+            After a deadline, "done" carries the template answer and a `fallback` reason.
+        """
+        try:
+            with deadline(self.run_deadline, "run"):
+                if self.mode in ("template", "template_llm"):
+                    yield from self._stream_rendered(user_profile, top_k)
+                elif self.mode == "single":
+                    yield from self._stream_single(user_profile, top_k)
+                elif self.mode == "parallel":
+                    yield from self._stream_parallel(user_profile, top_k)
+                else:
+                    yield from self._stream_crew(user_profile, top_k)
+        except DeadlineExceeded as e:
+            yield 'done', {
+                'recommendations': self._fallback_answer(user_profile, top_k, e),
+                'usage': _new_usage(),
+                'fallback': str(e)
+            }
+
+    def _fallback_answer(self, user_profile: Dict[str, str], top_k: int, error: DeadlineExceeded) -> str:
+        """Template answer for a run that ran out of time; the LLM output so far is discarded"""
+        logger.warning(f"⏱️ {error}, answering from the plan records")
+        PIPELINE_FALLBACKS.inc(part='answer')
+        scope = current_scope()
+        if scope is not None:
+            record_waste(scope.take_llm_seconds(), error.reason)
+        return self.render_answer(user_profile, top_k)
+
+    def _stream_crew(self, user_profile: Dict[str, str], top_k: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """stream() for crew mode: the crew's three stages, each streamed from Ollama"""
+        usage = _new_usage()
+        inputs = self._build_inputs(user_profile, top_k)
+
+        profile = yield from self._stream_stage(
+            'profile', PROFILER_SPEC,
+            _task_prompt(PROFILE_TEMPLATE.format(**inputs), "Brief user requirements summary", []),
+            usage
+        )
+        yield 'profile', {'text': profile}
+
+        recommendations = yield from self._stream_sections(
+            'recommendations', RECOMMENDER_SPEC,
+            _task_prompt(RECOMMEND_TEMPLATE.format(**inputs), "Top 3 plans using ONLY the provided data", [profile]),
+            usage
+        )
+
+        comparison = yield from self._stream_stage(
+            'comparison', COMPARER_SPEC,
+            _task_prompt(COMPARE_TEMPLATE, "Comparison table with exact data", [profile, recommendations]),
+            usage
+        )
+        yield 'comparison', {'text': comparison}
+
+        yield 'done', {'recommendations': f"{recommendations.strip()}\n\n{comparison.strip()}", 'usage': usage}
+
+    def _stream_single(self, user_profile: Dict[str, str], top_k: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """stream() for single mode: the whole answer from one prompt"""
+        usage = _new_usage()
+        inputs = self._build_inputs(user_profile, top_k)
+
+        answer = yield from self._stream_sections(
+            'recommendations', RECOMMENDER_SPEC,
+            _task_prompt(SINGLE_TEMPLATE.format(**inputs), "Profile summary, plan sections and comparison table", []),
+            usage
+        )
+
+        yield 'done', {'recommendations': answer.strip(), 'usage': usage}
+
+    def _stream_parallel(self, user_profile: Dict[str, str], top_k: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        stream() for parallel mode
+
+        Each plan section is generated by its own call with only that plan's
+        data, all calls in flight at once; sections are emitted in rank order
+        as they finish. The comparison table is rendered from the records.
+        """
+        contexts = self.rag_engine.plan_contexts(user_profile, top_k=top_k)
+        plan_ids = self.plan_ids(user_profile, top_k)
+        inputs = self._build_inputs(user_profile, top_k, context=False)
+
+        yield 'stage', {'stage': 'recommendations'}
+        usages = [_new_usage() for _ in contexts]
+        with ThreadPoolExecutor(max_workers=max(1, len(contexts))) as pool:
+            futures = [
+                pool.submit(
+                    contextvars.copy_context().run,
+                    self._complete, 'section', RECOMMENDER_SPEC,
+                    _task_prompt(SECTION_TEMPLATE.format(**inputs, plan_context=context),
+                                 "One plan section using ONLY the provided data", []),
+                    usage
+                )
+                for context, usage in zip(contexts, usages)
+            ]
+            sections = []
+            rendered = None
+            for index, future in enumerate(futures):
+                try:
+                    section = future.result().strip()
+                except DeadlineExceeded as e:
+                    # Keep the sections that made it; render the late ones from the records
+                    if rendered is None:
+                        with span("render"):
+                            rendered = self.renderer.render(plan_ids, user_profile)[0]
+                    if index >= len(rendered):
+                        raise
+                    logger.warning(f"⏱️ {e}, rendering plan section {index + 1} from the records")
+                    PIPELINE_FALLBACKS.inc(part='section')
+                    section = rendered[index]
+                sections.append(section)
+                yield 'token', {'stage': 'recommendations', 'text': section + '\n\n'}
+                yield 'section', {'index': index, 'text': section}
+
+        with span("render"):
+            comparison = self.renderer.render_comparison(
+                plan_ids, {plan_id: self.renderer.rule_reasons(plan_id, ProfileNeeds(user_profile)) for plan_id in plan_ids}
+            )
+        yield 'stage', {'stage': 'comparison'}
+        yield 'token', {'stage': 'comparison', 'text': comparison}
+        yield 'comparison', {'text': comparison}
+
+        usage = _new_usage()
+        for part in usages:
+            _merge_usage(usage, part)
+        yield 'done', {'recommendations': _join_answer(sections, comparison), 'usage': usage}
+
+    def _render(self, user_profile: Dict[str, str], top_k: int,
+                usage: Dict[str, int]) -> Tuple[List[str], str]:
+        """Template modes: rank plans, then render sections + comparison from the records"""
+        plan_ids = self.plan_ids(user_profile, top_k)
+        reasons = self._rationale(plan_ids, user_profile, usage) if self.mode == "template_llm" else None
+        with span("render"):
+            return self.renderer.render(plan_ids, user_profile, reasons)
+
+    def render_answer(self, user_profile: Dict[str, str], top_k: int = 3) -> str:
+        """Template answer rendered from the plan records (no LLM); used to repair a rejected answer"""
+        plan_ids = self.plan_ids(user_profile, top_k)
+        with span("render"):
+            sections, comparison = self.renderer.render(plan_ids, user_profile)
+        return _join_answer(sections, comparison)
+
+    def _stream_rendered(self, user_profile: Dict[str, str], top_k: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """stream() for the template modes; same events, one token per rendered block"""
+        usage = _new_usage()
+        yield 'stage', {'stage': 'recommendations'}
+        sections, comparison = self._render(user_profile, top_k, usage)
+        for index, section in enumerate(sections):
+            yield 'token', {'stage': 'recommendations', 'text': section + '\n\n'}
+            yield 'section', {'index': index, 'text': section}
+
+        yield 'stage', {'stage': 'comparison'}
+        yield 'token', {'stage': 'comparison', 'text': comparison}
+        yield 'comparison', {'text': comparison}
+
+        yield 'done', {'recommendations': _join_answer(sections, comparison), 'usage': usage}
+
+    def plan_ids(self, user_profile: Dict[str, str], top_k: int) -> List[str]:
+        """Ranked plan ids for a profile (falls back to plan name for indexes without plan_id)"""
+        by_name = {plan['plan_name']: plan_id for plan_id, (_, plan) in self.renderer.plans.items()}
+        plan_ids = []
+        for plan in self.rag_engine.relevant_plans(user_profile, top_k=top_k):
+            metadata = plan['metadata']
+            plan_id = metadata.get('plan_id') or by_name.get(metadata.get('plan_name'))
+            if plan_id in self.renderer.plans:
+                plan_ids.append(plan_id)
+        return plan_ids
+
+    def _rationale(self, plan_ids: List[str], user_profile: Dict[str, str],
+                   usage: Dict[str, int]) -> Dict[str, List[str]]:
+        """One JSON-mode LLM call for the "Why This Plan" bullets; {} on failure or deadline"""
+        try:
+            with deadline(self.stage_deadline, "llm_rationale"), span("llm_rationale") as timing:
+                response = self._llm.chat(
+                    model=self.llm_model,
+                    messages=[
+                        {'role': 'system', 'content': _system_prompt(RECOMMENDER_SPEC)},
+                        {'role': 'user', 'content': self.renderer.rationale_prompt(plan_ids, user_profile)}
+                    ],
+                    format='json',
+                    options=self._llm_options
+                )
+                _add_usage(usage, response, timing)
+        except DeadlineExceeded as e:
+            logger.warning(f"⏱️ {e}, using rule-based reasons")
+            PIPELINE_FALLBACKS.inc(part='rationale')
+            return {}
+        except Exception as e:
+            logger.warning(f"⚠️  Rationale generation failed, using rule-based reasons: {e}")
+            return {}
+        return parse_rationale(response['message']['content'], plan_ids)
+
+    def _build_inputs(self, user_profile: Dict[str, str], top_k: int, context: bool = True) -> Dict[str, str]:
+        """Retrieve plan context and assemble the template inputs (context=False: profile only)"""
+        relevant_context = self.rag_engine.get_relevant_context(user_profile, top_k=top_k) if context else ''
+
+        # Log what RAG is sending (formatted only when DEBUG is on)
+        logger.debug("RAG context being sent to LLM:\n%.500s...", relevant_context)
+
+        return {
+            'age': user_profile.get('age', ''),
+            'ped': user_profile.get('ped', ''),
+            'budget': user_profile.get('budget', ''),
+            'needs': user_profile.get('needs', ''),
+            'preferences': user_profile.get('preferences', ''),
+            'relevant_context': relevant_context
+        }
+
+    def _stream_stage(self, stage: str, spec: Dict[str, str], prompt: str, usage: Dict[str, int]):
+        """Stream one stage from Ollama; yields token events, returns the full text"""
+        yield 'stage', {'stage': stage}
+
+        text = ''
+        with deadline(self.stage_deadline, f"llm_{stage}"), span(f"llm_{stage}") as timing:
+            for chunk in self._llm.chat(
+                model=self.llm_model,
+                messages=[
+                    {'role': 'system', 'content': _system_prompt(spec)},
+                    {'role': 'user', 'content': prompt}
+                ],
+                stream=True,
+                options=self._llm_options
+            ):
+                token = chunk['message']['content']
+                if token:
+                    text += token
+                    yield 'token', {'stage': stage, 'text': token}
+                if chunk.get('done'):
+                    _add_usage(usage, chunk, timing)
+
+        return text
+
+    def _stream_sections(self, stage: str, spec: Dict[str, str], prompt: str, usage: Dict[str, int]):
+        """_stream_stage() that also emits each "## " section as soon as the next one begins"""
+        text = ''
+        emitted = 0
+        for event, payload in self._stream_stage(stage, spec, prompt, usage):
+            yield event, payload
+            if event != 'token':
+                continue
+            text += payload['text']
+            if '\n' not in payload['text']:
+                continue
+            sections = _split_sections(text)
+            while emitted < len(sections) - 1:
+                yield 'section', {'index': emitted, 'text': sections[emitted]}
+                emitted += 1
+        sections = _split_sections(text)
+        for index in range(emitted, len(sections)):
+            yield 'section', {'index': index, 'text': sections[index]}
+        return text
+
+    def _complete(self, stage: str, spec: Dict[str, str], prompt: str, usage: Dict[str, int]) -> str:
+        """One non-streaming generation"""
+        with deadline(self.stage_deadline, f"llm_{stage}"), span(f"llm_{stage}") as timing:
+            response = self._llm.chat(
+                model=self.llm_model,
+                messages=[
+                    {'role': 'system', 'content': _system_prompt(spec)},
+                    {'role': 'user', 'content': prompt}
+                ],
+                options=self._llm_options
+            )
+            _add_usage(usage, response, timing)
+        return response['message']['content']
+
+
+def _new_usage() -> Dict[str, int]:
+    return {'llm_calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+
+def _add_usage(usage: Dict[str, int], response: Any, timing: Optional[Span] = None) -> None:
+    """Add one Ollama response's token counts (final chunk when streaming) to usage and its span"""
+    prompt_tokens = response.get('prompt_eval_count') or 0
+    completion_tokens = response.get('eval_count') or 0
+    usage['llm_calls'] += 1
+    usage['prompt_tokens'] += prompt_tokens
+    usage['completion_tokens'] += completion_tokens
+    if timing is not None:
+        timing.add_tokens(prompt_tokens, completion_tokens)
+
+
+def _merge_usage(usage: Dict[str, int], other: Dict[str, int]) -> None:
+    for key, value in other.items():
+        usage[key] += value
+
+
+def _join_answer(sections: List[str], comparison: str) -> str:
+    """Rendered sections + comparison in the same shape as the crew's answer"""
+    return '\n\n'.join(sections + [comparison])
+
+
+def _split_sections(markdown: str) -> List[str]:
+    """Split Markdown into blocks that each start at a '## ' heading"""
+    sections: List[str] = []
+    current: List[str] = []
+    for line in markdown.split('\n'):
+        if line.startswith('## ') and current:
+            block = '\n'.join(current).strip()
+            if block:
+                sections.append(block)
+            current = []
+        current.append(line)
+    block = '\n'.join(current).strip()
+    if block:
+        sections.append(block)
+    return sections
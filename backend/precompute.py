@@ -0,0 +1,374 @@
+"""
+Precomputed answers for bucketed form profiles
+
+Most form submissions are built from the form's chips: a PED option, one or
+two "Specific Needs" and "Preferred Features" chips, plus an age and a
+budget. Such a profile maps to a bucket (age band, PED, budget band,
+needs, preferences); a profile with free text anywhere does not, and is
+always answered live.
+
+The precompute job enumerates the buckets, runs one representative
+profile per bucket through the normal pipeline (batched retrieval, the
+configured PIPELINE_MODE, the answer check) and stores the answers in a
+SQLite table keyed on (version, bucket). The version hashes everything an
+answer depends on besides the profile (see
+RecommendationPipeline.answer_versions), so a catalogue, prompt or model
+change makes the old rows unused; the job then fills in the new version.
+At serving time the table for the current version is held in a dict, and
+a lookup is one profile parse plus one dict access.
+
+A precomputed answer's profile summary shows the bucket (e.g. "Age: 36-45
+years old", "Budget: ₹15000-25000") rather than the user's exact input.
+Answers the check flags are not stored; those buckets are served live.
+
+Usage:
+    python precompute.py                      # fill in missing buckets
+    python precompute.py --max-chips 2 --concurrency 2
+    python precompute.py --dry-run            # count buckets only
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from itertools import combinations, product
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from batch_recommend import DEFAULT_BATCH_SIZE, BatchRecommender
+from response_cache import make_cache_key
+from rag.plan_filter import NO_PED_ANSWERS, parse_budget
+from rag.query_cache import normalize_text
+from rag.telemetry import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# (label, youngest, oldest); older or younger profiles are answered live
+AGE_BANDS = (("18-35", 18, 35), ("36-45", 36, 45), ("46-60", 46, 60), ("61-75", 61, 75))
+# (label, highest budget in the band); the first band is LOW_BUDGET and below
+BUDGET_BANDS = (("Up to 15000", 15000), ("15000-25000", 25000), ("25000-50000", 50000))
+# The form's chips (frontend/app/recommend/page.tsx), in display order
+PED_OPTIONS = ("None", "Diabetes", "Hypertension", "Thyroid", "Asthma", "Heart Disease")
+NEED_OPTIONS = ("Maternity coverage", "No room rent limit", "OPD coverage", "Dental & Vision", "Mental health")
+PREFERENCE_OPTIONS = ("Wellness rewards", "High CSR", "Quick claims", "Cashless hospitals", "No waiting period")
+
+# Chips combined in one needs/preferences field (the grid grows fast: 1 -> 1,800 buckets, 2 -> 16,200)
+DEFAULT_MAX_CHIPS = int(os.getenv("PRECOMPUTE_MAX_CHIPS", "1"))
+DEFAULT_PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "1"))
+
+_PED_CHIPS = {normalize_text(option): option for option in PED_OPTIONS}
+_NEED_CHIPS = {normalize_text(option): option for option in NEED_OPTIONS}
+_PREFERENCE_CHIPS = {normalize_text(option): option for option in PREFERENCE_OPTIONS}
+_SEPARATOR = '|'
+
+
+def answer_version(versions: Dict[str, Any]) -> str:
+    """Short hash of RecommendationPipeline.answer_versions()"""
+    return make_cache_key(None, **versions)[:16]
+
+
+def _chips(text: Any, options: Dict[str, str], order: Tuple[str, ...]) -> Optional[str]:
+    """Comma-separated chips in display order, or None if anything else was typed"""
+    chosen = set()
+    for part in str(text or '').split(','):
+        part = normalize_text(part)
+        if not part:
+            continue
+        if part not in options:
+            return None
+        chosen.add(options[part])
+    if not chosen:
+        return None
+    return ', '.join(option for option in order if option in chosen)
+
+
+def profile_bucket(user_profile: Dict[str, str]) -> Optional[str]:
+    """
+    Bucket of a form profile
+
+    Args:
+        user_profile: Dict with age, ped, budget, needs, preferences
+
+    Returns:
+        Bucket id ("age|ped|budget|needs|preferences" labels), or None when
+        a field is free text or out of the bucketed ranges
+    """
+    age = str(user_profile.get('age') or '').strip()
+    if not re.fullmatch(r'\d{1,3}', age):
+        return None
+    age_band = next((label for label, low, high in AGE_BANDS if low <= int(age) <= high), None)
+
+    ped = normalize_text(user_profile.get('ped'))
+    ped = 'None' if ped in NO_PED_ANSWERS else _PED_CHIPS.get(ped)
+
+    budget = parse_budget(user_profile.get('budget'))[1]
+    budget_band = None
+    if budget is not None:
+        budget_band = next((label for label, high in BUDGET_BANDS if budget <= high), None)
+
+    needs = _chips(user_profile.get('needs'), _NEED_CHIPS, NEED_OPTIONS)
+    preferences = _chips(user_profile.get('preferences'), _PREFERENCE_CHIPS, PREFERENCE_OPTIONS)
+
+    parts = (age_band, ped, budget_band, needs, preferences)
+    if any(part is None for part in parts):
+        return None
+    return _SEPARATOR.join(parts)
+
+
+def bucket_profile(bucket: str) -> Dict[str, str]:
+    """Representative profile of a bucket (the band labels stand in for age and budget)"""
+    age, ped, budget, needs, preferences = bucket.split(_SEPARATOR)
+    return {'age': age, 'ped': ped, 'budget': budget, 'needs': needs, 'preferences': preferences}
+
+
+def enumerate_buckets(max_chips: int = DEFAULT_MAX_CHIPS) -> Iterator[str]:
+    """Every bucket with up to max_chips needs and preferences chips"""
+    def subsets(options: Tuple[str, ...]) -> List[str]:
+        return [', '.join(combo) for size in range(1, max_chips + 1) for combo in combinations(options, size)]
+
+    for age, ped, budget, needs, preferences in product(
+            [label for label, _, _ in AGE_BANDS], PED_OPTIONS, [label for label, _ in BUDGET_BANDS],
+            subsets(NEED_OPTIONS), subsets(PREFERENCE_OPTIONS)):
+        yield _SEPARATOR.join((age, ped, budget, needs, preferences))
+
+
+class PrecomputedAnswers:
+    """Answers per (version, bucket) in a SQLite file; one version is served from memory"""
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        """
+        Open (or create) the answer table
+
+        Args:
+            path: SQLite file (parent directories are created)
+            busy_timeout: Seconds to wait for another process's write lock
+        """
+        self.path = path
+        self.version: Optional[str] = None
+        self._answers: Dict[str, str] = {}
+        self._seen: Optional[Tuple[str, int]] = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS precomputed ("
+            "version TEXT NOT NULL, bucket TEXT NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (version, bucket))"
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def get(self, bucket: str) -> Optional[str]:
+        """Answer for a bucket of the loaded version"""
+        return self._answers.get(bucket)
+
+    def lookup(self, user_profile: Dict[str, str]) -> Optional[str]:
+        """Answer for a form profile, or None (not bucketable, or not precomputed)"""
+        bucket = profile_bucket(user_profile)
+        return self._answers.get(bucket) if bucket is not None else None
+
+    def load(self, version: str) -> bool:
+        """
+        Serve this version's answers; re-reads only when the version changed or
+        another process wrote to the file since the last load
+
+        Returns:
+            True if the in-memory table was (re)loaded
+        """
+        with self._lock:
+            # data_version changes when another connection commits
+            seen = (version, self._db.execute("PRAGMA data_version").fetchone()[0])
+            if seen == self._seen:
+                return False
+            rows = self._db.execute(
+                "SELECT bucket, answer FROM precomputed WHERE version = ?", (version,)
+            ).fetchall()
+            self._answers = dict(rows)
+            self.version = version
+            self._seen = seen
+            return True
+
+    def clear(self) -> None:
+        """Stop serving until the next load() (the answers' version is out of date)"""
+        with self._lock:
+            self._answers = {}
+            self.version = None
+            self._seen = None
+
+    def stored(self, version: str) -> Set[str]:
+        """Buckets that already have an answer for a version"""
+        with self._lock:
+            rows = self._db.execute("SELECT bucket FROM precomputed WHERE version = ?", (version,)).fetchall()
+        return {row[0] for row in rows}
+
+    def put_many(self, version: str, items: Iterable[Tuple[str, str]]) -> None:
+        """Store (bucket, answer) pairs in one transaction; served at once if version is loaded"""
+        now = time.time()
+        rows = [(version, bucket, answer, now) for bucket, answer in items]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO precomputed (version, bucket, answer, created_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+            if version == self.version:
+                answers = dict(self._answers)
+                answers.update((bucket, answer) for _, bucket, answer, _ in rows)
+                self._answers = answers
+
+    def prune(self, keep_version: str) -> int:
+        """Delete the answers of every other version; returns the rows removed"""
+        with self._lock:
+            removed = self._db.execute("DELETE FROM precomputed WHERE version != ?", (keep_version,)).rowcount
+            self._db.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {'version': self.version, 'answers': len(self._answers)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def precompute(pipeline, store: PrecomputedAnswers, version: str,
+               validate: Optional[Callable[[Dict[str, str], str], Tuple[str, Dict[str, Any]]]] = None,
+               concurrency: int = DEFAULT_PRECOMPUTE_CONCURRENCY, max_chips: int = DEFAULT_MAX_CHIPS,
+               limit: Optional[int] = None, should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    """
+    Answer every bucket that has no answer for this version yet
+
+    Args:
+        pipeline: RecommendationPipeline that produces the answers
+        store: Where answers are written
+        version: answer_version() of the pipeline's current configuration
+        validate: Check of (profile, answer) returning the answer to keep and its
+            report; answers whose report is not ok (and were not repaired) are skipped
+        concurrency: Pipeline runs in flight at once
+        max_chips: Needs/preferences chips per bucket
+        limit: Stop after this many buckets (None = all missing)
+        should_stop: Polled after each answer; True stops the job (e.g. the version changed)
+
+    Returns:
+        Counts of buckets, missing, stored, skipped and failed; stopped flag and seconds
+    """
+    start = time.perf_counter()
+    buckets = list(enumerate_buckets(max_chips))
+    done = store.stored(version)
+    missing = [bucket for bucket in buckets if bucket not in done]
+    if limit is not None:
+        missing = missing[:limit]
+    stats = {'buckets': len(buckets), 'missing': len(missing), 'stored': 0, 'skipped': 0, 'failed': 0,
+             'stopped': False}
+    if not missing:
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        return stats
+
+    batch = BatchRecommender(pipeline, batch_size=DEFAULT_BATCH_SIZE, concurrency=concurrency, validate=validate)
+    lines = (json.dumps({'id': bucket, **bucket_profile(bucket)}) for bucket in missing)
+    pending: List[Tuple[str, str]] = []
+    run = batch.run(lines)
+    try:
+        for result in run:
+            report = result.get('validation', {'ok': True})
+            if 'error' in result:
+                stats['failed'] += 1
+                logger.warning(f"⚠️ Precompute failed for {result['id']}: {result['error']}")
+            elif report['ok'] or report.get('action') in ('repaired', 'regenerated'):
+                pending.append((result['id'], result['recommendations']))
+            else:
+                stats['skipped'] += 1
+
+            if len(pending) >= 32:
+                store.put_many(version, pending)
+                stats['stored'] += len(pending)
+                pending = []
+            if should_stop is not None and should_stop():
+                stats['stopped'] = True
+                break
+    finally:
+        # Cancels the runs that have not started
+        run.close()
+        store.put_many(version, pending)
+        stats['stored'] += len(pending)
+
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute answers for every bucketed form profile")
+    parser.add_argument('--output', default=os.getenv("PRECOMPUTED_PATH", os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "cache", "precomputed.sqlite3")), help="SQLite answer table")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_PRECOMPUTE_CONCURRENCY,
+                        help="Pipeline runs in flight at once")
+    parser.add_argument('--max-chips', type=int, default=DEFAULT_MAX_CHIPS,
+                        help="Needs/preferences chips combined per bucket")
+    parser.add_argument('--limit', type=int, help="Answer at most this many missing buckets")
+    parser.add_argument('--mode', default=os.getenv("PIPELINE_MODE", "crew").lower(),
+                        help="Pipeline mode (default: PIPELINE_MODE; must match the API's)")
+    # Same default as the API, so the answers get the version the API serves
+    parser.add_argument('--deterministic', action=argparse.BooleanOptionalAction,
+                        default=os.getenv("LLM_DETERMINISTIC", "0") == "1" or os.getenv("RESPONSE_CACHE", "off").lower() != "off",
+                        help="Temperature 0 + fixed seed (default: on if LLM_DETERMINISTIC=1 or RESPONSE_CACHE is set)")
+    parser.add_argument('--keep-old', action='store_true', help="Keep answers of other versions")
+    parser.add_argument('--dry-run', action='store_true', help="Only count the buckets")
+    args = parser.parse_args()
+
+    configure_logging(asynchronous=False)
+    if args.dry_run:
+        logger.info(f"📦 {sum(1 for _ in enumerate_buckets(args.max_chips))} buckets with up to {args.max_chips} chip(s)")
+        return
+
+    os.environ.setdefault("OPENAI_API_BASE", "http://localhost:11434/v1")
+    os.environ.setdefault("OPENAI_MODEL_NAME", "llama3.2")
+    os.environ.setdefault("OPENAI_API_KEY", "ollama")
+
+    from pipeline import RecommendationPipeline
+    from rag.rag_engine import RAGEngine
+    from validator import AnswerValidator
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    rag_engine = RAGEngine(
+        data_path=os.getenv("DATA_PATH", os.path.join(backend_dir, "data", "indian_health_insurance_data.json")),
+        store_dir=os.getenv("RAG_STORE_DIR", os.path.join(backend_dir, "rag"))
+    )
+    if not rag_engine.retriever.is_ready() and not rag_engine.retriever.reload():
+        raise SystemExit("❌ Vector database not found. Run rag/setup_embeddings.py first.")
+
+    pipeline = RecommendationPipeline(
+        rag_engine,
+        pool_size=args.concurrency,
+        deterministic=args.deterministic,
+        seed=int(os.getenv("LLM_SEED", "42")),
+        mode=args.mode
+    )
+    current = rag_engine.catalogue
+    validator = AnswerValidator(current)
+    version = answer_version(pipeline.answer_versions(current.version))
+
+    def validate(profile: Dict[str, str], text: str) -> Tuple[str, Dict[str, Any]]:
+        return text, validator.check(text, pipeline.plan_ids(profile, 3), profile)
+
+    store = PrecomputedAnswers(args.output)
+    try:
+        stats = precompute(pipeline, store, version, validate=validate, concurrency=args.concurrency,
+                           max_chips=args.max_chips, limit=args.limit)
+        if not args.keep_old:
+            stats['pruned'] = store.prune(version)
+    finally:
+        store.close()
+    logger.info(f"✅ Precomputed answers for version {version}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark the retrieval backends against each other
+
+Builds each backend from the same synthetic embeddings in a temporary
+directory and times single-query and batched search. No Ollama needed.
+
+Usage:
+    python benchmark_retrievers.py --vectors 9 --queries 200
+    python benchmark_retrievers.py --vectors 5000 --dim 768 --batch 64
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from retrievers import RETRIEVERS, make_retriever
+
+
+def synthetic_records(n: int, dim: int, seed: int = 0) -> Dict[str, List]:
+    rng = np.random.default_rng(seed)
+    return {
+        'ids': [f"plan_{i}" for i in range(n)],
+        'embeddings': rng.standard_normal((n, dim)).astype(np.float32).tolist(),
+        'documents': [f"Synthetic plan {i}" for i in range(n)],
+        'metadatas': [{'plan_name': f"Plan {i}"} for i in range(n)]
+    }
+
+
+def time_backend(name: str, records: Dict[str, List], queries: np.ndarray,
+                 top_k: int, batch: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        retriever = make_retriever(name, path=os.path.join(tmp, name))
+
+        start = time.perf_counter()
+        retriever.build(**records)
+        build_s = time.perf_counter() - start
+
+        # Warm-up
+        retriever.search(queries[0], top_k=top_k)
+
+        start = time.perf_counter()
+        for q in queries:
+            retriever.search(q, top_k=top_k)
+        single_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, len(queries), batch):
+            retriever.search_batch(queries[i:i + batch], top_k=top_k)
+        batch_s = time.perf_counter() - start
+
+    return {
+        'build_ms': build_s * 1000,
+        'single_ms_per_query': single_s * 1000 / len(queries),
+        'batched_ms_per_query': batch_s * 1000 / len(queries)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval backends")
+    parser.add_argument('--vectors', type=int, default=9, help="Indexed vectors (default: 9 plans)")
+    parser.add_argument('--dim', type=int, default=768, help="Embedding dimension (nomic-embed-text: 768)")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--backends', nargs='+', default=list(RETRIEVERS))
+    args = parser.parse_args()
+
+    records = synthetic_records(args.vectors, args.dim)
+    queries = np.random.default_rng(1).standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    print(f"📊 {args.vectors} vectors x {args.dim} dims, {args.queries} queries, top-{args.top_k}\n")
+    print(f"{'Backend':<10} {'Build (ms)':>12} {'Single (ms/q)':>15} {'Batched (ms/q)':>16}")
+    for name in args.backends:
+        result = time_backend(name, records, queries, args.top_k, args.batch)
+        print(f"{name:<10} {result['build_ms']:>12.2f} {result['single_ms_per_query']:>15.4f} "
+              f"{result['batched_ms_per_query']:>16.4f}")
+
+
+if __name__ == "__main__":
+    main()
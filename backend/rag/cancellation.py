@@ -0,0 +1,219 @@
+"""
+Cancellation scopes and deadlines for blocking pipeline runs
+
+A run's LLM calls hold a worker thread for seconds to minutes. The API
+gives each run a CancelScope, held in a context variable so it follows the
+run onto the admission and pipeline threads. The Ollama client waits on
+every call through the current scope. Cancelling the scope (the client
+went away) or passing its deadline aborts the in-flight HTTP request and
+raises in the waiting thread.
+
+Scopes nest: deadline() opens a child scope that expires at its own
+deadline or its parent's, whichever comes first, and is cancelled along
+with its parent.
+
+Cancelled derives from BaseException, like asyncio.CancelledError, so the
+`except Exception` fallbacks in the pipeline and inside CrewAI do not
+swallow it.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+try:
+    from .telemetry import REGISTRY
+except ImportError:  # imported as a top-level module (setup_embeddings.py)
+    from telemetry import REGISTRY
+
+LLM_WASTED_SECONDS = REGISTRY.counter(
+    "llm_wasted_seconds_total", "Generation time whose output was thrown away, by reason (disconnect, deadline)",
+    ("reason",))
+
+
+class Cancelled(BaseException):
+    """Raised in a run whose scope was cancelled"""
+
+    reason = 'cancelled'
+
+    def __init__(self, message: str, reason: Optional[str] = None):
+        super().__init__(message)
+        if reason is not None:
+            self.reason = reason
+
+
+class DeadlineExceeded(Cancelled):
+    """Raised in a run whose scope (or an enclosing one) ran out of time"""
+
+    reason = 'deadline'
+
+
+_current: contextvars.ContextVar[Optional["CancelScope"]] = contextvars.ContextVar("cancel_scope", default=None)
+
+
+class CancelScope:
+    """Cancellation flag + optional deadline shared by everything a run calls"""
+
+    def __init__(self, timeout: Optional[float] = None, name: str = "run",
+                 parent: Optional["CancelScope"] = None):
+        """
+        Initialize scope
+
+        Args:
+            timeout: Seconds until the scope expires (None = no deadline of its own)
+            name: Shown in the DeadlineExceeded message
+            parent: Enclosing scope; its cancellation and deadline apply here too
+        """
+        self.name = name
+        self.parent = parent
+        self.error: Optional[Cancelled] = None
+        # Generation seconds of the calls that finished (kept on the root scope)
+        self.llm_seconds = 0.0
+
+        own = time.monotonic() + timeout if timeout else None
+        inherited = parent.expires_at if parent is not None else None
+        if own is not None and (inherited is None or own <= inherited):
+            self.expires_at, self.deadline_name = own, name
+        else:
+            self.expires_at = inherited
+            self.deadline_name = parent.deadline_name if parent is not None else None
+
+        self._callbacks: List[Callable[[Cancelled], None]] = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._unlink = parent.on_cancel(self._set) if parent is not None else None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.error is not None
+
+    @property
+    def root(self) -> "CancelScope":
+        scope = self
+        while scope.parent is not None:
+            scope = scope.parent
+        return scope
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline (None = no deadline)"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self) -> None:
+        """Raise if the scope is cancelled or past its deadline"""
+        if self.error is None and self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.expire()
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self, reason: str = "disconnect") -> bool:
+        """
+        Cancel the run (and every child scope)
+
+        Returns:
+            False if it was already cancelled or has finished
+        """
+        return self._set(Cancelled(f"{self.name} cancelled: {reason}", reason))
+
+    def expire(self) -> Cancelled:
+        """Mark the deadline as passed; returns the error the run should raise"""
+        self._set(DeadlineExceeded(f"{self.deadline_name or self.name} deadline exceeded"))
+        return self.error
+
+    def on_cancel(self, callback: Callable[[Cancelled], None]) -> Callable[[], None]:
+        """
+        Call back (from the cancelling thread) when the scope is cancelled;
+        at once if it already is
+
+        Returns:
+            Function that unregisters the callback
+        """
+        with self._lock:
+            error = self.error
+            if error is None:
+                self._callbacks.append(callback)
+        if error is not None:
+            callback(error)
+
+        def remove() -> None:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        return remove
+
+    def add_llm_seconds(self, seconds: float) -> None:
+        root = self.root
+        with root._lock:
+            root.llm_seconds += seconds
+
+    def take_llm_seconds(self) -> float:
+        """Generation seconds recorded on the root scope so far, resetting them"""
+        root = self.root
+        with root._lock:
+            seconds, root.llm_seconds = root.llm_seconds, 0.0
+        return seconds
+
+    def close(self) -> None:
+        """The run finished: later cancel() calls are no-ops"""
+        with self._lock:
+            self._closed = True
+            self._callbacks = []
+        if self._unlink is not None:
+            self._unlink()
+
+    @contextmanager
+    def active(self) -> Iterator["CancelScope"]:
+        """Make this the current scope for the calling context"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # An abandoned generator finalised from another context
+                pass
+
+    def _set(self, error: Cancelled) -> bool:
+        with self._lock:
+            if self.error is not None or self._closed:
+                return False
+            self.error = error
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(error)
+        return True
+
+
+def current_scope() -> Optional[CancelScope]:
+    """Scope of the run executing in this context (None outside a run)"""
+    return _current.get()
+
+
+@contextmanager
+def deadline(seconds: Optional[float], name: str) -> Iterator[Optional[CancelScope]]:
+    """
+    Run a block under a child scope that expires after `seconds`
+
+    Args:
+        seconds: Time allowed (None or 0 = no deadline; the block runs in the current scope)
+        name: Stage name for the DeadlineExceeded message
+    """
+    if not seconds:
+        yield current_scope()
+        return
+    scope = CancelScope(seconds, name, parent=current_scope())
+    try:
+        with scope.active():
+            yield scope
+    finally:
+        scope.close()
+
+
+def record_waste(seconds: float, reason: str) -> None:
+    """Count generation time whose output was discarded"""
+    if seconds > 0:
+        LLM_WASTED_SECONDS.inc(seconds, reason=reason)
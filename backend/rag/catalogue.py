@@ -0,0 +1,252 @@
+"""
+Compiled plan catalogue
+
+The data file is parsed once into typed insurer and plan records: the
+free-text fields the ranking and rendering code needs as numbers (CSR
+percentages, sum insured options, waiting periods, hospital network size)
+are normalised up front, and the source strings are kept alongside for
+anything shown to the user verbatim.
+
+The compiled catalogue is pickled to a snapshot file next to the vector
+index. A snapshot is reused while the data file's mtime and size match,
+or, if only the mtime changed, while its content hash matches; otherwise
+the JSON is re-parsed and the snapshot rewritten. Within a process,
+open_catalogue() returns the same object until the file changes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from .plan_filter import parse_amount, parse_months, parse_percentage, plan_features
+except ImportError:  # imported as a top-level module (setup_embeddings.py)
+    from plan_filter import parse_amount, parse_months, parse_percentage, plan_features
+
+logger = logging.getLogger(__name__)
+
+# Bump when the record layout changes; older snapshots are then recompiled
+CATALOGUE_FORMAT = 1
+SNAPSHOT_FILE = "catalogue.pickle"
+
+RUPEE_UNITS = {'k': 1e3, 'l': 1e5, 'lakh': 1e5, 'lac': 1e5, 'cr': 1e7, 'crore': 1e7}
+
+
+def parse_rupees(text: Any) -> List[float]:
+    """
+    Every amount in a free-text rupee field, in order
+
+    '₹5L, ₹7.5L, ₹1Cr, Unlimited' -> [500000, 750000, 10000000, inf]
+    """
+    amounts = []
+    for number, unit, unlimited in re.findall(
+            r'(\d[\d,]*(?:\.\d+)?)\s*(crore|cr|lakh|lac|l|k)?\b|(unlimited)', str(text or '').lower()):
+        if unlimited:
+            amounts.append(float('inf'))
+        else:
+            amounts.append(float(number.replace(',', '')) * RUPEE_UNITS.get(unit, 1.0))
+    return amounts
+
+
+class InsurerRecord:
+    """One insurer: normalised numbers plus the source record"""
+
+    __slots__ = ('insurer_id', 'name', 'insurer_type', 'csr', 'csr_within_3_months',
+                 'network_hospitals', 'cashless_hospitals', 'raw')
+
+    def __init__(self, raw: Dict[str, Any]):
+        claims = raw.get('claim_settlement_ratio', {})
+        self.insurer_id: str = raw.get('insurer_id', '')
+        self.name: str = raw['insurer_name']
+        self.insurer_type: str = raw.get('type', '')
+        # Headline CSR (percent); None when the file has no number
+        self.csr: Optional[float] = parse_percentage(claims.get('csr_percentage'))
+        self.csr_within_3_months: Optional[float] = parse_percentage(claims.get('csr_within_3_months'))
+        self.network_hospitals: Optional[float] = parse_amount(raw.get('network_hospitals'))
+        self.cashless_hospitals: Optional[float] = parse_amount(raw.get('cashless_hospitals'))
+        self.raw = raw
+
+    @property
+    def csr_text(self) -> str:
+        """CSR as written in the data file (for display)"""
+        return self.raw['claim_settlement_ratio']['csr_percentage']
+
+    def __repr__(self) -> str:
+        return f"InsurerRecord({self.insurer_id!r})"
+
+
+class PlanRecord:
+    """One plan: normalised numbers, ranking features and the source record"""
+
+    __slots__ = ('plan_id', 'name', 'plan_type', 'insurer', 'sum_insured_options',
+                 'min_sum_insured', 'max_sum_insured', 'ped_waiting_months',
+                 'initial_waiting_days', 'pre_hospitalization_days',
+                 'post_hospitalization_days', 'key_features', 'features', 'raw')
+
+    def __init__(self, insurer: InsurerRecord, raw: Dict[str, Any]):
+        coverage = raw.get('coverage_static', {})
+        waiting = raw.get('waiting_periods', {})
+        self.plan_id: str = raw['plan_id']
+        self.name: str = raw['plan_name']
+        self.plan_type: str = raw.get('plan_type', '')
+        self.insurer = insurer
+        # Rupees; inf for "Unlimited"
+        self.sum_insured_options: Tuple[float, ...] = tuple(parse_rupees(coverage.get('sum_insured_options')))
+        self.min_sum_insured: Optional[float] = parse_amount(coverage.get('min_sum_insured'))
+        self.max_sum_insured: Optional[float] = parse_amount(coverage.get('max_sum_insured'))
+        self.ped_waiting_months: Optional[int] = parse_months(waiting.get('ped_waiting_months'))
+        self.initial_waiting_days: Optional[int] = parse_months(waiting.get('initial_waiting_days'))
+        self.pre_hospitalization_days: Optional[int] = parse_months(coverage.get('pre_hospitalization_days'))
+        self.post_hospitalization_days: Optional[int] = parse_months(coverage.get('post_hospitalization_days'))
+        self.key_features: Tuple[str, ...] = tuple(raw.get('key_features', []))
+        # Metadata-safe typed features used by the structured ranking (plan_filter)
+        self.features: Dict[str, Any] = plan_features(insurer.raw, raw)
+        self.raw = raw
+
+    @property
+    def coverage(self) -> Dict[str, Any]:
+        return self.raw.get('coverage_static', {})
+
+    @property
+    def waiting(self) -> Dict[str, Any]:
+        return self.raw.get('waiting_periods', {})
+
+    def __repr__(self) -> str:
+        return f"PlanRecord({self.plan_id!r})"
+
+
+class Catalogue:
+    """All insurers and plans from one version of the data file"""
+
+    def __init__(self, data: Dict[str, Any], version: str):
+        """
+        Compile the parsed data file
+
+        Args:
+            data: Parsed insurance data JSON ({'insurers': [...]})
+            version: Content hash of the data file
+        """
+        self.version = version
+        self.metadata: Dict[str, Any] = data.get('metadata', {})
+        self.quick_reference: Dict[str, Any] = data.get('comparison_quick_reference', {})
+        self.insurers: Tuple[InsurerRecord, ...] = tuple(InsurerRecord(raw) for raw in data['insurers'])
+        self.plans: Tuple[PlanRecord, ...] = tuple(
+            PlanRecord(insurer, plan) for insurer in self.insurers for plan in insurer.raw['plans']
+        )
+        self._by_id = {plan.plan_id: plan for plan in self.plans}
+        if len(self._by_id) != len(self.plans):
+            raise ValueError("Duplicate plan_id in the data file")
+
+    def __len__(self) -> int:
+        return len(self.plans)
+
+    def __iter__(self) -> Iterator[PlanRecord]:
+        return iter(self.plans)
+
+    def __contains__(self, plan_id: str) -> bool:
+        return plan_id in self._by_id
+
+    def plan(self, plan_id: str) -> PlanRecord:
+        """Plan by id (KeyError if unknown)"""
+        return self._by_id[plan_id]
+
+    @property
+    def insurer_names(self) -> List[str]:
+        return [insurer.name for insurer in self.insurers]
+
+
+# Per-process memo: data path -> ((mtime_ns, size), Catalogue)
+_opened: Dict[str, Tuple[Tuple[int, int], Catalogue]] = {}
+_opened_lock = threading.Lock()
+
+
+def open_catalogue(data_path: str, snapshot_path: Optional[str] = None) -> Catalogue:
+    """
+    Compiled catalogue for a data file, from memory, the snapshot or the JSON
+
+    Args:
+        data_path: Insurance data JSON file
+        snapshot_path: Pickled catalogue to reuse/refresh (None = no snapshot)
+
+    Returns:
+        Catalogue for the file's current contents
+    """
+    data_path = os.path.abspath(data_path)
+    stat = os.stat(data_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    with _opened_lock:
+        opened = _opened.get(data_path)
+        if opened is not None and opened[0] == stamp:
+            return opened[1]
+
+        catalogue = None
+        if snapshot_path:
+            catalogue = _read_snapshot(snapshot_path, data_path, stamp)
+
+        if catalogue is None:
+            with open(data_path, 'rb') as f:
+                content = f.read()
+            version = hashlib.sha256(content).hexdigest()[:16]
+            if snapshot_path:
+                catalogue = _read_snapshot(snapshot_path, data_path, stamp, version)
+            if catalogue is None:
+                catalogue = Catalogue(json.loads(content), version)
+                logger.info(f"📚 Compiled catalogue: {len(catalogue)} plans from {len(catalogue.insurers)} insurers")
+            if snapshot_path:
+                # Also refreshes the stamp of a snapshot that matched by hash only
+                _write_snapshot(snapshot_path, data_path, stamp, catalogue)
+
+        _opened[data_path] = (stamp, catalogue)
+        return catalogue
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """Resolves the record classes whether this module was imported as rag.catalogue or catalogue"""
+
+    def find_class(self, module: str, name: str) -> Any:
+        if module in ('catalogue', 'rag.catalogue'):
+            module = __name__
+        return super().find_class(module, name)
+
+
+def _read_snapshot(snapshot_path: str, data_path: str, stamp: Tuple[int, int],
+                   version: Optional[str] = None) -> Optional[Catalogue]:
+    """Snapshot contents if they were compiled from this file (same stamp, or same hash when given)"""
+    try:
+        with open(snapshot_path, 'rb') as f:
+            header = _SnapshotUnpickler(f).load()
+            if (header.get('format') != CATALOGUE_FORMAT or header.get('source') != data_path
+                    or (header.get('stamp') != stamp and header.get('version') != version)):
+                return None
+            return _SnapshotUnpickler(f).load()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️  Ignoring unreadable catalogue snapshot {snapshot_path}: {e}")
+        return None
+
+
+def _write_snapshot(snapshot_path: str, data_path: str, stamp: Tuple[int, int], catalogue: Catalogue) -> None:
+    """Header + catalogue, written to a temp file and renamed into place"""
+    header = {'format': CATALOGUE_FORMAT, 'source': data_path, 'stamp': stamp, 'version': catalogue.version}
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    tmp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".catalogue-")
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(catalogue, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        # The snapshot only saves start-up time; serving works without it
+        logger.warning(f"⚠️  Could not write catalogue snapshot {snapshot_path}: {e}")
@@ -0,0 +1,179 @@
+"""
+Section-level plan chunks and token-budgeted context assembly
+
+A plan is split into sections, each linked to its parent plan_id:
+
+- summary:    name, insurer, CSR, sum insured, room rent, maternity, NCB
+              (the fields every answer format asks for; always included)
+- coverage:   the remaining coverage fields (co-payment, sublimits,
+              restoration, ICU, modern treatments, OPD, ambulance, ...)
+- waiting:    every waiting period, buyback options and notes
+- exclusions: the exclusion list
+- features:   description, key features and who the plan suits
+
+The assembler always keeps each retrieved plan's summary, then adds the
+optional sections by priority (section relevance to the query, scaled down
+for lower-ranked plans) until the token budget is spent. The output is
+grouped by plan in rank order. Token counts are estimated at four
+characters per token; no tokenizer is loaded.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from .catalogue import PlanRecord
+except ImportError:  # imported as a top-level module (setup_embeddings.py)
+    from catalogue import PlanRecord
+
+SECTION_KINDS = ("summary", "coverage", "waiting", "exclusions", "features")
+
+# Baseline priority of the optional sections (added to their query relevance)
+SECTION_WEIGHTS = {'waiting': 0.6, 'coverage': 0.5, 'features': 0.4, 'exclusions': 0.3}
+# Priority multiplier per plan rank: 1, 0.8, 0.67, ...
+RANK_DECAY = 0.25
+
+_SUMMARY_COVERAGE = ('sum_insured_options', 'room_rent_limit', 'maternity_coverage', 'no_claim_bonus')
+# Typed duplicates of text fields, and fields shown elsewhere
+_SKIP_COVERAGE = _SUMMARY_COVERAGE + ('min_sum_insured', 'max_sum_insured')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token)"""
+    return max(1, (len(text) + 3) // 4)
+
+
+def _label(key: str) -> str:
+    return key.replace('_', ' ').strip().capitalize().replace('Ped ', 'PED ').replace('Ncb', 'NCB')
+
+
+def _value(value: Any) -> str:
+    if isinstance(value, list):
+        return '; '.join(str(item) for item in value)
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    return str(value)
+
+
+def _section(record: PlanRecord, kind: str, text: str) -> Dict[str, Any]:
+    return {
+        'id': f"{record.plan_id}#{kind}",
+        'plan_id': record.plan_id,
+        'section': kind,
+        'text': text,
+        'tokens': estimate_tokens(text)
+    }
+
+
+def plan_sections(record: PlanRecord, best_for: str = '') -> List[Dict[str, Any]]:
+    """
+    Split one plan into section chunks
+
+    Args:
+        record: Compiled plan record
+        best_for: "Best For" line for the features section
+
+    Returns:
+        Section dicts with id ("<plan_id>#<section>"), plan_id, section, text and tokens
+    """
+    coverage = record.coverage
+    summary = [
+        f"Plan Name: {record.name}",
+        f"Insurance Company: {record.insurer.name}",
+        f"Claim Settlement Ratio: {record.insurer.csr_text}",
+        f"Plan Type: {record.plan_type or 'N/A'}",
+        f"Sum Insured Options: {coverage.get('sum_insured_options', 'N/A')}",
+        f"Room Rent Limit: {coverage.get('room_rent_limit', 'N/A')}",
+        f"Maternity Coverage: {coverage.get('maternity_coverage', 'Not available')}",
+        f"No Claim Bonus: {coverage.get('no_claim_bonus', 'N/A')}",
+        "Premium Estimate: ₹10,000 - ₹25,000 per year (varies by age and sum insured)"
+    ]
+    sections = [_section(record, 'summary', '\n'.join(summary))]
+
+    details = [f"- {_label(key)}: {_value(value)}" for key, value in coverage.items()
+               if key not in _SKIP_COVERAGE and value not in (None, '', [])]
+    if details:
+        sections.append(_section(record, 'coverage', "Coverage Details:\n" + '\n'.join(details)))
+
+    waiting = [f"- {_label(key)}: {_value(value)}" for key, value in record.waiting.items()
+               if value not in (None, '', [])]
+    if waiting:
+        sections.append(_section(record, 'waiting', "Waiting Periods:\n" + '\n'.join(waiting)))
+
+    exclusions = record.raw.get('exclusions', [])
+    if exclusions:
+        sections.append(_section(record, 'exclusions', "Exclusions:\n" + '\n'.join(f"- {item}" for item in exclusions)))
+
+    features = []
+    if record.raw.get('description'):
+        features.append(f"Description: {record.raw['description']}")
+    if record.key_features:
+        features.append("Key Features:\n" + '\n'.join(f"- {item}" for item in record.key_features))
+    if best_for:
+        features.append(f"Best For: {best_for}")
+    if features:
+        sections.append(_section(record, 'features', '\n'.join(features)))
+    return sections
+
+
+def assemble_context(plans: Sequence[Dict[str, Any]], sections: Sequence[Sequence[Dict[str, Any]]],
+                     relevance: Dict[str, float], budget_tokens: int,
+                     header: str = '') -> Tuple[str, Dict[str, Any]]:
+    """
+    Fit the most relevant sections of the retrieved plans into a token budget
+
+    Args:
+        plans: Retrieved plans, best first (each with a 'score')
+        sections: Section chunks of each plan, same order as plans
+        relevance: Section id -> query relevance in [0, 1] (missing = 0)
+        budget_tokens: Token budget for the whole context (summaries are
+            always included, even past the budget)
+        header: First line of the context
+
+    Returns:
+        (context text, stats with tokens, budget, included and dropped section ids)
+    """
+    used = estimate_tokens(header) if header else 0
+    chosen = set()
+    candidates = []
+    for rank, group in enumerate(sections):
+        decay = 1.0 / (1.0 + RANK_DECAY * rank)
+        for section in group:
+            if section['section'] == 'summary':
+                chosen.add(section['id'])
+                used += section['tokens']
+            else:
+                priority = (SECTION_WEIGHTS.get(section['section'], 0.0) + relevance.get(section['id'], 0.0)) * decay
+                candidates.append((priority, section))
+
+    # Greedy by priority; a section that does not fit is skipped, smaller ones may still fit
+    dropped = []
+    for _, section in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if used + section['tokens'] <= budget_tokens:
+            chosen.add(section['id'])
+            used += section['tokens']
+        else:
+            dropped.append(section['id'])
+
+    parts = [header] if header else []
+    for i, (plan, group) in enumerate(zip(plans, sections), 1):
+        parts.append(f"{'=' * 60}\nPLAN {i} (Relevance: {plan['score']:.2%})\n{'=' * 60}")
+        ordered = sorted((s for s in group if s['id'] in chosen),
+                         key=lambda s: SECTION_KINDS.index(s['section']) if s['section'] in SECTION_KINDS else len(SECTION_KINDS))
+        parts.extend(section['text'] for section in ordered)
+
+    return '\n\n'.join(parts) + '\n', {
+        'tokens': used,
+        'budget': budget_tokens,
+        'included': sorted(chosen),
+        'dropped': dropped
+    }
+
+
+def section_relevance(scores: Sequence[float], sections: Sequence[Dict[str, Any]],
+                      rows: Optional[Sequence[int]] = None) -> Dict[str, float]:
+    """BM25 scores of section rows scaled to [0, 1] by the best of them"""
+    rows = range(len(sections)) if rows is None else rows
+    best = max((float(scores[row]) for row in rows), default=0.0)
+    if best <= 0:
+        return {}
+    return {sections[row]['id']: float(scores[row]) / best for row in rows if scores[row] > 0}
@@ -0,0 +1,164 @@
+"""
+Persistent embedding cache
+
+Embeddings are stored per model as one contiguous float32 matrix on disk
+(`<model>.f32`, read through a memory map) plus a small JSON index that maps
+the SHA-256 of each text to its row. Re-embedding unchanged plan text is then
+a dictionary lookup instead of an Ollama round-trip.
+
+Several processes (API workers, the setup script) share the files. Writers
+are serialised by the caller's index lock; each write re-reads the index
+first and merges, so rows another process appended are kept, and readers
+reload the index when its file changes.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def text_hash(text: str) -> str:
+    """Stable content hash used as the cache key"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Append-only on-disk cache of embeddings keyed by (model, text hash)"""
+
+    def __init__(self, cache_dir: str, model: str):
+        """
+        Initialize embedding cache
+
+        Args:
+            cache_dir: Directory holding the cache files
+            model: Embedding model name (each model gets its own files)
+        """
+        self.cache_dir = cache_dir
+        self.model = model
+
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model)
+        self.matrix_path = os.path.join(cache_dir, f"{slug}.f32")
+        self.index_path = os.path.join(cache_dir, f"{slug}.index.json")
+
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._index_mtime: Optional[int] = None
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load_index(self) -> None:
+        """Read the hash -> row index; a missing or torn index means an empty cache"""
+        try:
+            self._index_mtime = os.stat(self.index_path).st_mtime_ns
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        dim = index.get('dim')
+        rows = index.get('rows', {})
+        if not dim or not os.path.exists(self.matrix_path):
+            return
+
+        # Ignore rows beyond what actually reached the matrix file
+        stored = os.path.getsize(self.matrix_path) // (4 * dim)
+        self._dim = dim
+        self._rows = {key: row for key, row in rows.items() if row < stored}
+        self._matrix = None
+
+    def _refresh(self) -> None:
+        """Reload the index if another process rewrote it since we read it"""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._index_mtime:
+            self._load_index()
+
+    def _open_matrix(self) -> Optional[np.ndarray]:
+        """Memory-map the matrix file (re-mapped after every append)"""
+        if self._matrix is None and self._rows:
+            rows = os.path.getsize(self.matrix_path) // (4 * self._dim)
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r',
+                                     shape=(rows, self._dim))
+        return self._matrix
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings
+
+        Args:
+            texts: Texts to look up
+
+        Returns:
+            One embedding per text, or None where the text is not cached
+        """
+        with self._lock:
+            self._refresh()
+            matrix = self._open_matrix()
+            results: List[Optional[List[float]]] = []
+            for text in texts:
+                row = self._rows.get(text_hash(text))
+                results.append(None if row is None else matrix[row].tolist())
+            return results
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        """
+        Append new embeddings and persist the index
+
+        Call with the index write lock held. Texts another process has
+        cached meanwhile are not appended again.
+
+        Args:
+            texts: Texts that were embedded
+            embeddings: Their embedding vectors (same order)
+        """
+        if not texts:
+            return
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            # Start from the index on disk, not our copy, so other writers' rows survive
+            self._load_index()
+            keys = [text_hash(text) for text in texts]
+            new = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not new:
+                return
+            vectors = vectors[new]
+            keys = [keys[i] for i in new]
+
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dimension changed for {self.model}: {vectors.shape[1]} != {self._dim}"
+                )
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            start = os.path.getsize(self.matrix_path) // (4 * self._dim) if os.path.exists(self.matrix_path) else 0
+            # Write after the last whole row (a torn tail from a crashed writer is overwritten)
+            with open(self.matrix_path, 'r+b' if os.path.exists(self.matrix_path) else 'wb') as f:
+                f.seek(start * 4 * self._dim)
+                f.write(np.ascontiguousarray(vectors).tobytes())
+                f.truncate()
+
+            for offset, key in enumerate(keys):
+                self._rows[key] = start + offset
+
+            # Write index atomically so readers never see a partial file
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'model': self.model, 'dim': self._dim, 'rows': self._rows}, f)
+            os.replace(tmp_path, self.index_path)
+
+            self._index_mtime = os.stat(self.index_path).st_mtime_ns
+            self._matrix = None
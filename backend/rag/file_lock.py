@@ -0,0 +1,94 @@
+"""
+Inter-process advisory file lock
+
+Keeps index writes to one process at a time across API workers and the
+setup script, and elects the one API worker that is allowed to write. Uses
+fcntl.flock, so the lock is released by the OS if the holder dies. Where
+fcntl is unavailable (Windows) the lock only covers the current process.
+"""
+
+import os
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+
+class FileLock:
+    """Exclusive lock on a file; the holder's pid is written into it"""
+
+    def __init__(self, path: str):
+        """
+        Initialize lock (nothing is opened until acquire())
+
+        Args:
+            path: Lock file (created if missing)
+        """
+        self.path = path
+        self._fd: Optional[int] = None
+        self._local = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take the lock
+
+        Args:
+            blocking: Wait for the current holder (False = give up at once)
+
+        Returns:
+            True if the lock is now held by this process
+        """
+        if not self._local.acquire(blocking):
+            return False
+
+        fd = None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode('ascii'))
+        except BaseException as e:
+            # Never leave the thread lock held: every later acquire() would hang
+            if fd is not None:
+                os.close(fd)
+            self._local.release()
+            if isinstance(e, BlockingIOError):
+                return False
+            raise
+
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        """Drop the lock (no-op if not held)"""
+        if self._fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+        self._local.release()
+
+    def owner(self) -> Optional[int]:
+        """Pid written by the last holder, if any"""
+        try:
+            with open(self.path, 'r') as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
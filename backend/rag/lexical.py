@@ -0,0 +1,135 @@
+"""
+In-process BM25 index over plan text
+
+Exact terms such as "diabetes", "OPD" or "bariatric" often decide whether
+a plan fits, and an embedding of the whole profile can blur them. This
+index scores every plan for the query's terms with Okapi BM25. Each
+posting stores its precomputed term impact, so answering a query means
+summing a few small arrays: microseconds, and no embedding call.
+
+Documents are the chunk text plus the fields the chunks leave out
+(description, exclusions, waiting-period notes, modern treatments).
+Scores are row-aligned with the PlanTable they were built from.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .catalogue import PlanRecord
+except ImportError:  # imported as a top-level module (setup_embeddings.py)
+    from catalogue import PlanRecord
+
+# Okapi BM25 parameters (term-frequency saturation, length normalisation)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its me my need needs of on or "
+    "per plan plans that the to up want with without".split()
+)
+_TOKEN = re.compile(r'[a-z0-9]+')
+# Written both ways in the data file and in user input
+_SYNONYMS = {'outpatient': 'opd', 'pregnancy': 'maternity', 'delivery': 'maternity',
+             'diabetic': 'diabetes', 'ped': 'preexisting'}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens without stop words; plural "s" and a few synonyms folded"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower().replace('pre-existing', 'preexisting')):
+        if token in STOP_WORDS:
+            continue
+        # Synonyms before and after the plural fold, so "diabetic", "diabetes"
+        # and "outpatients" land on the same tokens as their plain forms
+        token = _SYNONYMS.get(token, token)
+        if len(token) > 4 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+            token = token[:-1]
+        tokens.append(_SYNONYMS.get(token, token))
+    return tokens
+
+
+def plan_document(record: PlanRecord) -> str:
+    """Plan fields worth matching on that the embedded chunk text does not carry"""
+    raw = record.raw
+    parts = [raw.get('description', ''), raw.get('plan_type', '')]
+    parts.extend(raw.get('exclusions', []))
+    parts.append(str(record.waiting.get('notes', '')))
+    for value in record.coverage.values():
+        if isinstance(value, list):
+            parts.extend(str(item) for item in value)
+        elif isinstance(value, str):
+            parts.append(value)
+    return '\n'.join(part for part in parts if part)
+
+
+class BM25Index:
+    """Inverted index with per-posting BM25 impacts"""
+
+    def __init__(self, documents: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Build the index
+
+        Args:
+            documents: One text per row (row i scores plan i)
+            k1: Term-frequency saturation
+            b: Document-length normalisation
+        """
+        self.size = len(documents)
+        tokenized = [tokenize(doc) for doc in documents]
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        average = float(lengths.mean()) if self.size and lengths.sum() else 1.0
+
+        counts: Dict[str, Dict[int, int]] = {}
+        for row, tokens in enumerate(tokenized):
+            for token in tokens:
+                postings = counts.setdefault(token, {})
+                postings[row] = postings.get(row, 0) + 1
+
+        # term -> (rows, impacts); impact = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg))
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, postings in counts.items():
+            rows = np.fromiter(postings, dtype=np.int32, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            idf = np.log(1.0 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[rows] / average)
+            self.postings[term] = (rows, (idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for a query (0 where no term matches)"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
+
+    def rank(self, query: str, rows: Optional[Sequence[int]] = None,
+             top_k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Rows that match at least one query term, best first
+
+        Args:
+            query: Free text
+            rows: Only rank these rows (None = all)
+            top_k: Keep only the best k (None = all that match)
+
+        Returns:
+            (row index, BM25 score) pairs
+        """
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0) if rows is None else np.asarray(rows, dtype=np.int64)
+        candidates = candidates[scores[candidates] > 0]
+        # Stable sort keeps catalogue order for ties
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        if top_k is not None:
+            order = order[:top_k]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def stats(self) -> Dict[str, Any]:
+        return {'documents': self.size, 'terms': len(self.postings)}
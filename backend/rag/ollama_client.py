@@ -0,0 +1,635 @@
+"""
+Pooled Ollama client shared by the RAG engine, the pipeline and the crew
+
+One httpx.AsyncClient (keep-alive connection pool) runs on a dedicated
+event-loop thread, so blocking callers on worker threads and coroutines on
+the API's loop all reuse the same connections. Every call gets:
+
+- per-call timeouts (connect, and read for embeddings / generation)
+- bounded retries with exponential backoff and full jitter on connection
+  errors, timeouts, 429 and 5xx; a stream is only retried before its first
+  chunk
+- a circuit breaker: after `breaker_threshold` consecutive failures calls
+  fail fast with OllamaUnavailable for `breaker_cooldown` seconds, then a
+  single trial call decides whether to close it again
+- coalescing: identical in-flight non-streaming requests (same endpoint and
+  payload) share one HTTP call
+- cancellation: a blocking call waits through the caller's CancelScope
+  (rag.cancellation), so cancelling the run or passing its deadline aborts
+  the HTTP request and raises Cancelled in the caller
+- scheduling: every HTTP call takes a slot from the client's chat or embed
+  LLMScheduler (rag.scheduler) under the caller's priority class, so
+  interactive calls go ahead of bulk and reindex work
+
+shared_client() with no host returns an OllamaRouter over every configured
+server (OLLAMA_HOSTS, and OLLAMA_BULK_HOSTS for background classes); it
+sends each call to the least busy server whose circuit is not open.
+
+Responses are the plain JSON dicts from Ollama's native API, so code written
+against the `ollama` package (`response['embeddings']`,
+`chunk['message']['content']`, `.get('eval_count')`) works unchanged.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+import httpx
+
+try:
+    from .cancellation import CancelScope, Cancelled, current_scope, record_waste
+    from .scheduler import BULK, EMBED_SLOTS, INTERACTIVE, LLM_SLOTS, REINDEX, LLMScheduler, current_priority
+    from .telemetry import REGISTRY
+except ImportError:  # imported as a top-level module (setup_embeddings.py)
+    from cancellation import CancelScope, Cancelled, current_scope, record_waste
+    from scheduler import BULK, EMBED_SLOTS, INTERACTIVE, LLM_SLOTS, REINDEX, LLMScheduler, current_priority
+    from telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO; ollama_requests_total counts them instead
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+DEFAULT_HOST = "http://localhost:11434"
+POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "16"))
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+# Read timeouts: a whole embedding call / the gap between generated chunks
+# (the whole generation when not streaming)
+EMBED_TIMEOUT = float(os.getenv("OLLAMA_EMBED_TIMEOUT", "30"))
+GENERATE_TIMEOUT = float(os.getenv("OLLAMA_GENERATE_TIMEOUT", "180"))
+RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+BREAKER_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("OLLAMA_BREAKER_COOLDOWN", "30"))
+
+# Backoff before retry n (0-based): uniform in [0, min(cap, base * 2**n)]
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 4.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+OLLAMA_REQUESTS = REGISTRY.counter(
+    "ollama_requests_total", "HTTP calls to Ollama by endpoint and outcome", ("endpoint", "outcome"))
+
+
+def default_host() -> str:
+    """Ollama server root: OLLAMA_HOST, else derived from OPENAI_API_BASE"""
+    host = os.environ.get("OLLAMA_HOST")
+    if not host:
+        base = os.environ.get("OPENAI_API_BASE", DEFAULT_HOST).rstrip("/")
+        host = base[:-3] if base.endswith("/v1") else base
+    if "://" not in host:
+        host = f"http://{host}"
+    return host.rstrip("/")
+
+
+def generation_host() -> str:
+    """Server for chat calls: the one OPENAI_API_BASE points at, else default_host()"""
+    base = os.environ.get("OPENAI_API_BASE", "").rstrip("/")
+    if not base:
+        return default_host()
+    host = base[:-3] if base.endswith("/v1") else base
+    return (host if "://" in host else f"http://{host}").rstrip("/")
+
+
+def endpoints(priority: str = INTERACTIVE, kind: str = 'chat') -> List[str]:
+    """
+    Servers a priority class may use: OLLAMA_HOSTS (comma-separated); bulk
+    and reindex calls use OLLAMA_BULK_HOSTS when set. Without either, chat
+    goes to generation_host() and embeddings to default_host()
+    """
+    hosts = os.environ.get("OLLAMA_HOSTS", "")
+    if priority in (BULK, REINDEX):
+        hosts = os.environ.get("OLLAMA_BULK_HOSTS") or hosts
+    hosts = [host.strip() for host in hosts.split(",") if host.strip()]
+    if not hosts:
+        return [generation_host() if kind == 'chat' else default_host()]
+    return [(host if "://" in host else f"http://{host}").rstrip("/") for host in hosts]
+
+
+class OllamaError(Exception):
+    """Ollama answered with an error that retrying will not fix (e.g. unknown model)"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OllamaUnavailable(OllamaError):
+    """Ollama is unreachable or failing: retries ran out or the circuit is open"""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message, status_code=503)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker; only touched from the client's event loop"""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial_started: Optional[float] = None
+
+    def check(self) -> None:
+        """Raise OllamaUnavailable if calls should fail fast right now"""
+        if self.state == "closed":
+            return
+        remaining = self._opened_at + self.cooldown - time.monotonic()
+        if self.state == "open" and remaining > 0:
+            raise OllamaUnavailable("Ollama circuit open", retry_after=max(1, int(remaining + 0.999)))
+        # Cool-down over: let exactly one trial call through (a new one if the
+        # last trial never reported back, e.g. it was cancelled)
+        now = time.monotonic()
+        if self._trial_started is not None and now - self._trial_started < self.cooldown:
+            raise OllamaUnavailable("Ollama circuit half-open, trial call in progress", retry_after=1)
+        self.state = "half_open"
+        self._trial_started = now
+
+    def success(self) -> None:
+        if self.state != "closed":
+            logger.info("✅ Ollama reachable again, circuit closed")
+        self.state = "closed"
+        self.failures = 0
+        self._trial_started = None
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._trial_started = None
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.opened += 1
+                logger.warning(f"🔌 Ollama failing ({self.failures} in a row), "
+                               f"circuit open for {self.cooldown:g}s")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+
+class _Retryable(Exception):
+    """Internal: a failed attempt worth retrying"""
+
+
+class OllamaClient:
+    """Async Ollama client on its own event-loop thread, with blocking wrappers"""
+
+    def __init__(self, host: Optional[str] = None, pool_size: int = POOL_SIZE,
+                 connect_timeout: float = CONNECT_TIMEOUT, embed_timeout: float = EMBED_TIMEOUT,
+                 generate_timeout: float = GENERATE_TIMEOUT, retries: int = RETRIES,
+                 breaker_threshold: int = BREAKER_THRESHOLD, breaker_cooldown: float = BREAKER_COOLDOWN,
+                 slots: int = LLM_SLOTS, embed_slots: int = EMBED_SLOTS):
+        """
+        Initialize client (the loop thread and connections start on first use)
+
+        Args:
+            host: Ollama server root (default: default_host())
+            pool_size: Max open connections (also the keep-alive pool size)
+            connect_timeout: Seconds to establish a connection
+            embed_timeout: Read timeout for embedding calls
+            generate_timeout: Read timeout for chat calls (per chunk when streaming)
+            retries: Extra attempts after a retryable failure
+            breaker_threshold: Consecutive failures that open the circuit
+            breaker_cooldown: Seconds the circuit stays open
+            slots: Chat calls in flight at once (see rag.scheduler)
+            embed_slots: Embedding calls in flight at once
+        """
+        self.host = (host or default_host()).rstrip("/")
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.embed_timeout = embed_timeout
+        self.generate_timeout = generate_timeout
+        self.retries = max(0, retries)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.schedulers = {
+            'chat': LLMScheduler(slots, host=self.host, kind='chat'),
+            'embed': LLMScheduler(embed_slots, host=self.host, kind='embed')
+        }
+
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self.coalesced = 0
+
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._start_lock = threading.Lock()
+
+    # --- Event loop ----------------------------------------------------------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ollama-client", daemon=True).start()
+                self._http = httpx.AsyncClient(
+                    base_url=self.host,
+                    limits=httpx.Limits(max_connections=self.pool_size,
+                                        max_keepalive_connections=self.pool_size),
+                    timeout=httpx.Timeout(self.generate_timeout, connect=self.connect_timeout)
+                )
+                self._loop = loop
+        return self._loop
+
+    def _submit(self, coro):
+        """Schedule a coroutine on the client loop; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _run(self, coro, generation: bool = False) -> Any:
+        """
+        Block the calling thread until a coroutine finishes on the client loop
+
+        Under a CancelScope the wait ends early when the scope is cancelled or
+        its deadline passes: the coroutine is cancelled (aborting the HTTP
+        call unless another caller shares it) and Cancelled is raised.
+        Generation time is recorded on the scope, or counted as wasted.
+        """
+        scope = current_scope()
+        if scope is None:
+            return self._submit(coro).result()
+        try:
+            scope.check()
+        except Cancelled:
+            coro.close()
+            raise
+
+        start = time.perf_counter()
+        future = self._submit(coro)
+        remove = scope.on_cancel(lambda _: future.cancel())
+        try:
+            result = future.result(timeout=scope.remaining())
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            error = scope.expire()
+        except concurrent.futures.CancelledError:
+            error = scope.error
+        else:
+            if generation:
+                scope.add_llm_seconds(time.perf_counter() - start)
+            return result
+        finally:
+            remove()
+        if generation:
+            record_waste(time.perf_counter() - start, error.reason)
+        raise error
+
+    async def _await(self, coro) -> Any:
+        """Await a coroutine on the client loop from another event loop"""
+        return await asyncio.wrap_future(self._submit(coro))
+
+    def close(self) -> None:
+        """Close pooled connections and stop the loop thread"""
+        with self._start_lock:
+            loop, http = self._loop, self._http
+            self._loop = self._http = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(http.aclose(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+
+    # --- Public API ----------------------------------------------------------
+
+    def embed(self, model: str, input: Union[str, List[str]], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Embed one or more texts (POST /api/embed); blocking
+
+        Returns:
+            {'embeddings': [[float, ...], ...], 'prompt_eval_count', ...}
+        """
+        return self._run(self._post("/api/embed", _embed_payload(model, input), timeout or self.embed_timeout,
+                                    current_priority()))
+
+    async def aembed(self, model: str, input: Union[str, List[str]],
+                     timeout: Optional[float] = None) -> Dict[str, Any]:
+        """embed() for coroutines"""
+        return await self._await(self._post("/api/embed", _embed_payload(model, input), timeout or self.embed_timeout,
+                                            current_priority()))
+
+    def chat(self, model: str, messages: List[Dict[str, Any]], stream: bool = False,
+             format: Optional[str] = None, options: Optional[Dict[str, Any]] = None,
+             timeout: Optional[float] = None) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
+        """
+        Chat completion (POST /api/chat); blocking
+
+        A streaming call returns an iterator of chunks; stopping the
+        iteration early cancels the request.
+
+        Returns:
+            Final response dict, or an iterator of chunk dicts when stream=True
+        """
+        payload = _chat_payload(model, messages, stream, format, options)
+        timeout = timeout or self.generate_timeout
+        if stream:
+            scope = current_scope()
+            if scope is not None:
+                scope.check()
+            return self._iterate(self._stream("/api/chat", payload, timeout, current_priority()), scope)
+        return self._run(self._post("/api/chat", payload, timeout, current_priority()), generation=True)
+
+    async def achat(self, model: str, messages: List[Dict[str, Any]], format: Optional[str] = None,
+                    options: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Non-streaming chat() for coroutines"""
+        payload = _chat_payload(model, messages, False, format, options)
+        return await self._await(self._post("/api/chat", payload, timeout or self.generate_timeout,
+                                            current_priority()))
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for /health"""
+        return {
+            'host': self.host,
+            'requests': self.requests,
+            'retried': self.retried,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight),
+            'circuit': self.breaker.state,
+            'circuit_opened': self.breaker.opened,
+            'scheduler': {kind: scheduler.stats() for kind, scheduler in self.schedulers.items()}
+        }
+
+    # --- Internals (run on the client loop) ----------------------------------
+
+    async def _post(self, path: str, payload: Dict[str, Any], timeout: float,
+                    priority: str = INTERACTIVE) -> Dict[str, Any]:
+        """Coalesce identical in-flight requests onto one HTTP call (scheduled at the first caller's priority)"""
+        key = hashlib.sha256(f"{path}\n{json.dumps(payload, sort_keys=True)}".encode('utf-8')).hexdigest()
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = {'task': asyncio.ensure_future(self._send(path, payload, timeout, priority)), 'waiters': 0}
+            self._inflight[key] = entry
+            entry['task'].add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        entry['waiters'] += 1
+        try:
+            return await asyncio.shield(entry['task'])
+        finally:
+            entry['waiters'] -= 1
+            # Nobody is waiting any more (callers cancelled): stop the call
+            if entry['waiters'] == 0 and not entry['task'].done():
+                entry['task'].cancel()
+
+    async def _send(self, path: str, payload: Dict[str, Any], timeout: float,
+                    priority: str = INTERACTIVE) -> Dict[str, Any]:
+        """One request with retries and the circuit breaker; each attempt waits for a slot"""
+        for attempt in range(self.retries + 1):
+            self.breaker.check()
+            try:
+                async with self._scheduler(path).slot(priority):
+                    self.requests += 1
+                    response = await self._http.post(path, json=payload, timeout=self._timeout(timeout))
+                    _raise_for_status(response)
+                    data = response.json()
+            except (httpx.TransportError, _Retryable) as e:
+                await self._failed_attempt(path, attempt, e)
+                continue
+            except OllamaError:
+                # The server answered; it is up
+                self.breaker.success()
+                self._count(path, 'error')
+                raise
+            self.breaker.success()
+            self._count(path, 'ok')
+            return data
+        raise AssertionError("unreachable")
+
+    async def _stream(self, path: str, payload: Dict[str, Any], timeout: float,
+                      priority: str = INTERACTIVE) -> AsyncIterator[Dict[str, Any]]:
+        """NDJSON stream with retries until the first chunk arrives; holds a slot until it ends"""
+        for attempt in range(self.retries + 1):
+            self.breaker.check()
+            started = False
+            try:
+                async with self._scheduler(path).slot(priority), \
+                        self._http.stream("POST", path, json=payload, timeout=self._timeout(timeout)) as response:
+                    self.requests += 1
+                    if response.status_code >= 400:
+                        await response.aread()
+                        _raise_for_status(response)
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if 'error' in chunk:
+                            raise OllamaError(chunk['error'])
+                        started = True
+                        yield chunk
+            except (httpx.TransportError, _Retryable) as e:
+                if started:
+                    # Tokens already went to the caller; a retry would repeat them
+                    self.breaker.failure()
+                    self.failed += 1
+                    self._count(path, 'failed')
+                    raise OllamaUnavailable(f"Ollama stream interrupted: {e}") from e
+                await self._failed_attempt(path, attempt, e)
+                continue
+            except OllamaError:
+                self.breaker.success()
+                self._count(path, 'error')
+                raise
+            self.breaker.success()
+            self._count(path, 'ok')
+            return
+
+    async def _failed_attempt(self, path: str, attempt: int, error: Exception) -> None:
+        """Record a retryable failure; back off, or raise once retries are used up"""
+        self.breaker.failure()
+        if attempt >= self.retries or self.breaker.state == "open":
+            self.failed += 1
+            self._count(path, 'failed')
+            raise OllamaUnavailable(f"Ollama request to {path} failed: {error!r}",
+                                    retry_after=max(1, int(self.breaker.cooldown))
+                                    if self.breaker.state == "open" else 5) from error
+        self.retried += 1
+        self._count(path, 'retried')
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        logger.warning(f"⚠️  Ollama {path} attempt {attempt + 1} failed ({error!r}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    def _scheduler(self, path: str) -> LLMScheduler:
+        return self.schedulers['embed' if path == "/api/embed" else 'chat']
+
+    def _timeout(self, read: float) -> httpx.Timeout:
+        return httpx.Timeout(read, connect=self.connect_timeout)
+
+    @staticmethod
+    def _count(path: str, outcome: str) -> None:
+        OLLAMA_REQUESTS.inc(endpoint=path, outcome=outcome)
+
+    def _iterate(self, agen: AsyncIterator[Dict[str, Any]],
+                 scope: Optional[CancelScope] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Drive an async generator on the client loop, handing chunks to this thread
+
+        Under a scope, cancellation or the deadline stops the stream between
+        chunks and raises Cancelled; the generation time is recorded on the
+        scope, or counted as wasted.
+        """
+        chunks: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in agen:
+                    chunks.put(('chunk', chunk))
+                chunks.put(('end', None))
+            except BaseException as e:
+                chunks.put(('error', e))
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+
+        start = time.perf_counter()
+        future = self._submit(pump())
+        remove = scope.on_cancel(lambda error: chunks.put(('error', error))) if scope is not None else None
+        try:
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=scope.remaining() if scope is not None else None)
+                except queue.Empty:
+                    kind, value = 'error', scope.expire()
+                if kind == 'chunk':
+                    yield value
+                elif kind == 'end':
+                    if scope is not None:
+                        scope.add_llm_seconds(time.perf_counter() - start)
+                    return
+                else:
+                    raise value
+        except Cancelled as e:
+            record_waste(time.perf_counter() - start, e.reason)
+            raise
+        finally:
+            # Consumer stopped early (or failed): stop generating
+            future.cancel()
+            if remove is not None:
+                remove()
+
+
+def _embed_payload(model: str, input: Union[str, List[str]]) -> Dict[str, Any]:
+    return {'model': model, 'input': input}
+
+
+def _chat_payload(model: str, messages: List[Dict[str, Any]], stream: bool,
+                  format: Optional[str], options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {'model': model, 'messages': messages, 'stream': stream}
+    if format:
+        payload['format'] = format
+    if options:
+        payload['options'] = options
+    return payload
+
+
+def _raise_for_status(response: httpx.Response) -> None:
+    """Map an error status to _Retryable (transient) or OllamaError (permanent)"""
+    if response.status_code < 400:
+        return
+    if response.status_code in RETRY_STATUSES:
+        raise _Retryable(f"HTTP {response.status_code}")
+    try:
+        detail = response.json().get('error', response.text)
+    except ValueError:
+        detail = response.text
+    raise OllamaError(f"Ollama returned {response.status_code}: {detail}", status_code=response.status_code)
+
+
+class OllamaRouter:
+    """embed()/chat() spread over the configured servers, by priority class and load"""
+
+    def __init__(self):
+        # (host, kind) -> calls this router has in flight there
+        self._inflight: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def embed(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        with self._route('embed') as client:
+            return client.embed(*args, **kwargs)
+
+    async def aembed(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        with self._route('embed') as client:
+            return await client.aembed(*args, **kwargs)
+
+    def chat(self, *args: Any, stream: bool = False,
+             **kwargs: Any) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
+        if stream:
+            return self._chat_stream(*args, **kwargs)
+        with self._route('chat') as client:
+            return client.chat(*args, **kwargs)
+
+    async def achat(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        with self._route('chat') as client:
+            return await client.achat(*args, **kwargs)
+
+    def _chat_stream(self, *args: Any, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        # A generator, so the server counts as busy until the stream ends
+        with self._route('chat') as client:
+            yield from client.chat(*args, stream=True, **kwargs)
+
+    @contextmanager
+    def _route(self, kind: str) -> Iterator[OllamaClient]:
+        """
+        Least busy server for the caller's priority class (in-flight calls per
+        slot), skipping open circuits; ties go to the first listed server
+        """
+        clients = [shared_client(host) for host in endpoints(current_priority(), kind)]
+        if len(clients) > 1:
+            clients = [client for client in clients if client.breaker.state != "open"] or clients
+        with self._lock:
+            client = min(clients, key=lambda c: self._inflight.get((c.host, kind), 0) / c.schedulers[kind].slots)
+            key = (client.host, kind)
+            self._inflight[key] = self._inflight.get(key, 0) + 1
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._inflight[key] -= 1
+
+
+_clients: Dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+_router = OllamaRouter()
+
+
+def shared_client(host: Optional[str] = None) -> Union[OllamaClient, OllamaRouter]:
+    """
+    The process-wide client for a host (created on first use); without a
+    host, the router over every configured server
+    """
+    if host is None:
+        return _router
+    host = host.rstrip("/")
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = _clients[host] = OllamaClient(host)
+        return client
+
+
+def client_stats() -> Dict[str, Dict[str, Any]]:
+    """host -> stats() of every shared client"""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.host: client.stats() for client in clients}
+
+
+def circuit_open() -> float:
+    """1 if any shared client's circuit is not closed (for a gauge)"""
+    with _clients_lock:
+        return float(any(client.breaker.state != "closed" for client in _clients.values()))
+
+
+def close_clients() -> None:
+    """Close every shared client (process shutdown)"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
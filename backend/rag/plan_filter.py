@@ -0,0 +1,248 @@
+"""
+Structured pre-filter and scorer over plan metadata
+
+Parses the free-text plan fields (CSR strings, sum insured, waiting periods,
+maternity/OPD wording) into typed values, keeps them as NumPy columns, and
+scores every plan against a user profile with a few vectorised operations.
+Used to narrow candidates before the vector search, or to rank plans
+without an embedding call at all.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Coverage levels for maternity / OPD
+COVER_NONE = 0
+COVER_ADDON = 1
+COVER_BASE = 2
+
+# Stored in metadata for "Unlimited" sum insured (metadata must be finite)
+UNLIMITED_SUM_INSURED = -1
+
+NO_PED_ANSWERS = {'', 'none', 'no', 'nil', 'na', 'n/a', 'not applicable', 'nothing'}
+CHRONIC_CONDITIONS = ('diabetes', 'hypertension', 'blood pressure', 'bp', 'asthma',
+                      'cholesterol', 'thyroid', 'heart')
+CHRONIC_COVER_KEYS = ('abcd_chronic_care_rider', 'jumpstart_benefit',
+                      'instant_cover_add_on', 'chronic_management_program')
+
+# Budgets at or below this (₹/year) favour plans with a low entry sum insured
+LOW_BUDGET = 15000
+LOW_ENTRY_SUM_INSURED = 300000
+
+
+def parse_percentage(text: Any) -> Optional[float]:
+    """First percentage in a string: '98.85% within 3 months' -> 98.85"""
+    match = re.search(r'(\d+(?:\.\d+)?)\s*%', str(text or ''))
+    return float(match.group(1)) if match else None
+
+
+def parse_months(value: Any) -> Optional[int]:
+    """Waiting period in months from an int or text like '24 months (...)'"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.search(r'\d+', str(value or ''))
+    return int(match.group(0)) if match else None
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """Rupee amount from an int or text; 'Unlimited' -> inf"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value or '').strip().lower()
+    if text.startswith('unlimited'):
+        return float('inf')
+    match = re.search(r'\d[\d,]*', text)
+    return float(match.group(0).replace(',', '')) if match else None
+
+
+def parse_budget(text: Any) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Budget band from form input
+
+    '15000-20000' -> (15000, 20000); '20k' -> (20000, 20000);
+    '1.5 lakh' -> (150000, 150000); unparseable -> (None, None)
+    """
+    values = []
+    for number, unit in re.findall(r'(\d[\d,]*(?:\.\d+)?)\s*(k|lakh|lac|l)?\b', str(text or '').lower()):
+        amount = float(number.replace(',', ''))
+        if unit == 'k':
+            amount *= 1000
+        elif unit in ('lakh', 'lac', 'l'):
+            amount *= 100000
+        values.append(amount)
+    if not values:
+        return None, None
+    return min(values), max(values)
+
+
+def coverage_level(text: Any) -> int:
+    """Classify maternity/OPD wording as none, add-on/optional, or in the base plan"""
+    if text is None:
+        return COVER_NONE
+    lowered = str(text).strip().lower()
+    if lowered in ('', 'none', 'n/a') or lowered.startswith(('not covered', 'not available', 'no ')):
+        return COVER_NONE
+    if lowered.startswith(('yes', 'covered')):
+        return COVER_BASE
+    return COVER_ADDON
+
+
+def plan_features(insurer: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Typed, metadata-safe features for one plan (scalars only, no None)
+
+    Args:
+        insurer: Insurer record from the data file
+        plan: Plan record from the data file
+
+    Returns:
+        Dict of numeric/boolean features
+    """
+    coverage = plan.get('coverage_static', {})
+    waiting = plan.get('waiting_periods', {})
+
+    ped_waiting = parse_months(waiting.get('ped_waiting_months'))
+    reduced = [parse_months(waiting.get(key)) for key in
+               ('ped_buyback_reduced_to_months', 'ped_reduced_options_months')]
+    ped_waiting_min = min([m for m in [ped_waiting] + reduced if m is not None], default=48)
+
+    max_si = parse_amount(coverage.get('max_sum_insured'))
+
+    return {
+        'plan_id': plan.get('plan_id', ''),
+        'csr_value': parse_percentage(insurer.get('claim_settlement_ratio', {}).get('csr_percentage')) or 0.0,
+        'min_sum_insured': parse_amount(coverage.get('min_sum_insured')) or 0.0,
+        'max_sum_insured': UNLIMITED_SUM_INSURED if max_si in (None, float('inf')) else max_si,
+        'ped_waiting_months': ped_waiting if ped_waiting is not None else 48,
+        'ped_waiting_min_months': ped_waiting_min,
+        'maternity_waiting_months': parse_months(waiting.get('maternity_waiting_months')) or 0,
+        'maternity_level': coverage_level(coverage.get('maternity_coverage')),
+        'opd_level': coverage_level(coverage.get('opd_coverage')),
+        'no_room_rent_limit': str(coverage.get('room_rent_limit', '')).lower().startswith('no limit'),
+        'has_chronic_cover': any(key in waiting for key in CHRONIC_COVER_KEYS)
+    }
+
+
+class ProfileNeeds:
+    """What the structured stage extracts from the free-text form fields"""
+
+    __slots__ = ('has_ped', 'chronic', 'maternity', 'opd', 'room_rent', 'budget_max')
+
+    def __init__(self, user_profile: Dict[str, str]):
+        ped = str(user_profile.get('ped', '') or '').strip().lower()
+        wants = f"{user_profile.get('needs', '')} {user_profile.get('preferences', '')}".lower()
+
+        self.has_ped = ped not in NO_PED_ANSWERS
+        self.chronic = self.has_ped and any(c in ped for c in CHRONIC_CONDITIONS)
+        self.maternity = any(w in wants for w in ('maternity', 'pregnan', 'delivery', 'newborn'))
+        self.opd = any(w in wants for w in ('opd', 'outpatient', 'out-patient', 'consultation'))
+        self.room_rent = 'room rent' in wants
+        self.budget_max = parse_budget(user_profile.get('budget'))[1]
+
+
+class PlanTable:
+    """Column store of typed plan features with vectorised filter + score"""
+
+    def __init__(self, features: Sequence[Dict[str, Any]], records: Sequence[Dict[str, Any]]):
+        """
+        Initialize plan table
+
+        Args:
+            features: plan_features() output per plan
+            records: Matching result records ({'id', 'text', 'metadata'}) returned for each plan
+        """
+        self.records = list(records)
+        self.plan_ids = [f['plan_id'] for f in features]
+
+        self.csr = np.array([f['csr_value'] for f in features], dtype=np.float32)
+        self.min_sum_insured = np.array([f['min_sum_insured'] for f in features], dtype=np.float64)
+        self.max_sum_insured = np.array(
+            [np.inf if f['max_sum_insured'] == UNLIMITED_SUM_INSURED else f['max_sum_insured']
+             for f in features], dtype=np.float64)
+        self.ped_waiting = np.array([f['ped_waiting_months'] for f in features], dtype=np.int16)
+        self.ped_waiting_min = np.array([f['ped_waiting_min_months'] for f in features], dtype=np.int16)
+        self.maternity_level = np.array([f['maternity_level'] for f in features], dtype=np.int8)
+        self.opd_level = np.array([f['opd_level'] for f in features], dtype=np.int8)
+        self.no_room_rent_limit = np.array([f['no_room_rent_limit'] for f in features], dtype=bool)
+        self.has_chronic_cover = np.array([f['has_chronic_cover'] for f in features], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.plan_ids)
+
+    @classmethod
+    def from_chunks(cls, chunks: Sequence[Dict[str, Any]]) -> "PlanTable":
+        """Build from RAGEngine.chunk_insurance_data() output (features live in metadata)"""
+        records = [
+            {'id': chunk.get('id', chunk['metadata']['plan_id']), 'text': chunk['text'], 'metadata': chunk['metadata']}
+            for chunk in chunks
+        ]
+        return cls([chunk['metadata'] for chunk in chunks], records)
+
+    def mask(self, needs: ProfileNeeds) -> np.ndarray:
+        """Hard constraints: plans that cannot serve an explicit need are dropped"""
+        keep = np.ones(len(self), dtype=bool)
+        if needs.maternity:
+            keep &= self.maternity_level > COVER_NONE
+        if needs.opd:
+            keep &= self.opd_level > COVER_NONE
+        return keep
+
+    def score(self, needs: ProfileNeeds) -> np.ndarray:
+        """
+        Profile fit per plan in [0, 1]
+
+        Weighted average of the criteria that apply to this profile: claim
+        settlement ratio always; PED waiting (with buyback/reduction add-ons)
+        and chronic-disease riders when a PED is declared; maternity/OPD
+        coverage level and no room-rent cap when asked for; a low entry sum
+        insured for small budgets.
+        """
+        terms = [(1.0, np.clip((self.csr - 80.0) / 20.0, 0.0, 1.0))]
+
+        if needs.has_ped:
+            terms.append((1.5, np.clip((48 - self.ped_waiting_min) / 36.0, 0.0, 1.0)))
+            if needs.chronic:
+                terms.append((0.5, self.has_chronic_cover.astype(np.float32)))
+        if needs.maternity:
+            terms.append((2.0, self.maternity_level / COVER_BASE))
+        if needs.opd:
+            terms.append((1.5, self.opd_level / COVER_BASE))
+        if needs.room_rent:
+            terms.append((1.0, self.no_room_rent_limit.astype(np.float32)))
+        if needs.budget_max is not None and needs.budget_max <= LOW_BUDGET:
+            terms.append((0.5, (self.min_sum_insured <= LOW_ENTRY_SUM_INSURED).astype(np.float32)))
+
+        total = sum(weight for weight, _ in terms)
+        return sum(weight * values for weight, values in terms) / total
+
+    def rank(self, user_profile: Dict[str, str], top_k: Optional[int] = None,
+             min_candidates: int = 0) -> List[Tuple[int, float]]:
+        """
+        Filter and rank plans for a profile
+
+        Args:
+            user_profile: Dict with age, ped, budget, needs, preferences
+            top_k: Keep only the best k (None = all that pass)
+            min_candidates: If hard filters leave fewer plans than this,
+                fall back to scoring every plan
+
+        Returns:
+            (row index, structured score) pairs, best first
+        """
+        needs = ProfileNeeds(user_profile)
+        scores = self.score(needs)
+        keep = self.mask(needs)
+        if keep.sum() < min_candidates:
+            keep = np.ones(len(self), dtype=bool)
+
+        rows = np.flatnonzero(keep)
+        # Stable sort keeps catalogue order for ties
+        order = rows[np.argsort(-scores[rows], kind='stable')]
+        if top_k is not None:
+            order = order[:top_k]
+        return [(int(i), float(scores[i])) for i in order]
@@ -0,0 +1,92 @@
+"""
+In-memory LRU + TTL caches for query embeddings and retrieval results
+
+Form submissions repeat a lot (same age band, budget, needs), so both the
+query embedding and the top-k search results are cached under a normalised
+key: fields trimmed, lower-cased and whitespace-collapsed.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+PROFILE_FIELDS = ('age', 'ped', 'budget', 'needs', 'preferences')
+
+_MISSING = object()
+
+
+def normalize_text(text: Any) -> str:
+    """Trim, lower-case and collapse internal whitespace"""
+    return re.sub(r'\s+', ' ', str(text or '')).strip().lower()
+
+
+def normalize_profile(user_profile: Dict[str, str]) -> Tuple[str, ...]:
+    """Cache key for a user profile: normalised values of the five form fields"""
+    return tuple(normalize_text(user_profile.get(field, '')) for field in PROFILE_FIELDS)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600.0):
+        """
+        Initialize cache
+
+        Args:
+            maxsize: Maximum number of entries (least recently used evicted first)
+            ttl: Seconds an entry stays valid (None = no expiry)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default on a miss or expired entry"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at >= time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Insert or refresh an entry, evicting the least recently used if full"""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float('inf')
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
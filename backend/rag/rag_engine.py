@@ -2,72 +2,184 @@
 RAG Engine for Health Insurance Recommendations
 
 This module handles:
-- Chunking insurance data into meaningful pieces
+- Chunking the compiled plan catalogue into meaningful pieces
+- Section-level chunks (coverage, waiting periods, exclusions, features)
+  assembled into a token-budgeted LLM context
 - Generating embeddings using Ollama
-- Storing embeddings in ChromaDB vector database
+- Storing embeddings in a vector index (ChromaDB or in-process NumPy)
+- Syncing the index with the data file (only new/changed plans re-embedded)
+- One index writer at a time across processes; readers follow new snapshots
+- Structured pre-filtering/scoring on typed plan metadata
+- BM25 lexical search, fused with the vector ranking by reciprocal rank
 - Semantic search for retrieving relevant plans
 """
 
-import chromadb
-from chromadb.config import Settings
-import ollama
 import json
+import logging
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+try:
+    from .catalogue import SNAPSHOT_FILE, Catalogue, open_catalogue
+    from .context import assemble_context, estimate_tokens, plan_sections, section_relevance
+    from .embedding_cache import EmbeddingCache, text_hash
+    from .file_lock import FileLock
+    from .lexical import BM25Index, plan_document
+    from .ollama_client import shared_client
+    from .plan_filter import COVER_NONE, NO_PED_ANSWERS, PlanTable
+    from .scheduler import REINDEX, llm_priority
+    from .query_cache import TTLCache, normalize_profile, normalize_text
+    from .retrievers import RETRIEVERS, make_retriever
+    from .shared_cache import SQLiteCache
+    from .telemetry import configure_logging, span
+except ImportError:  # imported as a top-level module (setup_embeddings.py)
+    from catalogue import SNAPSHOT_FILE, Catalogue, open_catalogue
+    from context import assemble_context, estimate_tokens, plan_sections, section_relevance
+    from embedding_cache import EmbeddingCache, text_hash
+    from file_lock import FileLock
+    from lexical import BM25Index, plan_document
+    from ollama_client import shared_client
+    from plan_filter import COVER_NONE, NO_PED_ANSWERS, PlanTable
+    from scheduler import REINDEX, llm_priority
+    from query_cache import TTLCache, normalize_profile, normalize_text
+    from retrievers import RETRIEVERS, make_retriever
+    from shared_cache import SQLiteCache
+    from telemetry import configure_logging, span
+
+logger = logging.getLogger(__name__)
+
+# Paths are anchored to this package, not the working directory, so the
+# engine works the same from backend/, backend/rag/ or a process manager
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_PATH = os.getenv(
+    "DATA_PATH", os.path.join(os.path.dirname(RAG_DIR), "data", "indian_health_insurance_data.json"))
+# Holds embedding_cache/, chroma_db/, vector_index/ and the catalogue snapshot
+DEFAULT_STORE_DIR = os.getenv("RAG_STORE_DIR", RAG_DIR)
+# SQLite file for query embeddings shared by worker processes (unset = memory only)
+DEFAULT_SHARED_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH") or None
+
+
+# Retrieval backend: "chroma" (persistent ChromaDB) or "numpy" (in-process matrix)
+DEFAULT_RETRIEVER = os.getenv("RAG_RETRIEVER", "chroma")
+
+# How plans are ranked for a profile:
+#   semantic   - vector search only
+#   hybrid     - structured pre-filter, vector search over the survivors,
+#                ranked by a weighted mean of similarity and structured score
+#   structured - structured score only (no embedding call)
+#   lexical    - structured pre-filter, then BM25 over the survivors fused with
+#                the structured ranking (no embedding call)
+#   fusion     - structured pre-filter, then vector, BM25 and structured
+#                rankings of the survivors fused by reciprocal rank
+RANKING_MODES = ("semantic", "hybrid", "structured", "lexical", "fusion")
+DEFAULT_RANKING = os.getenv("RAG_RANKING", "hybrid")
+STRUCTURED_WEIGHT = float(os.getenv("RAG_STRUCTURED_WEIGHT", "0.5"))
+# Token budget for the plan context sent to the LLM (whole prompt context in
+# crew/single mode, split evenly between the plans in parallel mode)
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "900"))
+
+# Reciprocal-rank fusion constant: a plan at rank r in one ranking adds 1 / (RRF_K + r)
+RRF_K = float(os.getenv("RAG_RRF_K", "60"))
 
 
 class RAGEngine:
     """RAG Engine for semantic search of insurance plans"""
     
-    def __init__(self, data_path: str = "data/indian_health_insurance_data.json"):
+    def __init__(self, data_path: str = DEFAULT_DATA_PATH, store_dir: str = DEFAULT_STORE_DIR,
+                 cache_dir: Optional[str] = None, embed_batch_size: int = 32,
+                 query_cache_size: int = 1024, query_cache_ttl: float = 3600.0,
+                 retriever: str = DEFAULT_RETRIEVER, ranking: str = DEFAULT_RANKING,
+                 shared_cache_path: Optional[str] = DEFAULT_SHARED_CACHE_PATH,
+                 ollama_host: Optional[str] = None, context_tokens: int = DEFAULT_CONTEXT_TOKENS):
         """
         Initialize RAG Engine
         
         Args:
             data_path: Path to insurance data JSON file
+            store_dir: Directory for the vector index and embedding cache
+            cache_dir: Directory for the persistent embedding cache
+                (default: <store_dir>/embedding_cache)
+            embed_batch_size: Texts per Ollama batch embed call
+            query_cache_size: Max entries in each in-memory query cache
+            query_cache_ttl: Seconds a cached query embedding/result stays valid
+            retriever: Vector backend, "chroma" or "numpy"
+            ranking: "semantic", "hybrid", "structured", "lexical" or "fusion"
+                (see RANKING_MODES)
+            shared_cache_path: SQLite file backing the query embedding cache
+                across processes (None = in-memory only)
+            ollama_host: Ollama server for embeddings (default: OLLAMA_HOST)
+            context_tokens: Token budget of get_relevant_context()
         """
+        if ranking not in RANKING_MODES:
+            raise ValueError(f"Unknown ranking mode '{ranking}'. Choose from: {', '.join(RANKING_MODES)}")
+
         self.data_path = data_path
+        self.catalogue_snapshot = os.path.join(store_dir, SNAPSHOT_FILE)
         self.embedding_model = "nomic-embed-text"
+        self.embed_batch_size = embed_batch_size
+        # Pooled connections, timeouts, retries and coalescing (shared per process)
+        self.ollama = shared_client(ollama_host)
+        self.embedding_cache = EmbeddingCache(
+            cache_dir or os.path.join(store_dir, "embedding_cache"), self.embedding_model)
         
-        # Initialize ChromaDB with persistent storage
-        self.client = chromadb.PersistentClient(path="./rag/chroma_db")
+        # Repeated profiles skip both the embedding call and the vector query
+        self.query_embedding_cache = TTLCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        self.search_cache = TTLCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        self.shared_query_cache = SQLiteCache(
+            shared_cache_path, table="query_embeddings", ttl=query_cache_ttl) if shared_cache_path else None
         
-        # Try to get existing collection or create new one
-        try:
-            self.collection = self.client.get_collection(name="insurance_plans")
-            print("✅ Loaded existing vector database")
-        except:
-            self.collection = None
-            print("⚠️  No existing vector database found")
+        # Vector index (loads the persisted index if one exists)
+        retriever_cls = RETRIEVERS.get(retriever)
+        index_options = {'path': os.path.join(store_dir, retriever_cls.dirname)} if retriever_cls else {}
+        self.retriever = make_retriever(retriever, **index_options)
+        
+        # Typed plan columns for the structured stage (built on first use)
+        self.ranking = ranking
+        self._plan_table: Optional[PlanTable] = None
+        # (plan table, BM25 index over the same rows), rebuilt with the table
+        self._lexical: Optional[tuple] = None
+        # (catalogue version, chunks) from the last chunk_insurance_data()
+        self._chunks: Optional[tuple] = None
+        # (catalogue version, section chunks, BM25 index over them, rows per plan_id)
+        self._sections: Optional[tuple] = None
+        self.context_tokens = context_tokens
+        
+        # One index writer at a time (setup or sync): a thread lock within
+        # this process, a file lock across workers and the setup script
+        self._index_lock = threading.Lock()
+        self._write_lock = FileLock(os.path.join(store_dir, "index.lock"))
     
-    def load_insurance_data(self) -> Dict[str, Any]:
-        """Load insurance data from JSON file"""
-        with open(self.data_path, 'r') as f:
-            return json.load(f)
+    @property
+    def catalogue(self) -> Catalogue:
+        """Compiled plan catalogue for the data file's current contents"""
+        return open_catalogue(self.data_path, self.catalogue_snapshot)
     
     def chunk_insurance_data(self) -> List[Dict[str, Any]]:
         """
-        Create chunks from insurance data
-        Each chunk = 1 complete plan with all details
+        Create chunks from the plan catalogue
+        Each chunk = 1 complete plan with all details, keyed by its plan_id
         
         Returns:
-            List of chunks with metadata
+            List of chunks with id, text and metadata (including a content_hash)
         """
-        data = self.load_insurance_data()
-        chunks = []
+        catalogue = self.catalogue
+        if self._chunks is not None and self._chunks[0] == catalogue.version:
+            return self._chunks[1]
         
-        for insurer in data['insurers']:
-            insurer_name = insurer['insurer_name']
-            csr = insurer['claim_settlement_ratio']['csr_percentage']
+        chunks = []
+        for record in catalogue:
+            insurer_name = record.insurer.name
+            csr = record.insurer.csr_text
+            plan_name = record.name
+            coverage = record.coverage
+            waiting = record.waiting
+            features = list(record.key_features)
             
-            for plan in insurer['plans']:
-                plan_name = plan['plan_name']
-                coverage = plan['coverage_static']
-                waiting = plan['waiting_periods']
-                features = plan.get('key_features', [])
-                
-                # Create comprehensive text for this plan
-                chunk_text = f"""
+            # Create comprehensive text for this plan
+            chunk_text = f"""
                 Plan Name: {plan_name}
                 Insurance Company: {insurer_name}
                 Claim Settlement Ratio: {csr}%
@@ -87,21 +199,50 @@ class RAGEngine:
                 
                 Best For: {self._determine_best_for(coverage, features, waiting)}
                 """.strip()
-                
-                chunks.append({
-                    'text': chunk_text,
-                    'metadata': {
-                        'plan_name': plan_name,
-                        'insurer': insurer_name,
-                        'csr': csr,
-                        'has_maternity': 'maternity' in chunk_text.lower(),
-                        'has_opd': coverage.get('opd_coverage', 'Not available') != 'Not available',
-                        'ped_waiting': waiting.get('ped_waiting_months', 0)
-                    }
-                })
+            
+            typed = record.features
+            metadata = {
+                'plan_name': plan_name,
+                'insurer': insurer_name,
+                'csr': csr,
+                'has_maternity': typed['maternity_level'] > COVER_NONE,
+                'has_opd': typed['opd_level'] > COVER_NONE,
+                'ped_waiting': waiting.get('ped_waiting_months', 0),
+                **typed
+            }
+            # Changes to the text, the parsed fields or the model all need a re-embed
+            metadata['content_hash'] = text_hash(
+                f"{self.embedding_model}\n{chunk_text}\n{json.dumps(metadata, sort_keys=True)}"
+            )
+            chunks.append({'id': record.plan_id, 'text': chunk_text, 'metadata': metadata})
         
+        self._chunks = (catalogue.version, chunks)
         return chunks
     
+    def section_chunks(self) -> List[Dict[str, Any]]:
+        """
+        Section-level chunks of every plan (see rag/context.py), linked to
+        their parent by plan_id; not embedded, ranked with BM25
+        
+        Returns:
+            Section dicts with id ("<plan_id>#<section>"), plan_id, section, text and tokens
+        """
+        return self._section_store()[1]
+    
+    def _section_store(self) -> tuple:
+        catalogue = self.catalogue
+        if self._sections is None or self._sections[0] != catalogue.version:
+            sections = []
+            for record in catalogue:
+                best_for = self._determine_best_for(record.coverage, list(record.key_features), record.waiting)
+                sections.extend(plan_sections(record, best_for))
+            rows: Dict[str, List[int]] = {}
+            for row, section in enumerate(sections):
+                rows.setdefault(section['plan_id'], []).append(row)
+            index = BM25Index([section['text'] for section in sections])
+            self._sections = (catalogue.version, sections, index, rows)
+        return self._sections
+    
     def _determine_best_for(self, coverage: Dict, features: List, waiting: Dict) -> str:
         """Determine what type of users this plan is best for"""
         best_for = []
@@ -134,52 +275,154 @@ class RAGEngine:
             Embedding vector
         """
         try:
-            response = ollama.embeddings(
+            response = self.ollama.embed(
                 model=self.embedding_model,
-                prompt=text
+                input=text
             )
-            return response["embedding"]
+            return response["embeddings"][0]
         except Exception as e:
-            print(f"❌ Error generating embedding: {e}")
+            logger.error(f"❌ Error generating embedding: {e}")
             raise
     
-    def setup_vector_database(self) -> None:
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
-        One-time setup: Create embeddings and store in ChromaDB
+        Generate embeddings for many texts, using the on-disk cache
+        
+        Cache misses are sent to Ollama's batch embed endpoint in batches of
+        `embed_batch_size` and written back to the cache. The calls run at
+        reindex priority, behind interactive query embeddings.
+        
+        Args:
+            texts: Input texts to embed
+            
+        Returns:
+            Embedding vectors in the same order as texts
         """
-        print("🚀 Setting up vector database...")
+        embeddings = self.embedding_cache.get_many(texts)
         
-        # Delete existing collection if it exists
-        try:
-            self.client.delete_collection(name="insurance_plans")
-            print("🗑️  Deleted old collection")
-        except:
-            pass
-        
-        # Create new collection
-        self.collection = self.client.create_collection(
-            name="insurance_plans",
-            metadata={"hnsw:space": "cosine"}  # Use cosine similarity
-        )
+        # Unique texts that still need embedding
+        missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+        logger.info(f"  ✓ Cache hits: {len(texts) - sum(e is None for e in embeddings)}/{len(texts)}")
+        
+        for start in range(0, len(missing), self.embed_batch_size):
+            batch = missing[start:start + self.embed_batch_size]
+            try:
+                with llm_priority(REINDEX):
+                    response = self.ollama.embed(
+                        model=self.embedding_model,
+                        input=batch
+                    )
+            except Exception as e:
+                logger.error(f"❌ Error generating embeddings: {e}")
+                raise
+            self.embedding_cache.put_many(batch, response["embeddings"])
+            logger.info(f"  ✓ Embedded batch of {len(batch)}")
         
-        # Get chunks
-        chunks = self.chunk_insurance_data()
-        print(f"📦 Created {len(chunks)} plan chunks")
+        if missing:
+            embeddings = self.embedding_cache.get_many(texts)
+        
+        return embeddings
+    
+    def setup_vector_database(self) -> None:
+        """
+        One-time setup: Create embeddings and store them in the vector index
+        
+        Drops and rebuilds the whole index; use sync_vector_database() to
+        apply data changes to a live index.
+        """
+        logger.info(f"🚀 Setting up vector database ({self.retriever.name})...")
         
-        # Generate embeddings and store
-        print("🧠 Generating embeddings...")
-        for i, chunk in enumerate(chunks):
-            embedding = self.generate_embedding(chunk['text'])
+        with self._index_lock, self._write_lock:
+            # Get chunks
+            chunks = self.chunk_insurance_data()
+            logger.info(f"📦 Created {len(chunks)} plan chunks")
             
-            self.collection.add(
-                embeddings=[embedding],
-                documents=[chunk['text']],
-                metadatas=[chunk['metadata']],
-                ids=[f"plan_{i}"]
+            # Generate embeddings (cached + batched) and store in one bulk build
+            logger.info("🧠 Generating embeddings...")
+            embeddings = self.generate_embeddings([chunk['text'] for chunk in chunks])
+            
+            self.retriever.build(
+                ids=[chunk['id'] for chunk in chunks],
+                embeddings=embeddings,
+                documents=[chunk['text'] for chunk in chunks],
+                metadatas=[chunk['metadata'] for chunk in chunks]
             )
-            print(f"  ✓ Embedded: {chunk['metadata']['plan_name']}")
+            for chunk in chunks:
+                logger.info(f"  ✓ Embedded: {chunk['metadata']['plan_name']}")
+            
+            # Cached search results point at the old index
+            self.search_cache.clear()
+            self._plan_table = PlanTable.from_chunks(chunks)
+        
+        logger.info(f"✅ Vector database ready! {len(chunks)} plans embedded.")
+    
+    def sync_vector_database(self) -> Dict[str, int]:
+        """
+        Bring the index in line with the data file without a rebuild
+        
+        Plans whose content hash is new or different are embedded and
+        upserted, plans no longer in the file are deleted, and unchanged
+        plans are left alone. The index keeps serving searches throughout.
+        Builds from scratch if there is no index yet.
+        
+        Returns:
+            Counts of added, updated, removed and unchanged plans
+        """
+        if not self.retriever.is_ready():
+            self.setup_vector_database()
+            return {'added': len(self.plan_table), 'updated': 0, 'removed': 0, 'unchanged': 0}
+        
+        with self._index_lock, self._write_lock:
+            # Another process may have written since we loaded; diff against its snapshot
+            if self.retriever.is_stale():
+                self.retriever.reload()
+            chunks = self.chunk_insurance_data()
+            stored = self.retriever.content_hashes()
+            
+            wanted = {chunk['id'] for chunk in chunks}
+            changed = [chunk for chunk in chunks if stored.get(chunk['id']) != chunk['metadata']['content_hash']]
+            # Also drops positional ids (plan_0, ...) left by older builds
+            removed = [record_id for record_id in stored if record_id not in wanted]
+            
+            if changed:
+                embeddings = self.generate_embeddings([chunk['text'] for chunk in changed])
+                self.retriever.upsert(
+                    ids=[chunk['id'] for chunk in changed],
+                    embeddings=embeddings,
+                    documents=[chunk['text'] for chunk in changed],
+                    metadatas=[chunk['metadata'] for chunk in changed]
+                )
+            if removed:
+                self.retriever.delete(removed)
+            
+            if changed or removed:
+                self.search_cache.clear()
+            self._plan_table = PlanTable.from_chunks(chunks)
+        
+        added = sum(chunk['id'] not in stored for chunk in changed)
+        stats = {
+            'added': added,
+            'updated': len(changed) - added,
+            'removed': len(removed),
+            'unchanged': len(chunks) - len(changed)
+        }
+        logger.info(f"🔄 Synced vector database: {stats}")
+        return stats
+    
+    def reload_index(self) -> bool:
+        """
+        Switch to the index most recently persisted by the writer process
+        
+        Used by read-only workers; cached search results and the plan table
+        are dropped since they describe the old index.
         
-        print(f"\n✅ Vector database ready! {len(chunks)} plans embedded.")
+        Returns:
+            True if an index is loaded
+        """
+        ready = self.retriever.reload()
+        self.search_cache.clear()
+        self._plan_table = None
+        return ready
     
     def semantic_search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """
@@ -192,42 +435,178 @@ class RAGEngine:
         Returns:
             List of relevant plan chunks with metadata
         """
-        if not self.collection:
+        return self.semantic_search_batch([query], top_k=top_k)[0]
+    
+    def semantic_search_batch(self, queries: List[str], top_k: int = 3,
+                              plan_ids: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search for many queries at once: one embedding call for the cache
+        misses and one vectorised index query
+        
+        Args:
+            queries: User queries (natural language)
+            top_k: Number of results per query
+            plan_ids: Only search among these plans (None = all)
+            
+        Returns:
+            One list of relevant plan chunks per query
+        """
+        if not self.retriever.is_ready():
             raise ValueError("Vector database not initialized. Run setup_vector_database() first.")
         
-        # Generate query embedding
-        query_embedding = self.generate_embedding(query)
+        # Generate query embeddings (cached by normalised query text)
+        query_embeddings = self.embed_queries(queries)
         
-        # Search in vector database
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
-        )
+        # Search in vector index
+        with span("vector_query"):
+            return self.retriever.search_batch(query_embeddings, top_k=top_k, plan_ids=plan_ids)
+    
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embedding for a search query, served from the in-memory cache when possible
+        
+        Args:
+            query: User query (natural language)
+            
+        Returns:
+            Embedding vector
+        """
+        return self.embed_queries([query])[0]
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embeddings for many queries; cache misses go to Ollama in one batch
+        
+        Looked up in this process's memory first, then in the shared SQLite
+        tier (if configured), so a query embedded by one worker is free for
+        the others.
         
-        # Format results
-        relevant_plans = []
-        for i in range(len(results['documents'][0])):
-            relevant_plans.append({
-                'text': results['documents'][0][i],
-                'metadata': results['metadatas'][0][i],
-                'similarity': 1 - results['distances'][0][i]  # Convert distance to similarity
-            })
+        Args:
+            queries: User queries (natural language)
+            
+        Returns:
+            Embedding vectors in the same order as queries
+        """
+        keys = [normalize_text(q) for q in queries]
+        embeddings = [self.query_embedding_cache.get(key) for key in keys]
+        
+        missing = {}
+        for key, query, embedding in zip(keys, queries, embeddings):
+            if embedding is None:
+                missing.setdefault(key, query)
         
-        return relevant_plans
+        fresh = {}
+        if missing and self.shared_query_cache is not None:
+            for key in list(missing):
+                stored = self.shared_query_cache.get(f"{self.embedding_model}:{key}")
+                if stored is not None:
+                    fresh[key] = np.frombuffer(stored, dtype=np.float32).tolist()
+                    del missing[key]
+        
+        if missing:
+            try:
+                with span("embedding") as timing:
+                    response = self.ollama.embed(
+                        model=self.embedding_model,
+                        input=list(missing.values())
+                    )
+                    timing.add_tokens(prompt=response.get("prompt_eval_count") or 0)
+            except Exception as e:
+                logger.error(f"❌ Error generating embeddings: {e}")
+                raise
+            computed = dict(zip(missing, response["embeddings"]))
+            if self.shared_query_cache is not None:
+                self.shared_query_cache.put_many(
+                    (f"{self.embedding_model}:{key}", np.asarray(embedding, dtype=np.float32).tobytes())
+                    for key, embedding in computed.items()
+                )
+            fresh.update(computed)
+        
+        if fresh:
+            for key, embedding in fresh.items():
+                self.query_embedding_cache.put(key, embedding)
+            embeddings = [e if e is not None else fresh[k] for k, e in zip(keys, embeddings)]
+        
+        return embeddings
     
-    def get_relevant_context(self, user_profile: Dict[str, str], top_k: int = 3) -> str:
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the query caches"""
+        return {
+            'query_embeddings': self.query_embedding_cache.stats(),
+            'search_results': self.search_cache.stats(),
+            'shared_query_embeddings': self.shared_query_cache.stats() if self.shared_query_cache else None
+        }
+    
+    @property
+    def plan_table(self) -> PlanTable:
+        """Typed plan columns, parsed from the data file on first use"""
+        if self._plan_table is None:
+            self._plan_table = PlanTable.from_chunks(self.chunk_insurance_data())
+        return self._plan_table
+    
+    @property
+    def lexical_index(self) -> BM25Index:
+        """BM25 index row-aligned with plan_table (chunk text plus exclusions, notes, etc.)"""
+        table = self.plan_table
+        if self._lexical is None or self._lexical[0] is not table:
+            catalogue = self.catalogue
+            documents = []
+            for record in table.records:
+                plan_id = record['metadata'].get('plan_id')
+                extra = plan_document(catalogue.plan(plan_id)) if plan_id in catalogue else ''
+                documents.append(f"{record['text']}\n{extra}")
+            self._lexical = (table, BM25Index(documents))
+        return self._lexical[1]
+    
+    def lexical_search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """
-        Get relevant plan context for user profile
+        BM25 search over all plans; no embedding call
         
         Args:
-            user_profile: Dict with age, ped, budget, needs, preferences
-            top_k: Number of plans to retrieve
+            query: Free text ("diabetes low waiting period", "maternity OPD")
+            top_k: Number of results to return
             
         Returns:
-            Formatted context string for LLM
+            Plan chunks with 'bm25' and 'score', best first (only plans matching a term)
+        """
+        table = self.plan_table
+        with span("lexical_rank"):
+            rows = self.lexical_index.rank(query, top_k=top_k)
+        return [{**table.records[row], 'bm25': score, 'score': score} for row, score in rows]
+    
+    def search_sections(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """
-        # Create semantic query from user profile
-        query = f"""
+        BM25 search over section chunks, grouped back to plans; no embedding call
+        
+        Args:
+            query: Free text ("co-payment after 60", "bariatric surgery")
+            top_k: Number of plans to return
+            
+        Returns:
+            Plans ranked by their best section: {'plan_id', 'score', 'sections': [{..., 'score'}]}
+        """
+        _, sections, index, _ = self._section_store()
+        grouped: Dict[str, Dict[str, Any]] = {}
+        with span("lexical_rank"):
+            for row, score in index.rank(query):
+                section = sections[row]
+                plan = grouped.setdefault(section['plan_id'], {'plan_id': section['plan_id'], 'score': score, 'sections': []})
+                plan['sections'].append({**section, 'score': score})
+        # rank() is best first, so each plan's first section set its score
+        return sorted(grouped.values(), key=lambda plan: -plan['score'])[:top_k]
+    
+    @staticmethod
+    def lexical_query(user_profile: Dict[str, str]) -> str:
+        """BM25 query for a profile: the free-text fields, without the semantic boilerplate"""
+        ped = str(user_profile.get('ped') or '')
+        parts = [] if ped.strip().lower() in NO_PED_ANSWERS else [ped]
+        parts += [str(user_profile.get('needs') or ''), str(user_profile.get('preferences') or '')]
+        return ' '.join(part for part in parts if part.strip())
+    
+    @staticmethod
+    def profile_query(user_profile: Dict[str, str]) -> str:
+        """Semantic query text for a user profile"""
+        return f"""
         User Profile:
         - Age: {user_profile.get('age')} years
         - Pre-existing Conditions: {user_profile.get('ped', 'None')}
@@ -237,22 +616,229 @@ class RAGEngine:
         
         Find insurance plans that match these requirements.
         """.strip()
+    
+    def retrieve(self, user_profile: Dict[str, str], top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Rank plans for a user profile using the configured ranking mode
+        
+        Args:
+            user_profile: Dict with age, ped, budget, needs, preferences
+            top_k: Number of plans to return
+            
+        Returns:
+            Plan chunks with 'similarity', 'structured_score', the final 'score'
+            and a 'breakdown' of how each component contributed to it
+        """
+        return self.retrieve_batch([user_profile], top_k=top_k)[0]
+    
+    def retrieve_batch(self, user_profiles: List[Dict[str, str]], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        retrieve() for many profiles: one embedding call for the query cache
+        misses and one vectorised index query for the whole batch
+        
+        Args:
+            user_profiles: Dicts with age, ped, budget, needs, preferences
+            top_k: Number of plans per profile
+            
+        Returns:
+            One ranked plan list per profile, in input order
+        """
+        if not user_profiles:
+            return []
+        
+        if self.ranking == "semantic":
+            with span("query_build"):
+                queries = [self.profile_query(p) for p in user_profiles]
+            return [
+                [{**plan, 'structured_score': None, 'score': plan['similarity'],
+                  'breakdown': {'vector': {'value': plan['similarity'], 'contribution': plan['similarity']}}}
+                 for plan in plans]
+                for plans in self.semantic_search_batch(queries, top_k=top_k)
+            ]
+        
+        table = self.plan_table
+        with span("structured_rank"):
+            ranked = [table.rank(p, min_candidates=top_k) for p in user_profiles]
+        
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(user_profiles)
+        searched = []
+        for i, rows in enumerate(ranked):
+            # With no more survivors than slots the vector search cannot change the set
+            if self.ranking == "structured" or len(rows) <= top_k:
+                results[i] = [
+                    {**table.records[row], 'similarity': None, 'structured_score': score, 'score': score,
+                     'breakdown': {'structured': {'value': score, 'contribution': score}}}
+                    for row, score in rows[:top_k]
+                ]
+            elif self.ranking == "lexical":
+                with span("lexical_rank"):
+                    lexical = self.lexical_index.rank(self.lexical_query(user_profiles[i]), rows=[row for row, _ in rows])
+                results[i] = self._fuse(table, {'bm25': lexical, 'structured': rows}, top_k)
+            else:
+                searched.append(i)
+        
+        if searched:
+            # hybrid/fusion: vector search only over plans that passed each profile's hard filters
+            structured = [{table.plan_ids[row]: score for row, score in ranked[i]} for i in searched]
+            candidates = sorted(set().union(*structured))
+            with span("query_build"):
+                queries = [self.profile_query(user_profiles[i]) for i in searched]
+            batch = self.semantic_search_batch(queries, top_k=len(candidates), plan_ids=candidates)
+            rows_by_id = {plan_id: row for row, plan_id in enumerate(table.plan_ids)}
+            for i, query, scores, plans in zip(searched, queries, structured, batch):
+                plans = [plan for plan in plans if plan['metadata'].get('plan_id') in scores]
+                if not plans:
+                    # Index built before plans carried a plan_id - search unfiltered
+                    results[i] = self._blend(self.semantic_search(query, top_k=len(table)), scores, top_k)
+                elif self.ranking == "fusion":
+                    with span("lexical_rank"):
+                        lexical = self.lexical_index.rank(
+                            self.lexical_query(user_profiles[i]), rows=[row for row, _ in ranked[i]])
+                    vector = [(rows_by_id[plan['metadata']['plan_id']], plan['similarity']) for plan in plans]
+                    results[i] = self._fuse(table, {'vector': vector, 'bm25': lexical, 'structured': ranked[i]}, top_k)
+                else:
+                    results[i] = self._blend(plans, scores, top_k)
+        
+        return results
+    
+    @staticmethod
+    def _blend(plans: List[Dict[str, Any]], structured: Dict[str, float], top_k: int) -> List[Dict[str, Any]]:
+        """Hybrid ranking: weighted mean of similarity and structured score"""
+        for plan in plans:
+            plan['structured_score'] = structured.get(plan['metadata'].get('plan_id'), 0.0)
+            plan['breakdown'] = {
+                'vector': {'value': plan['similarity'],
+                           'contribution': plan['similarity'] / (1 + STRUCTURED_WEIGHT)},
+                'structured': {'value': plan['structured_score'],
+                               'contribution': STRUCTURED_WEIGHT * plan['structured_score'] / (1 + STRUCTURED_WEIGHT)}
+            }
+            plan['score'] = sum(part['contribution'] for part in plan['breakdown'].values())
+        plans.sort(key=lambda plan: plan['score'], reverse=True)
+        return plans[:top_k]
+    
+    @staticmethod
+    def _fuse(table: PlanTable, rankings: Dict[str, List[tuple]], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Reciprocal-rank fusion of several (row, value) rankings, best first
+        
+        A plan gets 1 / (RRF_K + rank) from every ranking it appears in; the
+        sum is scaled so a plan ranked first everywhere scores 1.0. Plans the
+        BM25 ranking left out (no term matched) get nothing from it.
+        """
+        breakdowns: Dict[int, Dict[str, Dict[str, float]]] = {}
+        for name, ranked in rankings.items():
+            for rank, (row, value) in enumerate(ranked, 1):
+                breakdowns.setdefault(row, {})[name] = {
+                    'value': value, 'rank': rank, 'contribution': 1.0 / (RRF_K + rank)
+                }
         
-        # Perform semantic search
-        relevant_plans = self.semantic_search(query, top_k=top_k)
+        best = len(rankings) / (RRF_K + 1)
+        scores = {row: sum(part['contribution'] for part in breakdown.values()) / best
+                  for row, breakdown in breakdowns.items()}
+        # Ties (equal rank sums) keep the structured order
+        order = sorted(breakdowns, key=lambda row: (
+            -scores[row], breakdowns[row].get('structured', {}).get('rank', len(table))))
+        fused = [
+            {
+                **table.records[row],
+                'similarity': breakdowns[row].get('vector', {}).get('value'),
+                'structured_score': breakdowns[row].get('structured', {}).get('value', 0.0),
+                'bm25': breakdowns[row].get('bm25', {}).get('value', 0.0),
+                'score': scores[row],
+                'breakdown': breakdowns[row]
+            }
+            for row in order[:top_k]
+        ]
+        return fused
+    
+    def relevant_plans(self, user_profile: Dict[str, str], top_k: int = 3) -> List[Dict[str, Any]]:
+        """retrieve(), cached per normalised profile"""
+        return self.relevant_plans_batch([user_profile], top_k=top_k)[0]
+    
+    def relevant_plans_batch(self, user_profiles: List[Dict[str, str]], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """retrieve_batch() for the profiles not in the search cache; duplicates are retrieved once"""
+        keys = [(normalize_profile(p), top_k, self.ranking) for p in user_profiles]
+        results = [self.search_cache.get(key) for key in keys]
         
-        # Format context
-        context = "RELEVANT INSURANCE PLANS (Based on semantic search):\n\n"
-        for i, plan in enumerate(relevant_plans, 1):
-            context += f"{'='*60}\n"
-            context += f"PLAN {i} (Relevance: {plan['similarity']:.2%})\n"
-            context += f"{'='*60}\n"
-            context += plan['text'] + "\n\n"
+        missing: Dict[Any, Dict[str, str]] = {}
+        for key, profile, plans in zip(keys, user_profiles, results):
+            if plans is None:
+                missing.setdefault(key, profile)
+        
+        if missing:
+            fresh = dict(zip(missing, self.retrieve_batch(list(missing.values()), top_k=top_k)))
+            for key, plans in fresh.items():
+                self.search_cache.put(key, plans)
+            results = [plans if plans is not None else fresh[key] for key, plans in zip(keys, results)]
+        return results
+    
+    def build_context(self, user_profile: Dict[str, str], top_k: int = 3,
+                      budget_tokens: Optional[int] = None,
+                      plans: Optional[List[Dict[str, Any]]] = None, header: bool = True) -> tuple:
+        """
+        Plan context for the LLM: each plan's summary plus the sections most
+        relevant to the profile, within a token budget
         
+        Args:
+            user_profile: Dict with age, ped, budget, needs, preferences
+            top_k: Number of plans to retrieve
+            budget_tokens: Token budget (default: context_tokens)
+            plans: Already retrieved plans to use instead of relevant_plans()
+            header: Start with the "RELEVANT INSURANCE PLANS" line
+            
+        Returns:
+            (context text, stats with tokens, budget, included and dropped section ids)
+        """
+        if plans is None:
+            plans = self.relevant_plans(user_profile, top_k=top_k)
+        _, sections, index, rows = self._section_store()
+        
+        groups, section_rows = [], []
+        for plan in plans:
+            plan_rows = rows.get(plan['metadata'].get('plan_id'))
+            if plan_rows is None:
+                # Index built from an older data file: fall back to the whole chunk
+                groups.append([{'id': plan['id'], 'section': 'summary', 'text': plan['text'],
+                                'tokens': estimate_tokens(plan['text'])}])
+            else:
+                groups.append([sections[row] for row in plan_rows])
+                section_rows.extend(plan_rows)
+        
+        query = self.lexical_query(user_profile)
+        relevance = section_relevance(index.scores(query), sections, section_rows) if query else {}
+        return assemble_context(
+            plans, groups, relevance,
+            budget_tokens=self.context_tokens if budget_tokens is None else budget_tokens,
+            header=f"RELEVANT INSURANCE PLANS (Based on {self.ranking} search):" if header else ''
+        )
+    
+    def get_relevant_context(self, user_profile: Dict[str, str], top_k: int = 3) -> str:
+        """
+        Get relevant plan context for user profile
+        
+        Args:
+            user_profile: Dict with age, ped, budget, needs, preferences
+            top_k: Number of plans to retrieve
+            
+        Returns:
+            Formatted context string for LLM, at most context_tokens long
+            (plus the plan summaries, which are never dropped)
+        """
+        context, stats = self.build_context(user_profile, top_k=top_k)
+        logger.debug(f"📐 Context: {stats['tokens']}/{stats['budget']} tokens, "
+                     f"{len(stats['included'])} sections, dropped {stats['dropped']}")
         return context
-
+    
+    def plan_contexts(self, user_profile: Dict[str, str], top_k: int = 3) -> List[str]:
+        """One context per retrieved plan, each with an equal share of the token budget (parallel mode)"""
+        plans = self.relevant_plans(user_profile, top_k=top_k)
+        budget = self.context_tokens // max(1, len(plans))
+        return [self.build_context(user_profile, budget_tokens=budget, plans=[plan], header=False)[0]
+                for plan in plans]
 
 if __name__ == "__main__":
+    configure_logging(asynchronous=False)
+    
     # Test the RAG engine
     rag = RAGEngine()
     
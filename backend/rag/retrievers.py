@@ -0,0 +1,415 @@
+"""
+Pluggable retrieval backends for RAGEngine
+
+- ChromaRetriever: persistent ChromaDB collection (HNSW, cosine)
+- NumpyRetriever: in-process exact search over a contiguous, L2-normalised
+  float32 matrix saved as a `.npy` file and loaded memory-mapped. With only a
+  handful of chunks per insurer, one matrix-vector product plus
+  `argpartition` beats a database round-trip. Every write produces a new
+  read-only snapshot directory and swaps a `CURRENT` pointer to it, so many
+  worker processes can share one copy of the matrix in the page cache and
+  pick up new snapshots without ever seeing a half-written index.
+
+Both return results in the same shape as `RAGEngine.semantic_search`:
+`{'id', 'text', 'metadata', 'similarity'}`, and can restrict a search to a
+candidate set of `plan_id`s chosen by the structured pre-filter. Records are
+keyed by `plan_id` and carry a `content_hash` in their metadata, so an index
+can be synced (upsert changed records, delete removed ones) in place.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "insurance_plans"
+
+# Index files live next to this module unless a path is given
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# NumPy index layout: <path>/CURRENT names the live <path>/snapshot-*/ directory
+SNAPSHOT_PREFIX = "snapshot-"
+MATRIX_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json"
+KEEP_SNAPSHOTS = 2
+
+
+class Retriever:
+    """Interface for vector retrieval backends"""
+
+    name = "base"
+    # Directory name of the index under a store directory
+    dirname = "index"
+
+    def is_ready(self) -> bool:
+        """True once an index is loaded and searchable"""
+        raise NotImplementedError
+
+    def reload(self) -> bool:
+        """Re-open the persisted index (e.g. built by another process); returns is_ready()"""
+        raise NotImplementedError
+
+    def is_stale(self) -> bool:
+        """True if another process has persisted a newer index than the one loaded"""
+        return False
+
+    def build(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]],
+              documents: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Replace the index contents with the given records"""
+        raise NotImplementedError
+
+    def content_hashes(self) -> Dict[str, str]:
+        """id -> `content_hash` metadata of every stored record (empty if no index)"""
+        raise NotImplementedError
+
+    def upsert(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]],
+               documents: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Insert new records and replace existing ones with the same id"""
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """Remove records by id (unknown ids are ignored)"""
+        raise NotImplementedError
+
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], top_k: int = 3,
+                     plan_ids: Optional[Sequence[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Top-k results for each query embedding, optionally only among `plan_ids`"""
+        raise NotImplementedError
+
+    def search(self, query_embedding: Sequence[float], top_k: int = 3,
+               plan_ids: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Top-k results for one query embedding"""
+        return self.search_batch([query_embedding], top_k=top_k, plan_ids=plan_ids)[0]
+
+
+class ChromaRetriever(Retriever):
+    """ChromaDB persistent collection"""
+
+    name = "chroma"
+    dirname = "chroma_db"
+
+    def __init__(self, path: str = os.path.join(RAG_DIR, "chroma_db")):
+        """
+        Initialize ChromaDB retriever
+
+        Args:
+            path: Directory of the persistent ChromaDB store
+        """
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = None
+        self.reload()
+
+    def is_ready(self) -> bool:
+        return self.collection is not None
+
+    def reload(self) -> bool:
+        # Try to get existing collection
+        try:
+            self.collection = self.client.get_collection(name=COLLECTION_NAME)
+            logger.info("✅ Loaded existing vector database")
+        except Exception:
+            self.collection = None
+            logger.warning("⚠️  No existing vector database found")
+        return self.is_ready()
+
+    def build(self, ids, embeddings, documents, metadatas) -> None:
+        # Delete existing collection if it exists
+        try:
+            self.client.delete_collection(name=COLLECTION_NAME)
+            logger.info("🗑️  Deleted old collection")
+        except Exception:
+            pass
+
+        self.collection = self.client.create_collection(
+            name=COLLECTION_NAME,
+            metadata={"hnsw:space": "cosine"}  # Use cosine similarity
+        )
+        self.collection.add(
+            embeddings=np.asarray(embeddings, dtype=np.float32),
+            documents=list(documents),
+            metadatas=list(metadatas),
+            ids=list(ids)
+        )
+
+    def content_hashes(self) -> Dict[str, str]:
+        if self.collection is None:
+            return {}
+        records = self.collection.get(include=['metadatas'])
+        return {
+            record_id: (metadata or {}).get('content_hash', '')
+            for record_id, metadata in zip(records['ids'], records['metadatas'])
+        }
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        if not ids:
+            return
+        if self.collection is None:
+            self.collection = self.client.get_or_create_collection(
+                name=COLLECTION_NAME,
+                metadata={"hnsw:space": "cosine"}
+            )
+        self.collection.upsert(
+            embeddings=np.asarray(embeddings, dtype=np.float32),
+            documents=list(documents),
+            metadatas=list(metadatas),
+            ids=list(ids)
+        )
+
+    def delete(self, ids) -> None:
+        if self.collection is not None and ids:
+            self.collection.delete(ids=list(ids))
+
+    def search_batch(self, query_embeddings, top_k: int = 3,
+                     plan_ids: Optional[Sequence[str]] = None) -> List[List[Dict[str, Any]]]:
+        query = {}
+        if plan_ids is not None:
+            if not plan_ids:
+                return [[] for _ in range(len(query_embeddings))]
+            query['where'] = {'plan_id': {'$in': list(plan_ids)}}
+            top_k = min(top_k, len(plan_ids))
+
+        results = self.collection.query(
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32),
+            n_results=top_k,
+            **query
+        )
+
+        batch = []
+        for q in range(len(results['documents'])):
+            batch.append([
+                {
+                    'id': results['ids'][q][i],
+                    'text': results['documents'][q][i],
+                    'metadata': results['metadatas'][q][i],
+                    'similarity': 1 - results['distances'][q][i]  # Convert distance to similarity
+                }
+                for i in range(len(results['documents'][q]))
+            ])
+        return batch
+
+
+class NumpyRetriever(Retriever):
+    """Exact cosine search over a memory-mapped, L2-normalised float32 matrix"""
+
+    name = "numpy"
+    dirname = "vector_index"
+
+    def __init__(self, path: str = os.path.join(RAG_DIR, "vector_index")):
+        """
+        Initialize NumPy retriever, loading a saved index if present
+
+        Args:
+            path: Directory holding the CURRENT pointer and snapshot-*/ directories
+        """
+        self.path = path
+        self.current_path = os.path.join(path, "CURRENT")
+        # Snapshot directory name of the loaded index ('' = legacy files in `path`)
+        self.snapshot: Optional[str] = None
+
+        self.matrix: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        # Searches read the four fields above as one consistent snapshot
+        self._lock = threading.Lock()
+        self.load()
+
+    def is_ready(self) -> bool:
+        return self.matrix is not None and len(self.ids) > 0
+
+    def reload(self) -> bool:
+        return self.load() and self.is_ready()
+
+    def is_stale(self) -> bool:
+        return self._current_snapshot() != self.snapshot
+
+    def _current_snapshot(self) -> Optional[str]:
+        """Snapshot named by CURRENT, '' for a pre-snapshot index, None if there is none"""
+        try:
+            with open(self.current_path, 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            legacy = all(os.path.exists(os.path.join(self.path, name)) for name in (MATRIX_FILE, RECORDS_FILE))
+            return '' if legacy else None
+
+    def load(self) -> bool:
+        """Memory-map the current snapshot; returns False if none exists"""
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            logger.warning("⚠️  No existing vector index found")
+            return False
+
+        directory = os.path.join(self.path, snapshot)
+        with open(os.path.join(directory, RECORDS_FILE), 'r') as f:
+            records = json.load(f)
+        # Snapshots are never modified after CURRENT points at them, so every
+        # process can map the same pages read-only
+        matrix = np.load(os.path.join(directory, MATRIX_FILE), mmap_mode='r')
+        with self._lock:
+            self.ids = records['ids']
+            self.documents = records['documents']
+            self.metadatas = records['metadatas']
+            self.matrix = matrix
+            self.snapshot = snapshot
+        logger.info(f"✅ Loaded vector index {snapshot or '(legacy)'} ({len(self.ids)} vectors)")
+        return True
+
+    def _snapshot(self):
+        with self._lock:
+            return self.matrix, self.ids, self.documents, self.metadatas
+
+    def build(self, ids, embeddings, documents, metadatas) -> None:
+        self._save(list(ids), _normalize(np.asarray(embeddings, dtype=np.float32)),
+                   list(documents), list(metadatas))
+
+    def content_hashes(self) -> Dict[str, str]:
+        _, ids, _, metadatas = self._snapshot()
+        return {record_id: metadata.get('content_hash', '') for record_id, metadata in zip(ids, metadatas)}
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        matrix, all_ids, all_documents, all_metadatas = self._snapshot()
+
+        # Small index: rewrite it whole (no re-embedding), replacing rows in place
+        matrix = np.array(matrix) if matrix is not None else np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        all_ids, all_documents, all_metadatas = list(all_ids), list(all_documents), list(all_metadatas)
+        rows = {record_id: i for i, record_id in enumerate(all_ids)}
+        appended = []
+        for record_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+            if record_id in rows:
+                row = rows[record_id]
+                matrix[row] = vector
+                all_documents[row] = document
+                all_metadatas[row] = metadata
+            else:
+                rows[record_id] = len(all_ids)
+                appended.append(vector)
+                all_ids.append(record_id)
+                all_documents.append(document)
+                all_metadatas.append(metadata)
+        if appended:
+            matrix = np.vstack([matrix, np.asarray(appended, dtype=np.float32)])
+
+        self._save(all_ids, matrix, all_documents, all_metadatas)
+
+    def delete(self, ids) -> None:
+        drop = set(ids)
+        matrix, all_ids, documents, metadatas = self._snapshot()
+        keep = [i for i, record_id in enumerate(all_ids) if record_id not in drop]
+        if matrix is None or len(keep) == len(all_ids):
+            return
+        self._save([all_ids[i] for i in keep], np.asarray(matrix)[keep],
+                   [documents[i] for i in keep], [metadatas[i] for i in keep])
+
+    def _save(self, ids: List[str], matrix: np.ndarray, documents: List[str],
+              metadatas: List[Dict[str, Any]]) -> None:
+        """Persist a normalised matrix + records as a new snapshot and point CURRENT at it"""
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+        # Names sort by creation time; the pid keeps concurrent writers apart
+        snapshot = f"{SNAPSHOT_PREFIX}{time.time_ns():020d}-{os.getpid()}"
+        directory = os.path.join(self.path, snapshot)
+        os.makedirs(directory)
+        np.save(os.path.join(directory, MATRIX_FILE), matrix)
+        with open(os.path.join(directory, RECORDS_FILE), 'w') as f:
+            json.dump({'ids': ids, 'documents': documents, 'metadatas': metadatas}, f)
+
+        # One atomic rename publishes matrix and records together
+        tmp_current = self.current_path + f".{os.getpid()}.tmp"
+        with open(tmp_current, 'w') as f:
+            f.write(snapshot)
+        os.replace(tmp_current, self.current_path)
+
+        self.load()
+        self._prune_snapshots()
+
+    def _prune_snapshots(self) -> None:
+        """Delete old snapshots, keeping the newest few so slow readers can finish"""
+        snapshots = sorted(name for name in os.listdir(self.path) if name.startswith(SNAPSHOT_PREFIX))
+        current = self._current_snapshot()
+        for name in snapshots[:-KEEP_SNAPSHOTS]:
+            if name != current:
+                # Processes that still map these files keep them until they reload
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def search_batch(self, query_embeddings, top_k: int = 3,
+                     plan_ids: Optional[Sequence[str]] = None) -> List[List[Dict[str, Any]]]:
+        matrix, ids, documents, metadatas = self._snapshot()
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+
+        # (B, d) @ (d, N) -> cosine similarity of every query to every vector
+        scores = queries @ matrix.T
+        k = min(top_k, scores.shape[1])
+
+        if plan_ids is not None:
+            # Rows outside the candidate set can never make the top-k
+            wanted = set(plan_ids)
+            allowed = np.array([m.get('plan_id') in wanted for m in metadatas], dtype=bool)
+            scores[:, ~allowed] = -np.inf
+            k = min(k, int(allowed.sum()))
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        # argpartition finds the top-k in O(N); only those k get sorted
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        batch = []
+        for q in range(len(queries)):
+            batch.append([
+                {
+                    'id': ids[i],
+                    'text': documents[i],
+                    'metadata': metadatas[i],
+                    'similarity': float(scores[q, i])
+                }
+                for i in top[q]
+            ])
+        return batch
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Row-wise L2 normalisation into a contiguous float32 array"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+
+RETRIEVERS = {
+    ChromaRetriever.name: ChromaRetriever,
+    NumpyRetriever.name: NumpyRetriever,
+}
+
+
+def make_retriever(backend: str, **kwargs: Any) -> Retriever:
+    """
+    Create a retriever by name
+
+    Args:
+        backend: "chroma" or "numpy"
+        **kwargs: Passed to the retriever constructor
+
+    Returns:
+        Retriever instance
+    """
+    try:
+        retriever_cls = RETRIEVERS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown retriever backend '{backend}'. Choose from: {', '.join(RETRIEVERS)}")
+    return retriever_cls(**kwargs)
@@ -0,0 +1,192 @@
+"""
+Priority scheduling of calls to an Ollama server
+
+Interactive requests, offline precomputation / batch scoring and index
+rebuilds all call the same local model server. Ollama serves a few requests
+at a time and queues the rest first-come first-served, so a bulk job that
+fills its queue holds every interactive request behind it. Each Ollama
+client therefore keeps its own queue in front of the server:
+
+- at most `slots` calls in flight (set it to the server's
+  OLLAMA_NUM_PARALLEL), so requests wait here rather than in Ollama's FIFO
+- waiting calls start in priority order: interactive, then reindex, then
+  bulk; first come first served within a class
+- per-class caps: bulk and reindex calls never hold more than their share
+  of the slots, so interactive calls always find one free or soon free
+
+A call's class comes from a context variable set with llm_priority(), so it
+follows the work onto worker threads started with contextvars.copy_context().
+Calls outside any llm_priority() block are interactive.
+
+Metrics: `llm_queue_wait_seconds{kind,class}` (time before a slot), and the
+gauges `llm_queue_depth` / `llm_active_calls` by host, kind and class.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from .telemetry import REGISTRY
+except ImportError:  # imported as a top-level module (setup_embeddings.py)
+    from telemetry import REGISTRY
+
+INTERACTIVE = "interactive"
+REINDEX = "reindex"
+BULK = "bulk"
+# Highest priority first
+PRIORITY_CLASSES = (INTERACTIVE, REINDEX, BULK)
+
+# Calls in flight per server: chat / embeddings (separate models, served side by side)
+LLM_SLOTS = int(os.getenv("LLM_SLOTS", "4"))
+EMBED_SLOTS = int(os.getenv("LLM_EMBED_SLOTS", "4"))
+# Slots the background classes may hold at once (interactive may use them all)
+CLASS_SLOTS = {
+    REINDEX: int(os.getenv("LLM_REINDEX_SLOTS", "1")),
+    BULK: int(os.getenv("LLM_BULK_SLOTS", "1")),
+}
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "llm_queue_wait_seconds", "Time an LLM call waited for a slot, by kind (chat, embed) and priority class",
+    ("kind", "class"))
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """Schedule the LLM calls made in this block (and work it starts) under a priority class"""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class '{priority}'. Choose from: {', '.join(PRIORITY_CLASSES)}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """Priority class of the calling context"""
+    return _priority.get()
+
+
+class LLMScheduler:
+    """Priority queue + slot limits for one server; only touched from the client's event loop"""
+
+    def __init__(self, slots: int = LLM_SLOTS, class_slots: Optional[Dict[str, int]] = None,
+                 host: str = "", kind: str = "chat"):
+        """
+        Initialize scheduler
+
+        Args:
+            slots: Calls in flight at once
+            class_slots: Cap per priority class (classes not listed may use every slot)
+            host: Server this scheduler fronts (metric label)
+            kind: "chat" or "embed" (metric label)
+        """
+        self.slots = max(1, slots)
+        limits = CLASS_SLOTS if class_slots is None else class_slots
+        self.limits = {cls: max(1, min(self.slots, limits.get(cls, self.slots))) for cls in PRIORITY_CLASSES}
+        self.host = host
+        self.kind = kind
+
+        self.active = {cls: 0 for cls in PRIORITY_CLASSES}
+        self.waiting = {cls: 0 for cls in PRIORITY_CLASSES}
+        self.started = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._queue: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._order = itertools.count()
+        _register(self)
+
+    @asynccontextmanager
+    async def slot(self, priority: str) -> AsyncIterator[None]:
+        """Hold a slot for the block, waiting behind higher-priority calls"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    async def acquire(self, priority: str) -> None:
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (PRIORITY_CLASSES.index(priority), next(self._order), priority, waiter))
+        self.waiting[priority] += 1
+        self._grant()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted, but the caller went away before using it
+                self.release(priority)
+            else:
+                # Still queued: _grant() drops cancelled waiters
+                self.waiting[priority] -= 1
+            raise
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, kind=self.kind, **{'class': priority})
+
+    def release(self, priority: str) -> None:
+        self.active[priority] -= 1
+        self._grant()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters for /health"""
+        return {
+            cls: {
+                'active': self.active[cls],
+                'waiting': self.waiting[cls],
+                'started': self.started[cls],
+                'max': self.limits[cls]
+            }
+            for cls in PRIORITY_CLASSES
+        }
+
+    def _grant(self) -> None:
+        """Start queued calls, highest priority first, while slots and class caps allow"""
+        blocked = []
+        while self._queue and sum(self.active.values()) < self.slots:
+            item = heapq.heappop(self._queue)
+            _, _, priority, waiter = item
+            if waiter.done():
+                continue
+            if self.active[priority] >= self.limits[priority]:
+                # This class is at its cap; lower classes may still start
+                blocked.append(item)
+                continue
+            self.waiting[priority] -= 1
+            self.active[priority] += 1
+            self.started[priority] += 1
+            waiter.set_result(None)
+        for item in blocked:
+            heapq.heappush(self._queue, item)
+
+
+_schedulers: "weakref.WeakSet[LLMScheduler]" = weakref.WeakSet()
+_schedulers_lock = threading.Lock()
+
+
+def _register(scheduler: LLMScheduler) -> None:
+    with _schedulers_lock:
+        _schedulers.add(scheduler)
+
+
+def _read(field: str) -> Dict[Tuple[str, str, str], int]:
+    with _schedulers_lock:
+        schedulers = list(_schedulers)
+    values: Dict[Tuple[str, str, str], int] = {}
+    for scheduler in schedulers:
+        counts = dict(getattr(scheduler, field))
+        for cls, count in counts.items():
+            key = (scheduler.host, scheduler.kind, cls)
+            values[key] = values.get(key, 0) + count
+    return values
+
+
+REGISTRY.gauge("llm_queue_depth", "LLM calls waiting for a slot", lambda: _read('waiting'), ("host", "kind", "class"))
+REGISTRY.gauge("llm_active_calls", "LLM calls in flight", lambda: _read('active'), ("host", "kind", "class"))
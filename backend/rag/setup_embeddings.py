@@ -9,13 +9,22 @@ This script:
 
 Run this once before starting the backend server:
     python setup_embeddings.py
+
+After editing the data file, apply only the changes (new/changed plans are
+embedded, removed plans deleted; the index stays usable throughout):
+    python setup_embeddings.py --sync
 """
 
 from rag_engine import RAGEngine
+from telemetry import configure_logging
 import sys
 
 
 def main():
+    # Synchronous, so progress lines interleave correctly with the prints below
+    configure_logging(asynchronous=False)
+    sync = '--sync' in sys.argv[1:]
+    
     print("="*70)
     print("  RAG Vector Database Setup")
     print("="*70)
@@ -34,8 +43,13 @@ def main():
         # Initialize RAG engine
         rag = RAGEngine()
         
-        # Setup vector database
-        rag.setup_vector_database()
+        # Setup vector database (or apply data changes to the existing one)
+        if sync:
+            stats = rag.sync_vector_database()
+            print(f"🔄 Added {stats['added']}, updated {stats['updated']}, "
+                  f"removed {stats['removed']}, unchanged {stats['unchanged']}")
+        else:
+            rag.setup_vector_database()
         
         print()
         print("="*70)
@@ -0,0 +1,86 @@
+"""
+SQLite key/value cache shared by worker processes
+
+The disk tier behind the per-process TTLCaches: query embeddings and full
+responses computed by one worker are served to the others (and survive
+restarts). The file runs in WAL mode, so readers never block each other or
+the writer, and concurrent writers wait on busy_timeout instead of failing.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class SQLiteCache:
+    """Thread- and process-safe key/value table in a SQLite file"""
+
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None,
+                 busy_timeout: float = 5.0):
+        """
+        Open (or create) the cache table
+
+        Args:
+            path: SQLite file (parent directories are created)
+            table: Table name, so several caches can share one file
+            ttl: Seconds an entry stays valid (None = forever)
+            busy_timeout: Seconds to wait for another process's write lock
+        """
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name '{table}'")
+
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a crash can lose the last commits, never corrupt the file
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Stored value, or None if missing or expired"""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, value: Any) -> None:
+        """Insert or replace one entry"""
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """Insert or replace several entries in one transaction"""
+        now = time.time()
+        rows = [(key, value, now) for key, value in items]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters"""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
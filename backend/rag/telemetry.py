@@ -0,0 +1,362 @@
+"""
+Request timing spans, Prometheus-style metrics and non-blocking logging
+
+- span(stage): times a block, feeds the `recommend_stage_seconds` histogram
+  and the current request's breakdown (with prompt/completion tokens for
+  LLM calls)
+- request_scope(endpoint): per-request breakdown carried in a ContextVar,
+  so spans recorded on worker threads land on the right request as long as
+  the work is started with contextvars.copy_context()
+- REGISTRY.render(): Prometheus text exposition for /metrics
+- configure_logging(): leveled logging through a QueueHandler, so log calls
+  on the hot path never block on stdout
+"""
+
+import bisect
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Seconds; LLM stages take tens of seconds, vector queries well under a millisecond
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+# --- Metrics -----------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {value:g}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts incl. +Inf, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + [float('inf')], counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Gauge read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable[[], Any], labelnames: Sequence[str] = ()):
+        """With labelnames, read() returns {label values tuple: value}"""
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        if not self.labelnames:
+            return [f"{self.name} {float(self.read()):g}"]
+        return [f"{self.name}{_labels(self.labelnames, key)} {float(value):g}"
+                for key, value in self.read().items()]
+
+
+class Registry:
+    """Collection of metrics rendered together for /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric; re-registering a name returns the existing one"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Any], labelnames: Sequence[str] = ()) -> Gauge:
+        """Callback gauges are replaced on re-registration (the callback may change)"""
+        gauge = Gauge(name, help, read, labelnames)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "recommend_request_seconds", "End-to-end request latency", ("endpoint",))
+REQUESTS_TOTAL = REGISTRY.counter(
+    "recommend_requests_total", "Requests by endpoint and outcome", ("endpoint", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "recommend_stage_seconds", "Latency of each pipeline stage", ("stage",))
+LLM_TOKENS = REGISTRY.counter(
+    "recommend_llm_tokens_total", "Tokens sent to / generated by models, per stage", ("stage", "direction"))
+
+
+def resident_memory_bytes() -> float:
+    """Current RSS of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return float(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return float(peak if os.uname().sysname == 'Darwin' else peak * 1024)
+
+
+REGISTRY.gauge("process_resident_memory_bytes", "Resident memory of this worker", resident_memory_bytes)
+
+
+# --- Spans -------------------------------------------------------------------
+
+class Span:
+    """One timed stage of a request"""
+
+    __slots__ = ('name', 'seconds', 'prompt_tokens', 'completion_tokens')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add_tokens(self, prompt: int = 0, completion: int = 0) -> None:
+        """Record token counts for this stage (also counted in recommend_llm_tokens_total)"""
+        self.prompt_tokens += prompt or 0
+        self.completion_tokens += completion or 0
+        if prompt:
+            LLM_TOKENS.inc(prompt, stage=self.name, direction='prompt')
+        if completion:
+            LLM_TOKENS.inc(completion, stage=self.name, direction='completion')
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'stage': self.name,
+            'ms': round(self.seconds * 1000, 2),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens
+        }
+
+
+class RequestTimings:
+    """Spans recorded while serving one request"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.status = 'ok'
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lap_start = self.started
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: `stage;dur=ms, ...` plus the total"""
+        with self._lock:
+            parts = [f"{s.name};dur={s.seconds * 1000:.1f}" for s in self.spans]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ', '.join(parts)
+
+    def as_list(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [s.as_dict() for s in self.spans]
+
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "request_timings", default=None)
+
+
+def current_request() -> Optional[RequestTimings]:
+    """Breakdown of the request being served on this context, if any"""
+    return _current.get()
+
+
+@contextmanager
+def request_scope(endpoint: str) -> Iterator[RequestTimings]:
+    """
+    Collect spans for one request and record its total latency and outcome
+
+    Set `timings.status` before leaving the block to label the outcome;
+    an escaping exception is counted as "error".
+    """
+    timings = RequestTimings(endpoint)
+    token = _current.set(timings)
+    try:
+        yield timings
+    except BaseException:
+        if timings.status == 'ok':
+            timings.status = 'error'
+        raise
+    finally:
+        _current.reset(token)
+        REQUEST_SECONDS.observe(timings.elapsed(), endpoint=endpoint)
+        REQUESTS_TOTAL.inc(endpoint=endpoint, status=timings.status)
+
+
+@contextmanager
+def span(name: str) -> Iterator[Span]:
+    """Time a stage; recorded in the stage histogram and the current request"""
+    current = Span(name)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(current.seconds, stage=name)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(current)
+
+
+def start_laps() -> None:
+    """Start timing consecutive stages that only report when they finish (see lap())"""
+    timings = _current.get()
+    if timings is not None:
+        timings._lap_start = time.perf_counter()
+
+
+def lap(name: str) -> None:
+    """Record a stage that ran from the previous lap (or start_laps()) until now"""
+    now = time.perf_counter()
+    timings = _current.get()
+    start = timings._lap_start if timings is not None else now
+    current = Span(name)
+    current.seconds = now - start
+    STAGE_SECONDS.observe(current.seconds, stage=name)
+    if timings is not None:
+        timings._lap_start = now
+        timings.add(current)
+
+
+# --- Logging -----------------------------------------------------------------
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, asynchronous: bool = True) -> None:
+    """
+    Route all logging through a queue drained by a background thread
+
+    Safe to call more than once; only the first call installs handlers.
+
+    Args:
+        level: Root log level name (LOG_LEVEL env, default INFO)
+        asynchronous: False writes straight to stderr (for CLI scripts,
+            where log lines must stay in order with print output)
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+
+    if not asynchronous:
+        logging.basicConfig(level=level, handlers=[handler], force=True)
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flush queued records, stop the background thread and log straight to stderr again"""
+    global _listener
+    if _listener is not None:
+        # Swap the handlers first, so records logged while the queue drains are not left in it
+        logging.getLogger().handlers[:] = list(_listener.handlers)
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,215 @@
+"""
+Template-rendered recommendations
+
+The recommendation and comparison prompts only ask the LLM to copy plan
+fields into a fixed Markdown layout. This module fills the same layout
+straight from the catalogue's plan records, so every name and number is
+taken verbatim from the data file. The short "Why This Plan" rationale is either
+derived from the profile with rules, or generated by one small LLM call.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from rag.catalogue import Catalogue
+from rag.plan_filter import CHRONIC_COVER_KEYS, COVER_NONE, ProfileNeeds
+
+
+# Same wording as RECOMMEND_TEMPLATE; the data file has no premiums
+PREMIUM_RANGE = "₹10,000 - ₹25,000"
+REASONS_PER_PLAN = 3
+
+RATIONALE_TEMPLATE = """User profile:
+- Age: {age} years old
+- Pre-existing Conditions: {ped}
+- Annual Budget: ₹{budget}
+- Specific Needs: {needs}
+- Preferences: {preferences}
+
+Plans:
+{plans}
+
+For each plan, give {count} short reasons (max 15 words each) why it suits this user.
+Use ONLY facts listed above. Do not mention any other company or plan.
+Respond with JSON only, mapping plan_id to a list of reasons:
+{{"<plan_id>": ["reason", "reason", "reason"]}}"""
+
+
+class RecommendationRenderer:
+    """Renders plan sections and the comparison table from plan records"""
+
+    def __init__(self, catalogue: Catalogue):
+        """
+        Initialize renderer
+
+        Args:
+            catalogue: Compiled plan catalogue (rag.catalogue)
+        """
+        self.catalogue = catalogue
+        # Source records by plan_id: (insurer, plan)
+        self.plans: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {
+            record.plan_id: (record.insurer.raw, record.raw) for record in catalogue
+        }
+
+    def render(self, plan_ids: Sequence[str], user_profile: Dict[str, str],
+               reasons: Optional[Dict[str, List[str]]] = None) -> Tuple[List[str], str]:
+        """
+        Render the recommendation sections and the comparison
+
+        Args:
+            plan_ids: Plans to recommend, best first
+            user_profile: Dict with age, ped, budget, needs, preferences
+            reasons: "Why This Plan" bullets per plan_id (missing plans get rule-based reasons)
+
+        Returns:
+            (one Markdown section per plan, comparison table + recommendation)
+        """
+        needs = ProfileNeeds(user_profile)
+        reasons = dict(reasons or {})
+        for plan_id in plan_ids:
+            if not reasons.get(plan_id):
+                reasons[plan_id] = self.rule_reasons(plan_id, needs)
+
+        sections = [self.render_section(plan_id, reasons[plan_id]) for plan_id in plan_ids]
+        return sections, self.render_comparison(plan_ids, reasons)
+
+    def render_section(self, plan_id: str, reasons: List[str]) -> str:
+        """One plan in the RECOMMEND_TEMPLATE layout"""
+        insurer, plan = self.plans[plan_id]
+        coverage = plan['coverage_static']
+        why = '\n'.join(f"- {reason}" for reason in reasons)
+
+        return f"""## {plan['plan_name']}
+**Insurer:** {insurer['insurer_name']}
+**Premium:** {PREMIUM_RANGE} per year (typical range)
+**Sum Insured:** {coverage.get('sum_insured_options', 'Not specified')}
+
+**Why This Plan:**
+{why}
+
+**Key Features:**
+- Room rent: {coverage.get('room_rent_limit') or 'Not specified'}
+- Maternity: {coverage.get('maternity_coverage') or 'Not specified'}
+- CSR: {insurer['claim_settlement_ratio']['csr_percentage']}
+- NCB: {coverage.get('no_claim_bonus') or 'Not specified'}"""
+
+    def render_comparison(self, plan_ids: Sequence[str], reasons: Dict[str, List[str]]) -> str:
+        """Comparison table in the COMPARE_TEMPLATE layout, recommending the first plan"""
+        records = [self.plans[plan_id] for plan_id in plan_ids]
+
+        rows = [
+            ('Insurer', lambda i, p: i['insurer_name']),
+            ('Annual Premium', lambda i, p: PREMIUM_RANGE),
+            ('Sum Insured', lambda i, p: p['coverage_static'].get('sum_insured_options')),
+            ('Room Rent Limit', lambda i, p: p['coverage_static'].get('room_rent_limit')),
+            ('Maternity', lambda i, p: p['coverage_static'].get('maternity_coverage')),
+            ('NCB', lambda i, p: p['coverage_static'].get('no_claim_bonus')),
+            ('CSR', lambda i, p: i['claim_settlement_ratio']['csr_percentage']),
+        ]
+
+        lines = [
+            '| Feature | ' + ' | '.join(_cell(p['plan_name']) for _, p in records) + ' |',
+            '|---------|' + '|'.join('-' * 21 for _ in records) + '|',
+        ]
+        for label, value in rows:
+            lines.append(f"| {label} | " + ' | '.join(_cell(value(i, p)) for i, p in records) + ' |')
+
+        table = '\n'.join(lines)
+        if not records:
+            return table
+
+        insurer, best = records[0]
+        why = '\n'.join(f"- {reason}" for reason in reasons.get(plan_ids[0], []))
+        return (f"{table}\n\n## Our Recommendation\n"
+                f"We recommend **{best['plan_name']}** ({insurer['insurer_name']}) as the best match for your profile:\n{why}")
+
+    def rule_reasons(self, plan_id: str, needs: ProfileNeeds) -> List[str]:
+        """
+        "Why This Plan" bullets derived from the profile and plan fields
+
+        Needs the user stated come first (PED, chronic care, maternity, OPD,
+        room rent), then claim settlement ratio, then the plan's own key
+        features until REASONS_PER_PLAN bullets are filled.
+        """
+        insurer, plan = self.plans[plan_id]
+        coverage = plan['coverage_static']
+        waiting = plan['waiting_periods']
+        typed = self.catalogue.plan(plan_id).features
+
+        reasons = []
+        if needs.has_ped:
+            if needs.chronic:
+                for key in CHRONIC_COVER_KEYS:
+                    if key in waiting:
+                        reasons.append(f"Chronic condition cover: {waiting[key]}")
+                        break
+            ped = f"Pre-existing conditions covered after {typed['ped_waiting_months']} months"
+            if typed['ped_waiting_min_months'] < typed['ped_waiting_months']:
+                ped += f" (reducible to {typed['ped_waiting_min_months']} months with add-on)"
+            reasons.append(ped)
+        if needs.maternity and typed['maternity_level'] > COVER_NONE:
+            reasons.append(f"Maternity: {coverage['maternity_coverage']}")
+        if needs.opd and typed['opd_level'] > COVER_NONE:
+            reasons.append(f"OPD: {coverage['opd_coverage']}")
+        if needs.room_rent and coverage.get('room_rent_limit'):
+            reasons.append(f"Room rent: {coverage['room_rent_limit']}")
+        reasons.append(f"Claim settlement ratio: {insurer['claim_settlement_ratio']['csr_percentage']}")
+        reasons.extend(plan.get('key_features', []))
+
+        return reasons[:REASONS_PER_PLAN]
+
+    def rationale_prompt(self, plan_ids: Sequence[str], user_profile: Dict[str, str]) -> str:
+        """Prompt for the optional LLM rationale (JSON: plan_id -> reasons)"""
+        plans = []
+        for plan_id in plan_ids:
+            insurer, plan = self.plans[plan_id]
+            coverage = plan['coverage_static']
+            plans.append(
+                f"- plan_id: {plan_id}\n"
+                f"  Plan: {plan['plan_name']} ({insurer['insurer_name']})\n"
+                f"  CSR: {insurer['claim_settlement_ratio']['csr_percentage']}\n"
+                f"  Room rent: {coverage.get('room_rent_limit')}\n"
+                f"  Maternity: {coverage.get('maternity_coverage')}\n"
+                f"  OPD: {coverage.get('opd_coverage')}\n"
+                f"  PED waiting: {plan['waiting_periods'].get('ped_waiting_months')} months\n"
+                f"  Key features: {'; '.join(plan.get('key_features', [])[:5])}"
+            )
+        return RATIONALE_TEMPLATE.format(
+            age=user_profile.get('age', ''),
+            ped=user_profile.get('ped', ''),
+            budget=user_profile.get('budget', ''),
+            needs=user_profile.get('needs', ''),
+            preferences=user_profile.get('preferences', ''),
+            plans='\n'.join(plans),
+            count=REASONS_PER_PLAN
+        )
+
+
+def parse_rationale(text: str, plan_ids: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    Reasons per plan from the LLM's JSON answer
+
+    Unknown plan ids and malformed entries are dropped; the renderer falls
+    back to rule-based reasons for any plan left without one.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    reasons = {}
+    for plan_id in plan_ids:
+        items = data.get(plan_id)
+        if isinstance(items, list):
+            items = [str(item).strip() for item in items if str(item).strip()]
+            if items:
+                reasons[plan_id] = items[:REASONS_PER_PLAN]
+    return reasons
+
+
+def _cell(value: Any) -> str:
+    """Table cell text (pipes would break the Markdown table)"""
+    return str(value if value is not None else 'Not specified').replace('|', '/').replace('\n', ' ')
+
@@ -0,0 +1,123 @@
+"""
+Full-response cache for /recommend
+
+Caches the final recommendation text keyed on the normalised request plus
+everything that can change the answer: the data-file version, the model
+names, the prompt templates and the generation seed. Only meaningful when
+the LLM runs deterministically (temperature 0, fixed seed).
+
+Two tiers: an in-memory LRU+TTL cache and an optional SQLite file (WAL
+mode) that survives restarts and is shared by every worker process. Concurrent identical requests are coalesced - the first
+one runs the crew, the rest await the same result.
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from rag.query_cache import TTLCache
+from rag.shared_cache import SQLiteCache
+
+
+def make_cache_key(normalized_request: Any, **versions: Any) -> str:
+    """
+    Stable cache key for a request
+
+    Args:
+        normalized_request: JSON-serialisable, already-normalised request
+        **versions: Anything else the answer depends on (data/model/prompt versions)
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    payload = json.dumps({'request': normalized_request, **versions}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """In-memory + optional SQLite response cache with request coalescing"""
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = 86400.0,
+                 db_path: Optional[str] = None):
+        """
+        Initialize response cache
+
+        Args:
+            maxsize: Max entries kept in memory
+            ttl: Seconds an answer stays valid in either tier (None = forever)
+            db_path: SQLite file for the disk tier (None = memory only)
+        """
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_hits = 0
+        self.coalesced = 0
+
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.disk = SQLiteCache(db_path, table="responses", ttl=ttl) if db_path else None
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up an answer in memory, then on disk (promoting disk hits)"""
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+
+        value = self.disk.get(key)
+        if value is None:
+            return None
+
+        self.disk_hits += 1
+        self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        """Store an answer in both tiers"""
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return a cached answer, or compute it once for all concurrent callers
+
+        The computation runs as its own task, so a caller that goes away
+        does not cancel the run the other waiters depend on. Failures are
+        passed to every waiter and are not cached.
+
+        Args:
+            key: Cache key from make_cache_key()
+            compute: Coroutine factory producing the answer on a miss
+
+        Returns:
+            Recommendation text
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._compute_and_store(key, compute))
+            self._inflight[key] = task
+
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        try:
+            value = await compute()
+            self.put(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for /health"""
+        return {
+            **self.memory.stats(),
+            'disk_enabled': self.disk is not None,
+            'disk_hits': self.disk_hits,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight)
+        }
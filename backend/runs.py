@@ -0,0 +1,202 @@
+"""
+Shared, cancellable runs behind /recommend and /recommend/stream
+
+A Run executes one pipeline call as its own task under a CancelScope and
+records what it produces (stream events, or the final answer) so several
+clients can follow it:
+
+- a retry that sends the same Idempotency-Key attaches to the run in flight,
+  or replays the finished one for `ttl` seconds, instead of starting another
+  (a failed or cancelled run is not replayed; the retry starts afresh)
+- when the last client detaches before the run finishes, the scope is
+  cancelled, which aborts the run's in-flight Ollama calls; runs with a key
+  wait `grace` seconds first so a retry can still attach
+
+Runs live in the worker process that started them; a retry that lands on
+another worker starts its own run.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+
+from rag.cancellation import CancelScope, Cancelled, record_waste
+
+logger = logging.getLogger(__name__)
+
+Event = Tuple[str, Any]
+
+# A run no client has followed after this many seconds is cancelled (the
+# client left before the response started)
+UNCLAIMED_TIMEOUT = 5.0
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused for a different request"""
+
+
+class Run:
+    """One pipeline call that any number of clients can follow"""
+
+    def __init__(self, produce: Callable[[], AsyncIterator[Event]], fingerprint: Hashable = None,
+                 grace: float = 0.0):
+        """
+        Start the run
+
+        Args:
+            produce: Async generator factory yielding (event, payload); runs under the run's scope
+            fingerprint: Identifies the request, to tell key reuse from a retry
+            grace: Seconds to wait after the last client leaves before cancelling
+        """
+        self.fingerprint = fingerprint
+        self.grace = grace
+        self.scope = CancelScope(name="request")
+        self.events: List[Event] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.finished_at: Optional[float] = None
+        self.clients = 0
+
+        self._changed = asyncio.Event()
+        self._abandon_timer: Optional[asyncio.TimerHandle] = asyncio.get_running_loop().call_later(
+            max(grace, UNCLAIMED_TIMEOUT), self._abandon)
+        self._task = asyncio.ensure_future(self._drive(produce))
+
+    @property
+    def failed(self) -> bool:
+        return self.finished and self.error is not None
+
+    async def follow(self) -> AsyncIterator[Event]:
+        """
+        Every event of the run, from the first, then live until it finishes
+
+        Leaving early (client disconnect) detaches this follower.
+
+        Raises:
+            Whatever the run raised
+        """
+        self._attach()
+        try:
+            index = 0
+            while True:
+                changed = self._changed
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self._detach()
+
+    async def _drive(self, produce: Callable[[], AsyncIterator[Event]]) -> None:
+        try:
+            # The admission pool copies this context, so the scope follows the run onto its threads
+            with self.scope.active():
+                async for item in produce():
+                    self.events.append(item)
+                    self._notify()
+        except Cancelled as e:
+            # Everything generated for this run so far is thrown away
+            record_waste(self.scope.take_llm_seconds(), e.reason)
+            self.error = e
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self.finished_at = time.monotonic()
+            self.scope.close()
+            self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _attach(self) -> None:
+        self.clients += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+    def _detach(self) -> None:
+        self.clients -= 1
+        if self.clients > 0 or self.finished:
+            return
+        if self.grace > 0:
+            self._abandon_timer = asyncio.get_running_loop().call_later(self.grace, self._abandon)
+        else:
+            self._abandon()
+
+    def _abandon(self) -> None:
+        """No client is left: stop the run's Ollama calls"""
+        self._abandon_timer = None
+        if self.clients == 0 and self.scope.cancel("disconnect"):
+            logger.info("🛑 Client gone, cancelled the run")
+
+
+class RunRegistry:
+    """Runs by idempotency key, kept for a while after they finish"""
+
+    def __init__(self, ttl: float = 300.0, grace: float = 10.0):
+        """
+        Initialize registry
+
+        Args:
+            ttl: Seconds a finished run stays available to retries
+            grace: Seconds a keyed run survives without clients (see Run)
+        """
+        self.ttl = ttl
+        self.grace = grace
+        self.attached = 0
+        self._runs: Dict[Hashable, Run] = {}
+
+    def start(self, key: Optional[Hashable], fingerprint: Hashable,
+              produce: Callable[[], AsyncIterator[Event]],
+              admit: Optional[Callable[[], None]] = None) -> Tuple[Run, bool]:
+        """
+        Attach to the run for a key, or start a new one
+
+        Args:
+            key: Idempotency key (None = a private run, cancelled as soon as its client leaves)
+            fingerprint: Normalised request; must match the run already under the key
+            produce: Event producer for a new run
+            admit: Called before starting a new run (not when attaching); may raise to refuse it
+
+        Returns:
+            (run, True if it was already running or finished)
+
+        Raises:
+            IdempotencyConflict: The key belongs to a different request
+        """
+        if key is not None:
+            self._expire()
+            run = self._runs.get(key)
+            if run is not None and not run.failed:
+                if run.fingerprint != fingerprint:
+                    raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+                self.attached += 1
+                return run, True
+
+        if admit is not None:
+            admit()
+        if key is None:
+            return Run(produce, fingerprint), False
+        run = self._runs[key] = Run(produce, fingerprint, grace=self.grace)
+        return run, False
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, run in self._runs.items()
+                    if run.finished and now - run.finished_at > self.ttl]:
+            del self._runs[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for /health"""
+        return {
+            'runs': len(self._runs),
+            'running': sum(1 for run in self._runs.values() if not run.finished),
+            'attached': self.attached
+        }
@@ -0,0 +1,333 @@
+"""
+Catalogue-backed hallucination check for generated answers
+
+Every insurer and plan name in the catalogue (plus short forms such as
+"HDFC ERGO") and a list of well-known insurers that are NOT in the
+catalogue are compiled into one trie-shaped regular expression, together
+with patterns for the numbers an answer quotes: rupee amounts, percentages
+and waiting periods. An answer is checked with a single finditer() pass:
+
+- a name of an insurer we do not cover is an issue
+- a catalogue plan or insurer that was not among the retrieved plans is an issue
+- a "## " heading that is neither a known plan nor a generic heading is an invented plan
+- a number must appear in the source record of the plan whose section it is
+  in (or, outside plan sections and in tables, in any retrieved plan), in the
+  user's own profile, or in the fixed premium range the prompts dictate
+
+Amounts are compared after normalisation, so "₹7.5L", "₹7,50,000" and
+"7.5 lakh" are the same number; "2 years" matches 24 months.
+"""
+
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from rag.catalogue import RUPEE_UNITS, Catalogue
+from rag.query_cache import normalize_text
+from renderer import PREMIUM_RANGE
+
+# Insurers the catalogue does not cover; naming one is always an issue
+OTHER_INSURERS = (
+    # Only multi-word forms of names that are also English words ("self-reliance")
+    'Bajaj Allianz', 'Future Generali', 'Reliance General', 'Reliance Health',
+    'TATA AIG', 'Max Life', 'Max Bupa', 'ICICI Direct', 'HDFC Life', 'SBI General', 'SBI Health',
+    'New India Assurance', 'United India Insurance', 'National Insurance', 'Oriental Insurance',
+    'ManipalCigna', 'Manipal Cigna', 'Cigna TTK', 'Go Digit', 'Digit Insurance', 'Acko',
+    'Royal Sundaram', 'Chola MS', 'Cholamandalam', 'Kotak General', 'Kotak Mahindra General',
+    'IFFCO Tokio', 'Liberty General', 'Universal Sompo', 'Magma HDI', 'Zuno', 'Edelweiss General',
+    'Galaxy Health', 'Narayana Health Insurance', 'Star Union Dai-ichi', 'Apollo Munich',
+)
+
+# Level-2/3 headings that are not plan names
+GENERIC_HEADING = re.compile(
+    r'recommend|comparison|compare|profile|summary|why|feature|table|note|disclaimer|overview|'
+    r'conclusion|next step|verdict|analysis|requirement|consider|tip',
+    re.IGNORECASE)
+
+# Corporate suffixes dropped to get the short form of an insurer name
+_INSURER_SUFFIX = re.compile(r'\s+(?:and allied\s+)?(?:general\s+)?insurance\b.*$', re.IGNORECASE)
+_NUMBER = r'\d[\d,]*(?:\.\d+)?'
+_RUPEE_UNIT = r'crores?|cr|lakhs?|lacs?|l|k'
+_PERIOD_UNITS = {'month': 'months', 'day': 'days', 'year': 'years', 'yr': 'years'}
+
+ISSUE_KINDS = ('unknown_insurer', 'unretrieved_plan', 'unretrieved_insurer', 'unknown_plan',
+               'unsupported_number')
+
+
+def _rupees(number: str, unit: Optional[str]) -> float:
+    """'7.5', 'L' -> 750000; '2,50,000', None -> 250000"""
+    unit = (unit or '').lower()
+    if unit.endswith('s') and unit[:-1] in RUPEE_UNITS:
+        unit = unit[:-1]
+    return float(round(float(number.replace(',', '')) * RUPEE_UNITS.get(unit, 1.0)))
+
+
+def _trie_pattern(names: Iterable[str]) -> str:
+    """
+    Regex alternation shaped like a trie over the given (lower-case) names
+
+    Shared prefixes are factored out and longer continuations are tried
+    first, so the regex engine walks the trie once per position and
+    always takes the longest name.
+    """
+    trie: Dict[str, Any] = {}
+    for name in names:
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def emit(node: Dict[str, Any]) -> str:
+        ends = '' in node
+        branches = [(r'\s+' if char == ' ' else re.escape(char)) + emit(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if ends:
+            return '(?:' + body + ')?'
+        return body
+
+    return emit(trie)
+
+
+class RejectedAnswer(Exception):
+    """An answer that failed validation with VALIDATION_ACTION=block"""
+
+    def __init__(self, report: Dict[str, Any]):
+        super().__init__(f"Answer failed validation ({len(report['issues'])} issue(s))")
+        self.report = report
+
+
+class AnswerValidator:
+    """Compiled name/number matcher for one catalogue version"""
+
+    def __init__(self, catalogue: Catalogue, other_insurers: Sequence[str] = OTHER_INSURERS):
+        """
+        Compile the matcher
+
+        Args:
+            catalogue: Compiled plan catalogue (rag.catalogue)
+            other_insurers: Names of insurers outside the catalogue
+        """
+        self.catalogue = catalogue
+
+        # Normalised name -> ('plan', plan_id) / ('insurer', insurer_id) / ('other', name)
+        self.names: Dict[str, Tuple[str, str]] = {}
+        for insurer in catalogue.insurers:
+            for alias in _insurer_aliases(insurer.name):
+                self.names.setdefault(normalize_text(alias), ('insurer', insurer.insurer_id))
+        for plan in catalogue.plans:
+            for alias in _plan_aliases(plan.name):
+                self.names[normalize_text(alias)] = ('plan', plan.plan_id)
+        for name in other_insurers:
+            key = normalize_text(name)
+            # Never let a catalogue name be reported as an outsider
+            if key not in self.names:
+                self.names[key] = ('other', name)
+
+        self.pattern = re.compile(
+            r'(?P<heading>^\#{2,3}[ \t]+[^\n]*)'
+            # Not after a hyphen either: "self-reliance" is not the insurer
+            r'|(?<![\w-])(?P<name>' + _trie_pattern(self.names) + r')(?!\w)'
+            r'|(?:₹|\brs\.?|\binr)\s*(?P<r_num>' + _NUMBER + r')\s*(?P<r_unit>' + _RUPEE_UNIT + r')?\b'
+            r'|\b(?P<u_num>' + _NUMBER + r')\s*(?P<u_unit>crores?|cr|lakhs?|lacs?)\b'
+            r'|\b(?P<p_num>\d+(?:\.\d+)?)\s*%'
+            r'|\b(?P<t_num>\d+)\s*(?P<t_unit>months?|days?|years?|yrs?)\b',
+            re.IGNORECASE | re.MULTILINE
+        )
+
+        # Numbers every answer may quote: the premium range from the prompts
+        self.always_allowed = self.numbers(PREMIUM_RANGE)
+        self.plan_numbers: Dict[str, Dict[str, Set[float]]] = {
+            plan.plan_id: _merge(self.numbers_in_record(plan.raw),
+                                 self.numbers_in_record({k: v for k, v in plan.insurer.raw.items() if k != 'plans'}),
+                                 # Derived values the renderer prints (e.g. ped_waiting_min_months)
+                                 self.numbers_in_record(plan.features))
+            for plan in catalogue.plans
+        }
+
+    def numbers(self, text: str) -> Dict[str, Set[float]]:
+        """Numbers by kind ('rupees', 'percent', 'months', 'days', 'years') found in a text"""
+        found: Dict[str, Set[float]] = {'rupees': set(), 'percent': set(), 'months': set(), 'days': set(), 'years': set()}
+        for match in self.pattern.finditer(text):
+            number = self._number(match)
+            if number is not None:
+                found[number[0]].add(number[1])
+        return found
+
+    def numbers_in_record(self, record: Any, key: str = '') -> Dict[str, Set[float]]:
+        """numbers() over every string in a JSON record, plus typed numeric fields by key name"""
+        if isinstance(record, dict):
+            return _merge(*(self.numbers_in_record(value, name) for name, value in record.items()))
+        if isinstance(record, list):
+            return _merge(*(self.numbers_in_record(value, key) for value in record))
+        if isinstance(record, str):
+            return self.numbers(record)
+
+        found = self.numbers('')
+        if isinstance(record, (int, float)) and not isinstance(record, bool):
+            if key.endswith('_months'):
+                found['months'].add(float(record))
+            elif key.endswith('_days'):
+                found['days'].add(float(record))
+            elif 'sum_insured' in key:
+                found['rupees'].add(float(record))
+        return found
+
+    def check(self, text: str, plan_ids: Sequence[str],
+              user_profile: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Validate an answer against the plans it was generated from
+
+        Args:
+            text: Generated Markdown answer
+            plan_ids: Retrieved plans the answer may talk about
+            user_profile: The request's profile (numbers the user gave are allowed)
+
+        Returns:
+            {'ok', 'issues': [{'kind', 'text', 'detail'}], 'plans_mentioned',
+             'numbers_checked', 'seconds'}
+        """
+        start = time.perf_counter()
+        retrieved = [plan_id for plan_id in plan_ids if plan_id in self.catalogue]
+        retrieved_insurers = {self.catalogue.plan(plan_id).insurer.insurer_id for plan_id in retrieved}
+
+        # Allowed anywhere: the fixed premium range and whatever the user typed
+        base = _merge(self.always_allowed, *(_bare_numbers(value) for value in (user_profile or {}).values()))
+        shared = _merge(base, *(self.plan_numbers[plan_id] for plan_id in retrieved))
+        section: Optional[Dict[str, Set[float]]] = None
+
+        issues: List[Dict[str, str]] = []
+        seen: Set[Tuple[str, str]] = set()
+        mentioned: List[str] = []
+        checked = 0
+
+        def issue(kind: str, found: str, detail: str) -> None:
+            if (kind, found.lower()) not in seen:
+                seen.add((kind, found.lower()))
+                issues.append({'kind': kind, 'text': found, 'detail': detail})
+
+        for match in self.pattern.finditer(text):
+            if match.group('heading') is not None:
+                heading = match.group('heading').lstrip('#').strip().strip('*').strip()
+                plan_id, section = self._heading(heading, retrieved, base, issue)
+                if plan_id and plan_id not in mentioned:
+                    mentioned.append(plan_id)
+                continue
+
+            name = match.group('name')
+            if name is not None:
+                kind, ref = self.names[normalize_text(name)]
+                if kind == 'other':
+                    issue('unknown_insurer', name, f"'{name}' is not an insurer in the catalogue")
+                elif kind == 'plan':
+                    if ref not in retrieved:
+                        issue('unretrieved_plan', name, f"'{name}' was not among the retrieved plans")
+                    elif ref not in mentioned:
+                        mentioned.append(ref)
+                elif ref not in retrieved_insurers:
+                    issue('unretrieved_insurer', name, f"'{name}' has no plan among the retrieved plans")
+                continue
+
+            number = self._number(match)
+            if number is None:
+                continue
+            checked += 1
+            # Table rows list several plans side by side
+            in_table = text[text.rfind('\n', 0, match.start()) + 1:match.start()].lstrip().startswith('|')
+            allowed = shared if section is None or in_table else section
+            if not _allowed(number, allowed):
+                issue('unsupported_number', match.group(0),
+                      f"{match.group(0).strip()} does not appear in the source data for this "
+                      f"{'plan' if allowed is section else 'answer'}")
+
+        return {
+            'ok': not issues,
+            'issues': issues,
+            'plans_mentioned': mentioned,
+            'numbers_checked': checked,
+            'seconds': round(time.perf_counter() - start, 6)
+        }
+
+    def _heading(self, heading: str, retrieved: Sequence[str], base: Dict[str, Set[float]],
+                 issue) -> Tuple[Optional[str], Optional[Dict[str, Set[float]]]]:
+        """(plan_id, numbers allowed in its section) for a heading; (None, None) outside plan sections"""
+        ref = self.names.get(normalize_text(heading))
+        if ref is None:
+            # e.g. "1. Star Comprehensive Insurance Policy (Star Health)"
+            for match in self.pattern.finditer(heading):
+                if match.group('name') and self.names[normalize_text(match.group('name'))][0] == 'plan':
+                    ref = self.names[normalize_text(match.group('name'))]
+                    break
+        if ref is not None and ref[0] == 'plan':
+            if ref[1] not in retrieved:
+                issue('unretrieved_plan', heading, f"'{heading}' was not among the retrieved plans")
+                return None, None
+            return ref[1], _merge(self.plan_numbers[ref[1]], base)
+        if ref is None and not GENERIC_HEADING.search(heading) and re.search(r'[a-z]', heading, re.IGNORECASE):
+            issue('unknown_plan', heading, f"'{heading}' is not a plan in the catalogue")
+        return None, None
+
+    def _number(self, match: "re.Match") -> Optional[Tuple[str, float]]:
+        """(kind, normalised value) for a number match, None for other matches"""
+        if match.group('r_num') is not None:
+            return 'rupees', _rupees(match.group('r_num'), match.group('r_unit'))
+        if match.group('u_num') is not None:
+            return 'rupees', _rupees(match.group('u_num'), match.group('u_unit'))
+        if match.group('p_num') is not None:
+            return 'percent', float(match.group('p_num'))
+        if match.group('t_num') is not None:
+            unit = match.group('t_unit').lower().rstrip('s')
+            return _PERIOD_UNITS[unit], float(match.group('t_num'))
+        return None
+
+
+def _allowed(number: Tuple[str, float], allowed: Dict[str, Set[float]]) -> bool:
+    kind, value = number
+    if value in allowed[kind] or value in allowed['any']:
+        return True
+    if kind == 'years':
+        return value * 12 in allowed['months']
+    if kind == 'months':
+        return value / 12 in allowed['years']
+    return False
+
+
+def _merge(*parts: Dict[str, Set[float]]) -> Dict[str, Set[float]]:
+    merged: Dict[str, Set[float]] = {'rupees': set(), 'percent': set(), 'months': set(), 'days': set(),
+                                     'years': set(), 'any': set()}
+    for part in parts:
+        for kind, values in part.items():
+            merged[kind] |= values
+    return merged
+
+
+def _bare_numbers(text: Any) -> Dict[str, Set[float]]:
+    """Any number the user typed, allowed in every kind ("15000-20000", "36 months", "2 lakh")"""
+    values = set()
+    for number, unit in re.findall(r'(' + _NUMBER + r')\s*(' + _RUPEE_UNIT + r')?\b', str(text or ''), re.IGNORECASE):
+        values.add(float(number.replace(',', '')))
+        if unit:
+            values.add(_rupees(number, unit))
+    return {'any': values}
+
+
+def _insurer_aliases(name: str) -> List[str]:
+    """Full name plus short forms with at least two words ("Star Health", "HDFC ERGO")"""
+    aliases = [name]
+    short = _INSURER_SUFFIX.sub('', name).strip()
+    if short != name and len(short.split()) >= 2:
+        aliases.append(short)
+        if short.lower().endswith(' health') and len(short.split()) >= 3:
+            aliases.append(short[:-len(' health')])
+    return aliases
+
+
+def _plan_aliases(name: str) -> List[str]:
+    """Full plan name, and the name without a trailing parenthetical"""
+    aliases = [name]
+    bare = re.sub(r'\s*\([^)]*\)\s*$', '', name).strip()
+    if bare != name and len(bare.split()) >= 2:
+        aliases.append(bare)
+    return aliases
@@ -1,4 +1,5 @@
 import { NextRequest, NextResponse } from "next/server";
+import { idempotencyHeader } from "@/lib/idempotency";
 
 const FASTAPI_URL = process.env.FASTAPI_URL || "http://localhost:8000";
 
@@ -12,6 +13,8 @@ export async function POST(request: NextRequest) {
             method: "POST",
             headers: {
                 "Content-Type": "application/json",
+                // Lets the backend attach a retry to the run already under way
+                ...idempotencyHeader(request),
             },
             body: JSON.stringify({
                 age,
@@ -20,6 +23,8 @@ export async function POST(request: NextRequest) {
                 needs,
                 preferences,
             }),
+            // Stop the backend run if the browser goes away
+            signal: request.signal,
         });
 
         if (!response.ok) {
@@ -0,0 +1,59 @@
+import { NextRequest } from "next/server";
+import { idempotencyHeader } from "@/lib/idempotency";
+
+const FASTAPI_URL = process.env.FASTAPI_URL || "http://localhost:8000";
+
+// Never cache or statically render the stream
+export const dynamic = "force-dynamic";
+
+export async function POST(request: NextRequest) {
+    try {
+        const body = await request.json();
+        const { age, ped, budget, needs, preferences } = body;
+
+        // Call FastAPI streaming endpoint (Server-Sent Events)
+        const response = await fetch(`${FASTAPI_URL}/recommend/stream`, {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+                Accept: "text/event-stream",
+                // Lets the backend attach a retry to the run already under way
+                ...idempotencyHeader(request),
+            },
+            body: JSON.stringify({
+                age,
+                ped,
+                budget,
+                needs,
+                preferences,
+            }),
+            // Stop the backend run if the browser goes away
+            signal: request.signal,
+        });
+
+        if (!response.ok || !response.body) {
+            return Response.json(
+                { success: false, error: `Backend API error: ${response.statusText}` },
+                { status: response.status === 503 ? 503 : 502 }
+            );
+        }
+
+        // Pass the event stream through as-is, without buffering
+        return new Response(response.body, {
+            headers: {
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache, no-transform",
+                Connection: "keep-alive",
+                "X-Accel-Buffering": "no",
+            },
+        });
+    } catch (error) {
+        console.error("Stream API Error:", error);
+
+        return Response.json(
+            { success: false, error: error instanceof Error ? error.message : "Unknown error" },
+            // A body that is not JSON is the caller's fault, not the backend's
+            { status: error instanceof SyntaxError ? 400 : 502 }
+        );
+    }
+}
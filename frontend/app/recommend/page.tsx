@@ -21,15 +21,92 @@ export default function RecommendPage() {
         preferences: "Wellness rewards",
     });
 
+    // Reads the SSE stream and renders the answer as tokens arrive.
+    // Returns false if the streaming endpoint is unavailable.
+    const streamRecommendations = async (idempotencyKey: string): Promise<boolean> => {
+        const response = await fetch("/api/recommend/stream", {
+            method: "POST",
+            headers: { "Content-Type": "application/json", "Idempotency-Key": idempotencyKey },
+            body: JSON.stringify(formData),
+        });
+
+        if (!response.ok || !response.body) {
+            return false;
+        }
+
+        const stages: Record<string, string> = { profile: "", recommendations: "", comparison: "" };
+        const render = () =>
+            setResult(
+                [
+                    stages.profile && `### 👤 Your Profile\n${stages.profile}`,
+                    stages.recommendations,
+                    stages.comparison,
+                ]
+                    .filter(Boolean)
+                    .join("\n\n")
+            );
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                const event = raw.match(/^event: (.*)$/m)?.[1];
+                const data = raw.match(/^data: (.*)$/m)?.[1];
+                if (!event || !data) continue;
+
+                const payload = JSON.parse(data);
+                if (event === "token") {
+                    stages[payload.stage] += payload.text;
+                    render();
+                } else if (event === "done" && (payload.replaced || payload.precomputed)) {
+                    // The streamed answer failed validation and was replaced,
+                    // or a precomputed answer arrived whole
+                    setResult(payload.recommendations);
+                } else if (event === "error") {
+                    throw new Error(payload.detail);
+                }
+            }
+        }
+
+        return true;
+    };
+
     const handleSubmit = async (e: React.FormEvent) => {
         e.preventDefault();
         setLoading(true);
         setResult(null);
 
+        // Retries with the same key attach to the backend run already under way
+        const idempotencyKey = crypto.randomUUID();
+
         try {
+            let streamed;
+            try {
+                streamed = await streamRecommendations(idempotencyKey);
+            } catch (error) {
+                // Dropped connection (not an error event): reconnect once, replaying the run
+                if (!(error instanceof TypeError)) throw error;
+                streamed = await streamRecommendations(idempotencyKey);
+            }
+            if (streamed) {
+                return;
+            }
+
+            // Fallback: wait for the full JSON response
             const response = await fetch("/api/recommend", {
                 method: "POST",
-                headers: { "Content-Type": "application/json" },
+                headers: { "Content-Type": "application/json", "Idempotency-Key": idempotencyKey },
                 body: JSON.stringify(formData),
             });
 
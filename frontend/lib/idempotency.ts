@@ -0,0 +1,7 @@
+import type { NextRequest } from "next/server";
+
+// Forward the browser's Idempotency-Key so the backend can attach a retry to the run already under way
+export function idempotencyHeader(request: NextRequest): Record<string, string> {
+    const key = request.headers.get("Idempotency-Key");
+    return key ? { "Idempotency-Key": key } : {};
+}